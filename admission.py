@@ -0,0 +1,193 @@
+# File: admission.py
+
+import asyncio
+import math
+import time
+from collections import deque
+
+# Импортируем наши собственные модули
+import metrics
+from serialization import dumps
+from settings import settings
+
+# =============================================================================
+# ДОПУСК ЗАПРОСОВ В ПРОКСИ И СБРОС ЛИШНЕЙ НАГРУЗКИ
+# Когда Ozon отвечает медленно, запросы к /proxy/* копятся в воркере, пока
+# не кончатся память или файловые дескрипторы. Поэтому одновременно
+# обрабатывается не больше limit запросов прокси, остальные ждут в очереди
+# длиной admission_queue_size.
+#
+# limit подстраивается по времени ответа (градиент, как в Netflix
+# concurrency-limits): long_rtt - медленное среднее времени ответа,
+# short_rtt - быстрое. Пока short_rtt не больше long_rtt * tolerance, лимит
+# растет на sqrt(limit); когда ответы замедляются, лимит сжимается
+# пропорционально long_rtt / short_rtt. Ответы 502/504 (Ozon недоступен)
+# сжимают лимит сразу.
+#
+# Запрос сразу получает 503 с Retry-After, если очередь полна или ожидание
+# в ней (оценка по long_rtt и limit) дольше бюджета вызывающего:
+# заголовок X-Request-Timeout в секундах, иначе admission_default_budget_seconds.
+# Остальные маршруты (администрирование, вход, справочники) не
+# ограничиваются: сервис остается управляемым при перегрузке прокси.
+# Лимит и очередь свои у каждого воркера.
+# =============================================================================
+
+PREFIX = "/proxy/"
+BUDGET_HEADER = b"x-request-timeout"
+
+_SHORT_WINDOW = 10       # ответов в быстром среднем
+_LONG_WINDOW = 500       # ответов в медленном среднем
+_SMOOTHING = 0.2         # доля нового значения при пересчете лимита
+_DROP_FACTOR = 0.9       # сжатие лимита при 502/504
+
+
+class Shed(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdaptiveLimiter:
+    def __init__(self):
+        self.limit = float(settings.admission_initial_limit)
+        self.in_flight = 0
+        self._waiters: deque = deque()
+        self._short_rtt = 0.0
+        self._long_rtt = 0.0
+        metrics.admission_limit.set(self.limit)
+
+    def estimated_wait(self, position: int) -> float:
+        """Оценка ожидания в очереди на месте position: столько оборотов слотов, сколько ждет впереди."""
+        if not self._long_rtt:
+            return 0.0
+        return math.ceil(position / max(int(self.limit), 1)) * self._long_rtt
+
+    async def acquire(self, budget: float) -> None:
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            metrics.admission_in_flight.set(self.in_flight)
+            return
+        position = len(self._waiters) + 1
+        wait = self.estimated_wait(position)
+        if position > settings.admission_queue_size:
+            raise Shed("queue_full", max(wait, 1.0))
+        if wait > budget:
+            raise Shed("budget", wait)
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        metrics.admission_queued.set(len(self._waiters))
+        try:
+            await asyncio.wait_for(future, budget)
+        except asyncio.TimeoutError:
+            raise Shed("timeout", max(self.estimated_wait(len(self._waiters)), 1.0))
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Слот уже выдан, но запрос отменен - отдаем слот следующему
+                self.release()
+            raise
+        finally:
+            if future in self._waiters:
+                self._waiters.remove(future)
+                metrics.admission_queued.set(len(self._waiters))
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        """Выдает освободившиеся слоты ожидающим по порядку очереди."""
+        while self._waiters and self.in_flight < int(self.limit):
+            future = self._waiters.popleft()
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+        metrics.admission_in_flight.set(self.in_flight)
+        metrics.admission_queued.set(len(self._waiters))
+
+    def observe(self, rtt: float, overloaded: bool) -> None:
+        """Пересчитывает лимит по времени ответа очередного запроса прокси."""
+        if overloaded:
+            self._set_limit(self.limit * _DROP_FACTOR)
+            return
+        if not self._long_rtt:
+            self._short_rtt = self._long_rtt = rtt
+        self._short_rtt += (rtt - self._short_rtt) / _SHORT_WINDOW
+        self._long_rtt += (rtt - self._long_rtt) / _LONG_WINDOW
+        if self._long_rtt / self._short_rtt > 2:
+            # Нагрузка спала: медленное среднее догоняет быстрое, чтобы лимит восстановился
+            self._long_rtt *= 0.95
+        # Лимит растет, только пока он используется: иначе он уйдет в максимум без нагрузки
+        if self.in_flight * 2 < self.limit and self._long_rtt >= self._short_rtt:
+            return
+        gradient = max(0.5, min(1.0, settings.admission_tolerance * self._long_rtt / self._short_rtt))
+        target = self.limit * gradient + math.sqrt(self.limit)
+        self._set_limit(self.limit * (1 - _SMOOTHING) + target * _SMOOTHING)
+
+    def _set_limit(self, value: float) -> None:
+        self.limit = min(max(value, settings.admission_min_limit), settings.admission_max_limit)
+        metrics.admission_limit.set(self.limit)
+        self._wake()
+
+
+limiter = AdaptiveLimiter()
+
+
+def _budget(scope) -> float:
+    for key, value in scope.get("headers", ()):
+        if key == BUDGET_HEADER:
+            try:
+                budget = float(value)
+            except ValueError:
+                break
+            if budget > 0:
+                return budget
+            break
+    return settings.admission_default_budget_seconds
+
+
+class AdmissionMiddleware:
+    """ASGI-middleware: адаптивный лимит одновременных запросов к /proxy/* (см. описание модуля)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.admission_enabled or not scope["path"].startswith(PREFIX):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await limiter.acquire(_budget(scope))
+        except Shed as shed:
+            metrics.admission_rejected_total.inc((shed.reason,))
+            await _reject(send, shed.retry_after)
+            return
+
+        started = time.perf_counter()
+
+        async def send_with_sample(message):
+            if message["type"] == "http.response.start":
+                # Время до начала ответа: передача большого тела клиенту не про Ozon
+                limiter.observe(time.perf_counter() - started, message["status"] in (502, 504))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_sample)
+        finally:
+            limiter.release()
+
+
+async def _reject(send, retry_after: float) -> None:
+    body = dumps({"detail": "Прокси перегружен, повторите запрос позже"})
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -4,7 +4,10 @@ from sqlalchemy import engine_from_config
 from sqlalchemy import pool
 
 from alembic import context
+from sqlalchemy.engine import make_url
+
 from models import Base
+from settings import settings
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -15,13 +18,31 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# Адрес базы берем из настроек приложения, а не из alembic.ini, чтобы миграции
+# применялись к той же базе, с которой работает приложение. Alembic работает
+# синхронно, поэтому асинхронный драйвер (aiosqlite) меняем на синхронный.
+_database_url = make_url(settings.database_url)
+config.set_main_option(
+    "sqlalchemy.url",
+    _database_url.set(drivername=_database_url.get_backend_name()).render_as_string(hide_password=False),
+)
+
 # add your model's MetaData object here
 # for 'autogenerate' support
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
-# from database import Base # Импортируем нашу Base из database.py
 target_metadata = Base.metadata
 
+
+def include_name(name, type_, parent_names) -> bool:
+    """
+    Полнотекстовый индекс каталога (catalog_products_fts и его служебные
+    таблицы) создается миграцией через SQL, моделей у него нет: autogenerate
+    не должен предлагать его удалить.
+    """
+    return not (type_ == "table" and name.startswith("catalog_products_fts"))
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -44,6 +65,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_name=include_name,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -67,7 +89,7 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata, include_name=include_name
         )
 
         with context.begin_transaction():
@@ -0,0 +1,33 @@
+"""Store report job files in the content-addressed artifact store
+
+Revision ID: 7d2e4b9a1c56
+Revises: c3a91f5d7b20
+Create Date: 2026-10-19 16:21:37.905114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2e4b9a1c56'
+down_revision: Union[str, Sequence[str], None] = 'c3a91f5d7b20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Файлы, скачанные до этой ревизии, остаются в report_dir и отдаются оттуда
+    with op.batch_alter_table('report_jobs') as batch_op:
+        batch_op.add_column(sa.Column('file_sha256', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('file_encoding', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('report_jobs') as batch_op:
+        batch_op.drop_column('file_encoding')
+        batch_op.drop_column('file_sha256')
@@ -0,0 +1,84 @@
+"""Add local product catalog mirror with FTS5 name index
+
+Revision ID: a1f5c7e2b846
+Revises: a84f0c3e5d19
+Create Date: 2026-10-19 19:40:08.551902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1f5c7e2b846'
+down_revision: Union[str, Sequence[str], None] = 'a84f0c3e5d19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('catalog_products',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('client_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.BigInteger(), nullable=False),
+    sa.Column('offer_id', sa.String(), nullable=False),
+    sa.Column('sku', sa.BigInteger(), nullable=True),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('archived', sa.Boolean(), nullable=False),
+    sa.Column('ozon_updated_at', sa.DateTime(), nullable=True),
+    sa.Column('generation', sa.Integer(), nullable=False),
+    sa.Column('synced_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_catalog_products_client_id_product_id', 'catalog_products', ['client_id', 'product_id'], unique=True)
+    op.create_index('ix_catalog_products_offer_id', 'catalog_products', ['offer_id'], unique=False)
+    op.create_index('ix_catalog_products_sku', 'catalog_products', ['sku'], unique=False)
+    # Полнотекстовый индекс по названиям: хранит только токены, строки - в catalog_products.
+    # Название индексируется с заменой "ё" на "е" (unicode61 их не приравнивает)
+    op.execute(
+        "CREATE VIRTUAL TABLE catalog_products_fts USING fts5("
+        "name, content='catalog_products', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    op.execute(
+        "CREATE TRIGGER catalog_products_fts_insert AFTER INSERT ON catalog_products BEGIN "
+        "INSERT INTO catalog_products_fts(rowid, name) VALUES (new.id, replace(replace(new.name, 'ё', 'е'), 'Ё', 'Е')); END"
+    )
+    op.execute(
+        "CREATE TRIGGER catalog_products_fts_delete AFTER DELETE ON catalog_products BEGIN "
+        "INSERT INTO catalog_products_fts(catalog_products_fts, rowid, name) VALUES ('delete', old.id, replace(replace(old.name, 'ё', 'е'), 'Ё', 'Е')); END"
+    )
+    op.execute(
+        "CREATE TRIGGER catalog_products_fts_update AFTER UPDATE OF name ON catalog_products BEGIN "
+        "INSERT INTO catalog_products_fts(catalog_products_fts, rowid, name) VALUES ('delete', old.id, replace(replace(old.name, 'ё', 'е'), 'Ё', 'Е')); "
+        "INSERT INTO catalog_products_fts(rowid, name) VALUES (new.id, replace(replace(new.name, 'ё', 'е'), 'Ё', 'Е')); END"
+    )
+    op.create_table('catalog_sync_state',
+    sa.Column('client_id', sa.Integer(), nullable=False),
+    sa.Column('generation', sa.Integer(), nullable=False),
+    sa.Column('cursor', sa.String(), nullable=True),
+    sa.Column('rows', sa.Integer(), nullable=False),
+    sa.Column('next_run_at', sa.DateTime(), nullable=False),
+    sa.Column('locked_until', sa.DateTime(), nullable=True),
+    sa.Column('last_synced_at', sa.DateTime(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ),
+    sa.PrimaryKeyConstraint('client_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('catalog_sync_state')
+    op.execute("DROP TRIGGER catalog_products_fts_update")
+    op.execute("DROP TRIGGER catalog_products_fts_delete")
+    op.execute("DROP TRIGGER catalog_products_fts_insert")
+    op.execute("DROP TABLE catalog_products_fts")
+    op.drop_index('ix_catalog_products_sku', table_name='catalog_products')
+    op.drop_index('ix_catalog_products_offer_id', table_name='catalog_products')
+    op.drop_index('ix_catalog_products_client_id_product_id', table_name='catalog_products')
+    op.drop_table('catalog_products')
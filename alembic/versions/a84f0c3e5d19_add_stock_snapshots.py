@@ -0,0 +1,59 @@
+"""Add local stock snapshot tables
+
+Revision ID: a84f0c3e5d19
+Revises: 7d2e4b9a1c56
+Create Date: 2026-10-19 18:02:54.117380
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a84f0c3e5d19'
+down_revision: Union[str, Sequence[str], None] = '7d2e4b9a1c56'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('stock_snapshots',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('client_id', sa.Integer(), nullable=False),
+    sa.Column('sku', sa.BigInteger(), nullable=False),
+    sa.Column('mp_warehouse_id', sa.String(), nullable=False),
+    sa.Column('offer_id', sa.String(), nullable=True),
+    sa.Column('warehouse_name', sa.String(), nullable=True),
+    sa.Column('present', sa.Integer(), nullable=False),
+    sa.Column('reserved', sa.Integer(), nullable=False),
+    sa.Column('generation', sa.Integer(), nullable=False),
+    sa.Column('synced_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stock_snapshots_client_id_sku_mp_warehouse_id', 'stock_snapshots', ['client_id', 'sku', 'mp_warehouse_id'], unique=True)
+    # Свод по нашим складам читает только этот индекс
+    op.create_index('ix_stock_snapshots_rollup', 'stock_snapshots', ['client_id', 'mp_warehouse_id', 'sku', 'present', 'reserved'], unique=False)
+    op.create_table('stock_sync_state',
+    sa.Column('client_id', sa.Integer(), nullable=False),
+    sa.Column('generation', sa.Integer(), nullable=False),
+    sa.Column('cursor', sa.String(), nullable=True),
+    sa.Column('rows', sa.Integer(), nullable=False),
+    sa.Column('next_run_at', sa.DateTime(), nullable=False),
+    sa.Column('locked_until', sa.DateTime(), nullable=True),
+    sa.Column('last_synced_at', sa.DateTime(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ),
+    sa.PrimaryKeyConstraint('client_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('stock_sync_state')
+    op.drop_index('ix_stock_snapshots_rollup', table_name='stock_snapshots')
+    op.drop_index('ix_stock_snapshots_client_id_sku_mp_warehouse_id', table_name='stock_snapshots')
+    op.drop_table('stock_snapshots')
@@ -0,0 +1,39 @@
+"""Never reuse revoked_tokens ids on SQLite
+
+Revision ID: e5a8c3f1d902
+Revises: b7d4e2f8a361
+Create Date: 2026-10-19 23:58:12.508317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a8c3f1d902'
+down_revision: Union[str, Sequence[str], None] = 'b7d4e2f8a361'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Воркеры дочитывают revoked_tokens по id (token_denylist.py). SQLite без
+    # AUTOINCREMENT выдает id удаленной последней строки повторно, поэтому
+    # таблица пересоздается с AUTOINCREMENT; у других баз id из
+    # последовательности и так не повторяются
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    with op.batch_alter_table('revoked_tokens', recreate='always',
+                              table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+        pass
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    with op.batch_alter_table('revoked_tokens', recreate='always') as batch_op:
+        pass
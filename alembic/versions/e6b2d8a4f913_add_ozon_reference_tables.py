@@ -0,0 +1,95 @@
+"""Add shared Ozon category tree and attribute reference tables
+
+Revision ID: e6b2d8a4f913
+Revises: a1f5c7e2b846
+Create Date: 2026-10-19 21:12:44.307115
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6b2d8a4f913'
+down_revision: Union[str, Sequence[str], None] = 'a1f5c7e2b846'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ozon_categories',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('parent_id', sa.Integer(), nullable=True),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('disabled', sa.Boolean(), nullable=False),
+    sa.Column('generation', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ozon_categories_parent_id'), 'ozon_categories', ['parent_id'], unique=False)
+    op.create_table('ozon_category_types',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('description_category_id', sa.Integer(), nullable=False),
+    sa.Column('type_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('disabled', sa.Boolean(), nullable=False),
+    sa.Column('generation', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ozon_category_types_category_id_type_id', 'ozon_category_types', ['description_category_id', 'type_id'], unique=True)
+    op.create_table('ozon_attributes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('description', sa.String(), nullable=True),
+    sa.Column('type', sa.String(), nullable=True),
+    sa.Column('is_collection', sa.Boolean(), nullable=False),
+    sa.Column('dictionary_id', sa.Integer(), nullable=False),
+    sa.Column('generation', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('ozon_type_attributes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('description_category_id', sa.Integer(), nullable=False),
+    sa.Column('type_id', sa.Integer(), nullable=False),
+    sa.Column('attribute_id', sa.Integer(), nullable=False),
+    sa.Column('is_required', sa.Boolean(), nullable=False),
+    sa.Column('is_aspect', sa.Boolean(), nullable=False),
+    sa.Column('category_dependent', sa.Boolean(), nullable=False),
+    sa.Column('group_id', sa.Integer(), nullable=True),
+    sa.Column('group_name', sa.String(), nullable=True),
+    sa.Column('max_value_count', sa.Integer(), nullable=True),
+    sa.Column('generation', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['attribute_id'], ['ozon_attributes.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ozon_type_attributes_attribute_id', 'ozon_type_attributes', ['attribute_id'], unique=False)
+    op.create_index('ix_ozon_type_attributes_category_id_type_id_attribute_id', 'ozon_type_attributes', ['description_category_id', 'type_id', 'attribute_id'], unique=True)
+    op.create_table('reference_sync_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('generation', sa.Integer(), nullable=False),
+    sa.Column('cursor', sa.String(), nullable=True),
+    sa.Column('client_id', sa.Integer(), nullable=True),
+    sa.Column('types', sa.Integer(), nullable=False),
+    sa.Column('attributes', sa.Integer(), nullable=False),
+    sa.Column('next_run_at', sa.DateTime(), nullable=False),
+    sa.Column('locked_until', sa.DateTime(), nullable=True),
+    sa.Column('last_synced_at', sa.DateTime(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('reference_sync_state')
+    op.drop_index('ix_ozon_type_attributes_category_id_type_id_attribute_id', table_name='ozon_type_attributes')
+    op.drop_index('ix_ozon_type_attributes_attribute_id', table_name='ozon_type_attributes')
+    op.drop_table('ozon_type_attributes')
+    op.drop_table('ozon_attributes')
+    op.drop_index('ix_ozon_category_types_category_id_type_id', table_name='ozon_category_types')
+    op.drop_table('ozon_category_types')
+    op.drop_index(op.f('ix_ozon_categories_parent_id'), table_name='ozon_categories')
+    op.drop_table('ozon_categories')
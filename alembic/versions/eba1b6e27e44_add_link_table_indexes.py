@@ -0,0 +1,61 @@
+"""Add indexes and uniqueness to client link tables
+
+Revision ID: eba1b6e27e44
+Revises: 5ebc8f0f36e1
+Create Date: 2026-10-19 10:12:41.318205
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'eba1b6e27e44'
+down_revision: Union[str, Sequence[str], None] = '5ebc8f0f36e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Уникальные индексы не создадутся, если в таблицах уже есть дубликаты.
+    # Оставляем самую раннюю запись для каждой пары.
+    op.execute(
+        "DELETE FROM client_permissions WHERE id NOT IN ("
+        "SELECT MIN(id) FROM client_permissions GROUP BY client_id, permission_id)"
+    )
+    op.execute(
+        "DELETE FROM client_warehouses WHERE id NOT IN ("
+        "SELECT MIN(id) FROM client_warehouses GROUP BY client_id, mp_warehouse_id)"
+    )
+
+    # check_client_permission и выборка прав клиента идут по client_id,
+    # проверка на дубликат при выдаче права - по паре (client_id, permission_id).
+    op.create_index(
+        'ix_client_permissions_client_id_permission_id',
+        'client_permissions',
+        ['client_id', 'permission_id'],
+        unique=True,
+    )
+    # Склады клиента выбираются по client_id, склад Ozon ищется по mp_warehouse_id.
+    op.create_index(
+        'ix_client_warehouses_client_id_mp_warehouse_id',
+        'client_warehouses',
+        ['client_id', 'mp_warehouse_id'],
+        unique=True,
+    )
+    op.create_index(
+        op.f('ix_client_warehouses_mp_warehouse_id'),
+        'client_warehouses',
+        ['mp_warehouse_id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_client_warehouses_mp_warehouse_id'), table_name='client_warehouses')
+    op.drop_index('ix_client_warehouses_client_id_mp_warehouse_id', table_name='client_warehouses')
+    op.drop_index('ix_client_permissions_client_id_permission_id', table_name='client_permissions')
@@ -0,0 +1,212 @@
+# File: artifacts.py
+
+import gzip
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from mimetypes import guess_type
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+import executors
+from settings import settings
+
+# =============================================================================
+# ХРАНИЛИЩЕ ФАЙЛОВ-АРТЕФАКТОВ (ОТЧЕТЫ OZON, ВЫГРУЗКИ)
+# Файл хранится один раз под именем sha256 своего содержимого:
+# settings.artifact_dir/ab/abcdef....gz. Одинаковые отчеты разных задач
+# ссылаются на один файл. Если gzip экономит хотя бы десятую часть (CSV),
+# файл хранится сжатым, иначе (XLSX, ZIP уже сжаты) - как есть.
+#
+# Отдача: файл с диска без чтения в память (FileResponse; сервер с
+# расширением http.response.pathsend отправляет его через sendfile),
+# с Range/If-Range и ETag = sha256 содержимого.
+# If-None-Match с тем же ETag - ответ 304 без тела. Сжатый файл клиенту
+# с Accept-Encoding: gzip уходит с Content-Encoding: gzip как лежит на диске
+# (Range - по сжатым байтам). Остальным он распаковывается на лету, тогда
+# Range по исходным байтам работает пропуском начала.
+# =============================================================================
+
+GZIP = "gzip"
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_CHUNK_SIZE = 256 * 1024
+# Сжимаем, только если gzip экономит хотя бы 10%
+_MIN_SAVING = 0.1
+
+
+def _path(sha256: str, encoding: Optional[str]) -> Path:
+    return Path(settings.artifact_dir) / sha256[:2] / (sha256 + (".gz" if encoding == GZIP else ""))
+
+
+def new_temp_file() -> Path:
+    """
+    Пустой временный файл внутри хранилища: store() переносит его на место
+    переименованием, без копирования между файловыми системами.
+    """
+    directory = Path(settings.artifact_dir) / "tmp"
+    directory.mkdir(parents=True, exist_ok=True)
+    handle, name = tempfile.mkstemp(dir=directory, suffix=".part")
+    os.close(handle)
+    return Path(name)
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        while chunk := source.read(_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def store(source: Path, sha256: Optional[str] = None) -> tuple[str, Optional[str]]:
+    """
+    Переносит файл source в хранилище и возвращает (sha256, кодировка):
+    кодировка "gzip" или None для файла без сжатия. Блокирующая функция -
+    вызывать через executors.run_in_thread. Файл source после вызова удален.
+    """
+    sha256 = sha256 or file_sha256(source)
+    for encoding in (GZIP, None):
+        if _path(sha256, encoding).is_file():
+            # Такое содержимое уже есть
+            source.unlink(missing_ok=True)
+            return sha256, encoding
+
+    target = _path(sha256, GZIP)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    compressed = new_temp_file()
+    # mtime=0 и пустое имя: одинаковое содержимое дает одинаковый .gz
+    with open(source, "rb") as raw, open(compressed, "wb") as packed_file:
+        with gzip.GzipFile(filename="", mode="wb", fileobj=packed_file, compresslevel=6, mtime=0) as packed:
+            shutil.copyfileobj(raw, packed, _CHUNK_SIZE)
+
+    if compressed.stat().st_size <= source.stat().st_size * (1 - _MIN_SAVING):
+        os.replace(compressed, target)
+        source.unlink(missing_ok=True)
+        return sha256, GZIP
+    compressed.unlink(missing_ok=True)
+    os.replace(source, _path(sha256, None))
+    return sha256, None
+
+
+def exists(sha256: str, encoding: Optional[str]) -> bool:
+    return bool(_SHA256_RE.match(sha256)) and _path(sha256, encoding).is_file()
+
+
+# --- Отдача файла ---
+
+def _content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def _accepts_gzip(request: Request) -> bool:
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = item.strip().partition(";")
+        if name.strip().lower() in (GZIP, "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Слабое сравнение (RFC 9110, 13.1.2): W/ не учитывается
+    return etag in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+
+
+def _single_range(request: Request, etag: str, size: int) -> Optional[tuple[int, int]]:
+    """Один диапазон из Range как (начало, конец не включая) или None - отдать весь файл."""
+    http_range = request.headers.get("range")
+    if http_range is None:
+        return None
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range.strip() != etag:
+        return None
+    match = _RANGE_RE.match(http_range.replace(" ", ""))
+    if match is None or not (match.group(1) or match.group(2)):
+        # Несколько диапазонов или чужие единицы: RFC разрешает отдать весь файл
+        return None
+    start, end = match.groups()
+    if start and end and int(end) < int(start):
+        return None
+    if not start:
+        return max(0, size - int(end)), size
+    return int(start), min(size, int(end) + 1) if end else size
+
+
+async def _read_gzip(path: Path, skip: int, length: int):
+    """Распаковывает файл по частям: пропускает skip байт и отдает length байт."""
+    handle = None
+    try:
+        handle = await executors.run_in_thread(gzip.open, path, "rb")
+        remaining_skip = skip
+        while remaining_skip:
+            skipped = await executors.run_in_thread(handle.read, min(_CHUNK_SIZE, remaining_skip))
+            if not skipped:
+                return
+            remaining_skip -= len(skipped)
+        remaining = length
+        while remaining:
+            chunk = await executors.run_in_thread(handle.read, min(_CHUNK_SIZE, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        if handle is not None:
+            await executors.run_in_thread(handle.close)
+
+
+def file_response(
+    request: Request, sha256: str, encoding: Optional[str], size: int, filename: str
+) -> Response:
+    """
+    Ответ с файлом из хранилища. size - размер исходного (несжатого) файла.
+    Учитывает If-None-Match, Range/If-Range и Accept-Encoding.
+    """
+    path = _path(sha256, encoding)
+    media_type = guess_type(filename)[0] or "application/octet-stream"
+    send_gzip = encoding == GZIP and _accepts_gzip(request)
+    # Сжатая и исходная версии - разные представления, у них разные ETag
+    etag = f'"{sha256}-gz"' if send_gzip else f'"{sha256}"'
+    headers = {"etag": etag, "vary": "Accept-Encoding", "cache-control": "private, max-age=0, must-revalidate"}
+
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    if encoding is None or send_gzip:
+        if send_gzip:
+            headers["content-encoding"] = GZIP
+        # Range, If-Range и HEAD обрабатывает сам FileResponse
+        return FileResponse(path, media_type=media_type, filename=filename, headers=headers)
+
+    # Клиент не принимает gzip: распаковываем на лету
+    headers["accept-ranges"] = "bytes"
+    headers["content-disposition"] = _content_disposition(filename)
+    byte_range = _single_range(request, etag, size)
+    if byte_range is not None and byte_range[0] >= size:
+        return Response(status_code=416, headers={"content-range": f"bytes */{size}"})
+    start, end = byte_range or (0, size)
+    headers["content-length"] = str(end - start)
+    status_code = 200
+    if byte_range is not None:
+        status_code = 206
+        headers["content-range"] = f"bytes {start}-{end - 1}/{size}"
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(
+        _read_gzip(path, start, end - start), status_code=status_code, headers=headers, media_type=media_type
+    )
@@ -0,0 +1,224 @@
+# File: benchmarks/proxy_load.py
+#
+# Нагрузочный замер /proxy/*: N одновременных клиентов гоняют запросы через
+# приложение, а вместо api-seller.ozon.ru отвечает локальная заглушка
+# с настраиваемой задержкой, долей ошибок и размером ответа.
+# Отчет: req/s, p50/p95/p99, SQL-запросов на запрос, RSS. Результат пишется
+# в JSON вместе с хешем коммита, чтобы сравнивать прогоны между коммитами.
+# Запуск из корня проекта:
+#     python -m benchmarks.proxy_load --concurrency 20 --requests 2000 --latency-ms 50
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = BASE_DIR / "benchmarks" / "results"
+OZON_PATH = "v1/bench/echo"
+
+# Настройки читаются при импорте приложения, поэтому окружение готовим до импорта.
+# База - всегда временная, чтобы замер не трогал рабочие данные.
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_tmp.name, 'bench.db')}"
+os.environ.setdefault("JWT_SECRET_KEY", "bench-secret")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+if "OZON_CRYPT_KEY" not in os.environ:
+    from cryptography.fernet import Fernet
+    os.environ["OZON_CRYPT_KEY"] = Fernet.generate_key().decode()
+
+import httpx
+from sqlalchemy import event
+
+# Импортируем наши собственные модули
+import database
+import models
+import security
+import upstream
+from main import app
+
+
+def make_ozon_stub(latency_ms: float, error_rate: float, payload_bytes: int, seed: int):
+    """ASGI-заглушка Ozon API: ждет latency_ms, с вероятностью error_rate отвечает 500."""
+    rng = random.Random(seed)
+    item = b'{"sku":1234567,"name":"bench","stock":10},'
+    items = item * max(1, payload_bytes // len(item))
+    ok_body = b'{"result":[' + items[:-1] + b"]}"
+    error_body = b'{"code":13,"message":"stub error"}'
+
+    async def stub(scope, receive, send):
+        # Тело запроса дочитываем, как настоящий сервер
+        more_body = True
+        while more_body:
+            message = await receive()
+            more_body = message.get("more_body", False)
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        failed = rng.random() < error_rate
+        body = error_body if failed else ok_body
+        await send({
+            "type": "http.response.start",
+            "status": 500 if failed else 200,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    return stub
+
+
+async def seed_database(clients: int) -> list[int]:
+    """Схема, суперпользователь для токена и клиенты с ключами Ozon и правом на OZON_PATH."""
+    async with database.engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+    async with database.SessionLocal() as session:
+        session.add(models.User(login="bench", password_hash="-", is_superuser=True))
+        permission = models.Permission(name=OZON_PATH, description="Метод для нагрузочного замера")
+        client_rows = []
+        for i in range(clients):
+            client = models.Client(inn=f"{i:010d}", user=models.User(login=f"bench-client-{i}", password_hash="-"))
+            client.ozon_auth = models.ClientOzonAuth(
+                encrypted_ozon_client_id=security.encrypt_data(str(100000 + i)),
+                encrypted_ozon_api_key=security.encrypt_data(f"api-key-{i}"),
+            )
+            session.add(models.ClientPermission(client=client, permission=permission, enabled=True))
+            client_rows.append(client)
+        await session.commit()
+        return [client.id for client in client_rows]
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def current_commit() -> str | None:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, check=True
+        )
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    client_ids = await seed_database(args.concurrency)
+
+    # Общий клиент upstream.py направляем в заглушку вместо api-seller.ozon.ru
+    stub = make_ozon_stub(args.latency_ms, args.error_rate, args.payload_bytes, args.seed)
+    upstream._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=stub), timeout=30.0)
+
+    statements = [0]
+
+    def count_statement(*_):
+        statements[0] += 1
+
+    event.listen(database.engine.sync_engine, "before_cursor_execute", count_statement)
+
+    token = security.create_access_token({"sub": "bench"})
+    app_client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://bench",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    body = {"filter": {"visibility": "ALL"}, "limit": 100}
+
+    latencies: list = []
+    statuses: dict = {}
+    remaining = [args.requests]
+
+    async def worker(client_id: int):
+        headers = {"X-Target-Client-ID": str(client_id)}
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            started = time.perf_counter()
+            response = await app_client.post(f"/proxy/{OZON_PATH}", json=body, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    # Прогрев: первые запросы платят за импорт httpx, кэш запросов SQLAlchemy и т.п.
+    for client_id in client_ids[:5]:
+        await app_client.post(f"/proxy/{OZON_PATH}", json=body, headers={"X-Target-Client-ID": str(client_id)})
+    statements[0] = 0
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(client_id) for client_id in client_ids))
+    elapsed = time.perf_counter() - started
+
+    await app_client.aclose()
+    await upstream.close_client()
+    await database.engine.dispose()
+
+    latencies.sort()
+    # ru_maxrss в Linux - килобайты, в macOS - байты
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    max_rss_mb = max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return {
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "mean": round(statistics.fmean(latencies) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3),
+        },
+        "db_statements_per_request": round(statements[0] / len(latencies), 2),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "max_rss_mb": round(max_rss_mb, 1),
+        "elapsed_seconds": round(elapsed, 3),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный замер /proxy/* с заглушкой Ozon")
+    parser.add_argument("--concurrency", type=int, default=20, help="одновременных клиентов")
+    parser.add_argument("--requests", type=int, default=2000, help="всего запросов")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="задержка ответа заглушки")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500 от заглушки (0..1)")
+    parser.add_argument("--payload-bytes", type=int, default=2048, help="размер ответа заглушки")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, default=None, help="куда записать JSON с результатом")
+    args = parser.parse_args()
+
+    print(
+        f"--- Нагрузка /proxy/*: {args.concurrency} клиентов, {args.requests} запросов, "
+        f"заглушка {args.latency_ms} мс / ошибки {args.error_rate:.0%} / {args.payload_bytes} байт ---"
+    )
+    results = asyncio.run(run(args))
+    _tmp.cleanup()
+
+    latency = results["latency_ms"]
+    print(f"\n   Пропускная способность: {results['requests_per_second']:9.1f} req/s")
+    print(f"   Задержка p50/p95/p99:   {latency['p50']:.1f} / {latency['p95']:.1f} / {latency['p99']:.1f} мс")
+    print(f"   SQL-запросов на запрос: {results['db_statements_per_request']:9.2f}")
+    print(f"   Пиковый RSS:            {results['max_rss_mb']:9.1f} МБ")
+    print(f"   Коды ответов:           {results['statuses']}")
+
+    commit = current_commit()
+    report = {
+        "benchmark": "proxy_load",
+        "commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "parameters": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    output = args.output or RESULTS_DIR / f"proxy_load-{commit or 'unknown'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n   Результат записан в {output}")
+
+    print("\n--- Замер завершен ---")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# File: benchmarks/reference_reads.py
+#
+# Микробенчмарк чтения справочников: прежний путь (ORM + Pydantic + JSONResponse)
+# против reference_cache (Core select + снимок в памяти).
+# Запуск из корня проекта: python -m benchmarks.reference_reads [число_строк]
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
+
+# Импортируем наши собственные модули
+import models
+import schemas
+import reference_cache
+
+REPEATS = 200
+
+
+async def orm_permissions(session) -> bytes:
+    """Прежний путь: ORM-объекты, валидация from_attributes, jsonable_encoder."""
+    result = await session.execute(select(models.Permission).offset(0).limit(100))
+    rows = TypeAdapter(List[schemas.PermissionRead]).validate_python(result.scalars().all(), from_attributes=True)
+    return JSONResponse(content=jsonable_encoder(rows)).body
+
+async def orm_client_permissions(session) -> bytes:
+    result = await session.execute(
+        select(models.ClientPermission)
+        .options(selectinload(models.ClientPermission.permission))
+        .filter(models.ClientPermission.client_id == 1)
+    )
+    rows = TypeAdapter(List[schemas.ClientPermission]).validate_python(result.scalars().all(), from_attributes=True)
+    return JSONResponse(content=jsonable_encoder(rows)).body
+
+async def cold_permissions(session) -> bytes:
+    """Core select без снимка: снимок сбрасывается перед каждым вызовом."""
+    reference_cache.invalidate_permissions()
+    return await reference_cache.permissions_json(session, skip=0, limit=100)
+
+async def warm_permissions(session) -> bytes:
+    return await reference_cache.permissions_json(session, skip=0, limit=100)
+
+async def cold_client_permissions(session) -> bytes:
+    reference_cache.invalidate_client_permissions(1)
+    return await reference_cache.client_permissions_json(session, client_id=1)
+
+async def warm_client_permissions(session) -> bytes:
+    return await reference_cache.client_permissions_json(session, client_id=1)
+
+
+async def measure(session_factory, fn) -> float:
+    """Среднее время одного вызова в микросекундах (новая сессия на вызов, как в get_db)."""
+    async with session_factory() as session:
+        await fn(session)  # прогрев
+    started = time.perf_counter()
+    for _ in range(REPEATS):
+        async with session_factory() as session:
+            await fn(session)
+    return (time.perf_counter() - started) / REPEATS * 1e6
+
+
+async def main(rows: int):
+    print(f"--- Чтение справочников: {rows} строк, {REPEATS} повторов ---")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+        async with engine.begin() as conn:
+            await conn.run_sync(models.Base.metadata.create_all)
+        async with session_factory() as session:
+            user = models.User(login="bench", password_hash="-")
+            client = models.Client(inn="0000000000", user=user)
+            session.add(client)
+            for i in range(rows):
+                permission = models.Permission(name=f"v1/method/{i}", description=f"Метод номер {i}")
+                session.add(permission)
+                session.add(models.ClientPermission(client=client, permission=permission, enabled=True))
+            await session.commit()
+
+        cases = [
+            ("GET /permissions/", orm_permissions, cold_permissions, warm_permissions),
+            ("GET /clients/{id}/permissions/", orm_client_permissions, cold_client_permissions, warm_client_permissions),
+        ]
+        for name, orm_fn, cold_fn, warm_fn in cases:
+            orm_us = await measure(session_factory, orm_fn)
+            cold_us = await measure(session_factory, cold_fn)
+            warm_us = await measure(session_factory, warm_fn)
+            print(f"\n{name}")
+            print(f"   ORM + Pydantic:      {orm_us:9.1f} мкс")
+            print(f"   Core, без снимка:    {cold_us:9.1f} мкс  (x{orm_us / cold_us:.1f})")
+            print(f"   Core, из снимка:     {warm_us:9.1f} мкс  (x{orm_us / warm_us:.1f})")
+
+        await engine.dispose()
+
+    print("\n--- Замер завершен ---")
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100))
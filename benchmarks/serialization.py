@@ -0,0 +1,103 @@
+# File: benchmarks/serialization.py
+#
+# Замер сериализации ответов на типичных данных:
+# - большой List[schemas.Client] со связями и кириллицей;
+# - крупный JSON от Ozon (как при проксировании и сборе данных по клиентам).
+# Запуск из корня проекта: python -m benchmarks.serialization [число_клиентов]
+
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+# Импортируем наши собственные модули
+import schemas
+import serialization
+
+REPEATS = 20
+
+
+def make_clients(count: int) -> list:
+    """Объекты с атрибутами, как у ORM-моделей после selectinload."""
+    permissions = [
+        SimpleNamespace(id=i, name=f"v2/posting/fbo/list/{i}", description="Получение списка отправлений FBO",
+                        is_required=False, is_active=True)
+        for i in range(20)
+    ]
+    our_warehouse = SimpleNamespace(id=1, name="Склад Подольск", address="Московская обл., г. Подольск",
+                                    sap_name="ПОДОЛЬСК-1", sap_plant_code="P001")
+    clients = []
+    for i in range(count):
+        clients.append(SimpleNamespace(
+            id=i, inn=f"77{i:08d}", phone="+7 (495) 000-00-00", contract_status="active",
+            user=SimpleNamespace(id=i, login=f"client_{i}", email=f"client_{i}@example.ru",
+                                 is_active=True, is_superuser=False),
+            ozon_auth=SimpleNamespace(id=i, client_id=i, updated_at=datetime(2025, 9, 29, 20, 48)),
+            permissions=[SimpleNamespace(id=i * 100 + p.id, enabled=True, permission=p) for p in permissions],
+            warehouses=[SimpleNamespace(id=i * 10 + w, mp_warehouse_id=f"1020000{w:06d}", our_warehouse_id=1,
+                                        our_warehouse=our_warehouse) for w in range(3)],
+        ))
+    return clients
+
+def make_ozon_payload(count: int) -> dict:
+    """Ответ в духе v3/product/info/stocks: много мелких объектов с кириллицей."""
+    return {"result": {"items": [
+        {"offer_id": f"АРТ-{i}", "product_id": i, "name": "Футболка хлопковая, черная",
+         "stocks": [{"type": "fbo", "present": i % 50, "reserved": i % 7},
+                    {"type": "fbs", "present": i % 30, "reserved": 0}]}
+        for i in range(count)
+    ], "total": count, "last_id": "WzE2MzQ1NjRd"}}
+
+
+def measure(fn) -> float:
+    fn()  # прогрев
+    started = time.perf_counter()
+    for _ in range(REPEATS):
+        fn()
+    return (time.perf_counter() - started) / REPEATS * 1e3
+
+
+def main(count: int):
+    print(f"--- Сериализация ответов: {REPEATS} повторов ---")
+
+    clients = make_clients(count)
+    adapter = TypeAdapter(List[schemas.Client])
+
+    def fastapi_default():
+        # validate -> jsonable_encoder -> JSONResponse (json.dumps)
+        data = adapter.validate_python(clients, from_attributes=True)
+        return JSONResponse(content=jsonable_encoder(data)).body
+
+    def response_model_fast():
+        # validate -> dict в режиме json -> orjson (путь response_model + FastJSONResponse)
+        data = adapter.validate_python(clients, from_attributes=True)
+        return serialization.FastJSONResponse(content=adapter.dump_python(data, mode="json")).body
+
+    def direct_bytes():
+        # validate -> сразу байты в pydantic-core (schemas.dump_json)
+        return schemas.dump_json(List[schemas.Client], clients)
+
+    assert len(direct_bytes()) == len(fastapi_default())
+    print(f"\nList[schemas.Client], {count} клиентов, {len(direct_bytes()) / 1024:.0f} КБ")
+    base = measure(fastapi_default)
+    print(f"   JSONResponse + jsonable_encoder: {base:8.2f} мс")
+    for name, fn in (("FastJSONResponse:", response_model_fast), ("schemas.dump_json:", direct_bytes)):
+        elapsed = measure(fn)
+        print(f"   {name:32} {elapsed:8.2f} мс  (x{base / elapsed:.1f})")
+
+    payload = make_ozon_payload(count * 10)
+    body = serialization.dumps(payload)
+    print(f"\nОтвет Ozon, {count * 10} товаров, {len(body) / 1024:.0f} КБ")
+    base = measure(lambda: JSONResponse(content=jsonable_encoder(payload)).body)
+    print(f"   JSONResponse + jsonable_encoder: {base:8.2f} мс")
+    elapsed = measure(lambda: serialization.FastJSONResponse(content=payload).body)
+    print(f"   {'FastJSONResponse:':32} {elapsed:8.2f} мс  (x{base / elapsed:.1f})")
+
+    print("\n--- Замер завершен ---")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
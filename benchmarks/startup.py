@@ -0,0 +1,94 @@
+# File: benchmarks/startup.py
+#
+# Замер холодного старта воркера: импорт приложения и событие startup.
+# Каждый замер - отдельный процесс, как у `uvicorn --workers N`.
+# Запуск из корня проекта: python -m benchmarks.startup [число_замеров]
+#
+# Импорт почти целиком - это FastAPI с моделями Pydantic (около 0.6 с) и
+# SQLAlchemy (около 0.4 с); свои модули занимают примерно десятую часть.
+# До десятков миллисекунд его не сжать, поэтому бюджет импорта ловит
+# только регрессии (тяжелый модуль, подключенный при импорте), а быстрым
+# должно быть событие startup.
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+# Бюджеты в миллисекундах: импорт приложения и событие startup (проверка ревизии базы)
+IMPORT_BUDGET_MS = 2000
+STARTUP_BUDGET_MS = 50
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# Код, который выполняется в дочернем процессе
+_MEASURE = """
+import asyncio, json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+async def run():
+    await main.app.router.startup()
+    ready = time.perf_counter()
+    # Останавливаем фоновые задачи: иначе потоки их соединений aiosqlite не дают процессу завершиться
+    await main.app.router.shutdown()
+    await main.database.engine.dispose()
+    return ready
+ready = asyncio.run(run())
+print(json.dumps({"import_ms": (imported - started) * 1e3, "startup_ms": (ready - imported) * 1e3}))
+"""
+
+
+def run_python(env: dict, *args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args], cwd=BASE_DIR, env=env, capture_output=True, text=True
+    )
+
+
+def main(runs: int) -> int:
+    print(f"--- Холодный старт воркера: {runs} замеров ---")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+
+        # База без миграций: воркер обязан отказаться стартовать
+        failed = run_python(env, "-c", _MEASURE)
+        if failed.returncode == 0:
+            print("\n❌ ОШИБКА: приложение стартовало на базе без миграций")
+            return 1
+        print("\n✅ База без миграций: старт отклонен")
+
+        migrated = run_python(env, "migrations.py")
+        if migrated.returncode != 0:
+            print(f"\n❌ ОШИБКА миграций:\n{migrated.stderr}")
+            return 1
+
+        samples = []
+        for _ in range(runs):
+            result = run_python(env, "-c", _MEASURE)
+            if result.returncode != 0:
+                print(f"\n❌ ОШИБКА старта:\n{result.stderr}")
+                return 1
+            samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    import_ms = statistics.median(sample["import_ms"] for sample in samples)
+    startup_ms = statistics.median(sample["startup_ms"] for sample in samples)
+    print(f"\n   Импорт приложения:  {import_ms:8.1f} мс (медиана)")
+    print(f"   Событие startup:    {startup_ms:8.1f} мс (медиана)")
+    print(f"   Итого:              {import_ms + startup_ms:8.1f} мс")
+
+    print("\n--- Замер завершен ---")
+    failed = 0
+    if import_ms > IMPORT_BUDGET_MS:
+        failed += 1
+        print(f"❌ Импорт приложения дольше {IMPORT_BUDGET_MS} мс")
+    if startup_ms > STARTUP_BUDGET_MS:
+        failed += 1
+        print(f"❌ Событие startup дольше {STARTUP_BUDGET_MS} мс")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5))
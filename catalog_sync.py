@@ -0,0 +1,140 @@
+# File: catalog_sync.py
+
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.future import select
+
+# Импортируем наши собственные модули
+import client_sync
+import models
+from database import SessionLocal, insert
+
+# =============================================================================
+# ЛОКАЛЬНАЯ КОПИЯ КАТАЛОГА ТОВАРОВ КЛИЕНТОВ
+# Таблица catalog_products: товары каждого клиента с артикулом, SKU и
+# названием. Поиск (crud.search_catalog) идет по точным индексам offer_id
+# и sku и по полнотекстовому индексу FTS5 на названиях, без обращений в Ozon.
+#
+# Проход синхронизации клиента:
+#   1. v3/product/list постранично (last_id Ozon) - ID товаров;
+#   2. v3/product/info/list по ID страницы - карточки с updated_at;
+#   3. карточки, у которых updated_at не изменился, не перезаписываются:
+#      им только проставляется номер прохода, поэтому индекс названий
+#      трогают лишь новые и измененные товары.
+# Прерванный проход продолжается с сохраненного last_id; товары, которых
+# не было в проходе, удаляются в его конце (client_sync.py).
+# =============================================================================
+
+LIST_METHOD = "v3/product/list"
+INFO_METHOD = "v3/product/info/list"
+REQUIRED_METHODS = (LIST_METHOD, INFO_METHOD)
+
+_PAGE_SIZE = 1000        # максимум v3/product/list и v3/product/info/list
+
+Product = models.CatalogProduct
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    """Время Ozon (ISO 8601, обычно с Z) -> naive UTC, как в остальных таблицах."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _sku(item: dict) -> Optional[int]:
+    """SKU карточки: поле sku, а в новых ответах - первый из sources."""
+    if item.get("sku"):
+        return int(item["sku"])
+    for source in item.get("sources") or []:
+        if source.get("sku"):
+            return int(source["sku"])
+    return None
+
+
+async def _known_versions(client_id: int, product_ids: list[int]) -> dict[int, Optional[datetime]]:
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(Product.product_id, Product.ozon_updated_at)
+            .where(Product.client_id == client_id, Product.product_id.in_(product_ids))
+        )
+        return dict(result.all())
+
+
+def _upsert_statement():
+    statement = insert(Product)
+    return statement.on_conflict_do_update(
+        index_elements=[Product.client_id, Product.product_id],
+        set_={
+            column: statement.excluded[column]
+            for column in ("offer_id", "sku", "name", "archived", "ozon_updated_at", "generation", "synced_at")
+        },
+    )
+
+
+async def _run_pass(sync: client_sync.ClientSync, state: models.CatalogSyncState, headers: dict) -> None:
+    client_id = state.client_id
+    last_id = state.cursor or ""
+    while True:
+        page = await sync.call(
+            client_id, LIST_METHOD,
+            {"filter": {"visibility": "ALL"}, "last_id": last_id, "limit": _PAGE_SIZE},
+            headers,
+        )
+        result = page.get("result") or {}
+        items = result.get("items") or []
+        product_ids = [int(item["product_id"]) for item in items]
+
+        changed, unchanged = [], []
+        if product_ids:
+            known = await _known_versions(client_id, product_ids)
+            info = await sync.call(client_id, INFO_METHOD, {"product_id": [str(i) for i in product_ids]}, headers)
+            synced_at = datetime.utcnow()
+            for item in info.get("items") or []:
+                product_id = int(item["id"])
+                updated_at = _parse_time(item.get("updated_at"))
+                if product_id in known and updated_at is not None and known[product_id] == updated_at:
+                    unchanged.append(product_id)
+                    continue
+                changed.append({
+                    "client_id": client_id,
+                    "product_id": product_id,
+                    "offer_id": item.get("offer_id") or "",
+                    "sku": _sku(item),
+                    "name": item.get("name") or "",
+                    "archived": bool(item.get("is_archived") or item.get("is_autoarchived")),
+                    "ozon_updated_at": updated_at,
+                    "generation": state.generation,
+                    "synced_at": synced_at,
+                })
+
+        async def write(db):
+            if changed:
+                await db.execute(_upsert_statement(), changed)
+            if unchanged:
+                await db.execute(
+                    update(Product)
+                    .where(Product.client_id == client_id, Product.product_id.in_(unchanged))
+                    .values(generation=state.generation)
+                )
+
+        last_id = result.get("last_id") or ""
+        last_page = not last_id or len(items) < _PAGE_SIZE
+        await sync.save_page(state, None if last_page else last_id, write)
+        if last_page:
+            return
+
+
+sync = client_sync.ClientSync(
+    "catalog_sync", "каталога", models.CatalogSyncState, Product, REQUIRED_METHODS, _run_pass
+)
+start = sync.start
+stop = sync.stop
+request_sync = sync.request_sync
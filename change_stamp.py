@@ -0,0 +1,30 @@
+# File: change_stamp.py
+
+import os
+
+# =============================================================================
+# МЕТКА ИЗМЕНЕНИЙ, ОБЩАЯ ДЛЯ ВОРКЕРОВ
+# Данные, которые каждый воркер держит в памяти (ключи сервисных учетных
+# записей, список отозванных токенов), меняются редко, а проверяются на
+# каждом запросе. Воркер, изменивший данные, дописывает байт в файл-метку;
+# остальные сравнивают размер файла (один stat, без запросов в базу) с тем,
+# при котором загружали данные, и перечитывают их при расхождении.
+# Размер только растет, поэтому два изменения подряд не сливаются в одно,
+# как могло бы быть со временем изменения файла.
+# =============================================================================
+
+
+class ChangeStamp:
+    def __init__(self, path: str):
+        self.path = path
+
+    def current(self) -> int:
+        try:
+            return os.stat(self.path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def touch(self) -> None:
+        """Отмечает изменение для всех воркеров (вызывается после commit)."""
+        with open(self.path, "ab") as stamp:
+            stamp.write(b".")
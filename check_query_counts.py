@@ -0,0 +1,139 @@
+# File: check_query_counts.py
+
+import asyncio
+import os
+import sys
+import tempfile
+
+# Настройки читаются при импорте приложения, поэтому окружение готовим до импорта.
+# База - всегда временная, чтобы проверка не трогала рабочие данные.
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_tmp.name, 'check.db')}"
+os.environ.setdefault("JWT_SECRET_KEY", "check-secret")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+if "OZON_CRYPT_KEY" not in os.environ:
+    from cryptography.fernet import Fernet
+    os.environ["OZON_CRYPT_KEY"] = Fernet.generate_key().decode()
+
+import httpx
+
+# Импортируем наши собственные модули
+import database
+import db_stats
+import models
+import security
+import upstream
+from main import app
+
+# Бюджет SQL-запросов на эндпоинт, включая поиск пользователя по токену.
+# Сценарий выполняется по порядку: каждый шаг опирается на данные предыдущих.
+# Повтор одного и того же SQL внутри запроса считается ошибкой (признак N+1),
+# кроме шагов с allow_repeated=True, где повтор осознанный.
+# (описание, метод, URL, параметры запроса, ожидаемый код, бюджет[, allow_repeated])
+ENDPOINT_BUDGETS = [
+    ("Создание разрешения", "post", "/permissions/",
+     {"json": {"name": "v1/warehouse/list", "description": "Список складов"}}, 201, 4),
+    ("Список разрешений", "get", "/permissions/", {}, 200, 2),
+    ("Создание клиента", "post", "/clients/",
+     {"json": {"client_data": {"inn": "7700000001"}, "user_data": {"login": "client-1", "password": "secret"}}}, 201, 4,
+     # Пользователь ищется по логину дважды: по токену и при проверке занятости логина
+     True),
+    ("Создание второго клиента", "post", "/clients/",
+     {"json": {"client_data": {"inn": "7700000002"}, "user_data": {"login": "client-2", "password": "secret"}}}, 201, 4,
+     True),
+    ("Выдача разрешения клиенту", "post", "/clients/1/permissions/", {"json": {"permission_id": 1}}, 201, 4),
+    # Повтор ловит уникальный индекс: INSERT падает без предварительной проверки
+    ("Повторная выдача разрешения", "post", "/clients/1/permissions/", {"json": {"permission_id": 1}}, 400, 4),
+    ("Разрешения клиента", "get", "/clients/1/permissions/", {}, 200, 2),
+    ("Ключи Ozon клиента", "post", "/ozon_auth/",
+     {"json": {"client_id": 1, "ozon_client_id": "100001", "ozon_api_key": "api-key"}}, 201, 5),
+    ("Создание нашего склада", "post", "/our_warehouses/",
+     {"json": {"name": "Склад 1", "address": "Москва"}}, 201, 2),
+    ("Список наших складов", "get", "/our_warehouses/", {}, 200, 1),
+    ("Привязка склада Ozon", "post", "/clients/1/warehouses/",
+     {"json": {"mp_warehouse_id": "1020000000001", "our_warehouse_id": 1}}, 200, 3),
+    ("Повторная привязка склада Ozon", "post", "/clients/1/warehouses/",
+     {"json": {"mp_warehouse_id": "1020000000001", "our_warehouse_id": 1}}, 400, 3),
+    ("Склады клиента", "get", "/clients/1/warehouses/", {}, 200, 2),
+    # Клиент со всеми связями: сам клиент и шесть selectinload
+    ("Клиент", "get", "/clients/1", {}, 200, 8),
+    ("Список клиентов", "get", "/clients/", {}, 200, 8),
+    # UPDATE ... RETURNING и загрузка связей, без refresh и повторного SELECT
+    ("Изменение клиента", "patch", "/clients/1", {"json": {"inn": "7700000011"}}, 200, 7),
+    ("Изменение клиента на занятый ИНН", "patch", "/clients/1", {"json": {"inn": "7700000002"}}, 400, 2),
+    # Токен, право на метод, ключи Ozon и статусы договоров для очереди
+    # запросов в Ozon (upstream_scheduler.py; снимок еще не загружен)
+    ("Прокси-запрос в Ozon", "post", "/proxy/v1/warehouse/list",
+     {"json": {}, "headers": {"X-Target-Client-ID": "1"}}, 200, 4),
+]
+
+
+async def ozon_stub(scope, receive, send):
+    """Заглушка Ozon API: на любой запрос отвечает пустым списком."""
+    more_body = True
+    while more_body:
+        message = await receive()
+        more_body = message.get("more_body", False)
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": b'{"result":[]}'})
+
+
+async def run_checks() -> int:
+    async with database.engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+    async with database.SessionLocal() as session:
+        session.add(models.User(login="check", password_hash="-", is_superuser=True))
+        await session.commit()
+
+    # Общий клиент upstream.py направляем в заглушку вместо api-seller.ozon.ru
+    upstream._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=ozon_stub))
+    client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://check",
+        headers={"Authorization": f"Bearer {security.create_access_token({'sub': 'check'})}"},
+    )
+
+    # Список отозванных токенов (token_denylist.py) загружается в память первым
+    # запросом с токеном и дальше не читается: прогреваем его до замеров
+    await client.get("/users/me")
+
+    failed = 0
+    for name, method, url, kwargs, expected_status, budget, *options in ENDPOINT_BUDGETS:
+        title = f"{name}: {method.upper()} {url}"
+        allow_repeated = bool(options and options[0])
+        try:
+            with db_stats.assert_max_statements(budget, allow_repeated=allow_repeated) as stats:
+                response = await getattr(client, method)(url, **kwargs)
+        except AssertionError as e:
+            failed += 1
+            print(f"\n❌ {title}\n   {e}")
+            continue
+        if response.status_code != expected_status:
+            failed += 1
+            print(f"\n❌ {title}: код {response.status_code} вместо {expected_status}\n   {response.text[:300]}")
+            continue
+        print(f"\n✅ {title}: {stats.count} из {budget} SQL-запросов, {stats.seconds * 1000:.2f} мс в базе")
+
+    await client.aclose()
+    await upstream.close_client()
+    await database.engine.dispose()
+    return failed
+
+
+def main() -> int:
+    """
+    Прогоняет сценарий по основным эндпоинтам во временной базе и проверяет,
+    что каждый укладывается в свой бюджет SQL-запросов и не повторяет запросы.
+    """
+    print("--- Проверка числа SQL-запросов на эндпоинт ---")
+    failed = asyncio.run(run_checks())
+    _tmp.cleanup()
+
+    print("\n--- Проверка завершена ---")
+    if failed:
+        print(f"❌ Эндпоинтов с превышением бюджета или ошибкой: {failed}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
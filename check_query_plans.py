@@ -0,0 +1,201 @@
+# File: check_query_plans.py
+
+import sys
+from sqlalchemy import and_, column, create_engine, distinct, func, table, text, tuple_
+from sqlalchemy.future import select
+
+# Импортируем наши собственные модули
+import models
+
+# Полнотекстовый индекс каталога (как crud.catalog_fts)
+_catalog_fts = table("catalog_products_fts", column("rowid"), column("rank"))
+
+# "Горячие" запросы приложения в том виде, в котором их строят crud.py и роутеры.
+# Каждая пара: (где используется, запрос).
+HOT_QUERIES = [
+    (
+        "crud.check_client_permission",
+        select(models.ClientPermission)
+        .join(models.Permission)
+        .filter(
+            models.ClientPermission.client_id == 1,
+            models.Permission.name == "v1/warehouse/list",
+            models.ClientPermission.enabled == True,
+        ),
+    ),
+    (
+        "crud.get_client_permissions",
+        select(models.ClientPermission).filter(models.ClientPermission.client_id == 1),
+    ),
+    (
+        "client_permissions.grant_permission_to_client (проверка дубликата)",
+        select(models.ClientPermission).filter(
+            models.ClientPermission.client_id == 1,
+            models.ClientPermission.permission_id == 1,
+        ),
+    ),
+    (
+        "selectinload(Client.permissions)",
+        select(models.ClientPermission).filter(models.ClientPermission.client_id.in_([1, 2, 3])),
+    ),
+    (
+        "warehouses.read_client_warehouses",
+        select(models.ClientWarehouse).filter(models.ClientWarehouse.client_id == 1),
+    ),
+    (
+        "selectinload(Client.warehouses)",
+        select(models.ClientWarehouse).filter(models.ClientWarehouse.client_id.in_([1, 2, 3])),
+    ),
+    (
+        "поиск склада клиента по ID склада Ozon",
+        select(models.ClientWarehouse).filter(models.ClientWarehouse.mp_warehouse_id == "1020000000000"),
+    ),
+    (
+        "crud.get_user_by_login",
+        select(models.User).filter(models.User.login == "admin"),
+    ),
+    (
+        "crud.get_ozon_auth_by_client_id",
+        select(models.ClientOzonAuth).filter(models.ClientOzonAuth.client_id == 1),
+    ),
+    (
+        "ozon_auth.create_or_update_ozon_auth (клиент по user_id)",
+        select(models.Client).filter(models.Client.user_id == 1),
+    ),
+    (
+        "crud.get_stock_rollup (по нашим складам, все клиенты)",
+        select(
+            models.OurWarehouse.id,
+            func.count(distinct(models.StockSnapshot.client_id)),
+            func.count(distinct(models.StockSnapshot.sku)),
+            func.sum(models.StockSnapshot.present),
+            func.sum(models.StockSnapshot.reserved),
+        )
+        .select_from(models.StockSnapshot)
+        .join(models.ClientWarehouse, and_(
+            models.ClientWarehouse.client_id == models.StockSnapshot.client_id,
+            models.ClientWarehouse.mp_warehouse_id == models.StockSnapshot.mp_warehouse_id,
+        ))
+        .join(models.OurWarehouse, models.OurWarehouse.id == models.ClientWarehouse.our_warehouse_id)
+        .group_by(models.OurWarehouse.id),
+    ),
+    (
+        "crud.get_stock_rollup (один клиент)",
+        select(models.OurWarehouse.sap_plant_code, func.sum(models.StockSnapshot.present))
+        .select_from(models.StockSnapshot)
+        .join(models.ClientWarehouse, and_(
+            models.ClientWarehouse.client_id == models.StockSnapshot.client_id,
+            models.ClientWarehouse.mp_warehouse_id == models.StockSnapshot.mp_warehouse_id,
+        ))
+        .join(models.OurWarehouse, models.OurWarehouse.id == models.ClientWarehouse.our_warehouse_id)
+        .filter(models.StockSnapshot.client_id == 1)
+        .group_by(models.OurWarehouse.sap_plant_code),
+    ),
+    (
+        "crud.get_stocks",
+        select(models.StockSnapshot).filter(models.StockSnapshot.client_id == 1, models.StockSnapshot.sku == 1),
+    ),
+    (
+        "sap_export._produce",
+        select(
+            models.StockSnapshot.sku, models.StockSnapshot.offer_id, models.StockSnapshot.mp_warehouse_id,
+            models.StockSnapshot.present, models.StockSnapshot.reserved,
+        )
+        .where(models.StockSnapshot.client_id == 1)
+        .order_by(models.StockSnapshot.sku),
+    ),
+    (
+        "crud.search_catalog (SKU)",
+        select(models.CatalogProduct).where(models.CatalogProduct.sku == 1, models.CatalogProduct.client_id.in_([1, 2])),
+    ),
+    (
+        "crud.search_catalog (артикул)",
+        select(models.CatalogProduct).where(models.CatalogProduct.offer_id == "A-1", models.CatalogProduct.client_id.in_([1, 2])),
+    ),
+    (
+        "crud.search_catalog (название, FTS5)",
+        select(models.CatalogProduct)
+        .join(_catalog_fts, _catalog_fts.c.rowid == models.CatalogProduct.id)
+        .where(text("catalog_products_fts MATCH '\"кофе\"*'"))
+        .where(models.CatalogProduct.client_id.in_([1, 2]))
+        .order_by(_catalog_fts.c.rank)
+        .limit(20),
+    ),
+    (
+        "catalog_sync._known_versions",
+        select(models.CatalogProduct.product_id, models.CatalogProduct.ozon_updated_at)
+        .where(models.CatalogProduct.client_id == 1, models.CatalogProduct.product_id.in_([1, 2])),
+    ),
+    (
+        "crud.get_ozon_categories",
+        select(models.OzonCategory).filter(models.OzonCategory.parent_id == 1).order_by(models.OzonCategory.name),
+    ),
+    (
+        "crud.get_ozon_category_types",
+        select(models.OzonCategoryType)
+        .filter(models.OzonCategoryType.description_category_id == 1)
+        .order_by(models.OzonCategoryType.name),
+    ),
+    (
+        "crud.get_ozon_type_attributes",
+        select(models.OzonTypeAttribute.is_required, models.OzonAttribute.name)
+        .join(models.OzonAttribute)
+        .filter(models.OzonTypeAttribute.description_category_id == 1, models.OzonTypeAttribute.type_id == 1),
+    ),
+    (
+        "reference_sync._next_types",
+        select(models.OzonCategoryType.description_category_id, models.OzonCategoryType.type_id)
+        .where(
+            models.OzonCategoryType.generation == 1,
+            models.OzonCategoryType.disabled == False,
+            tuple_(models.OzonCategoryType.description_category_id, models.OzonCategoryType.type_id) > tuple_(1, 1),
+        )
+        .order_by(models.OzonCategoryType.description_category_id, models.OzonCategoryType.type_id)
+        .limit(500),
+    ),
+]
+
+def find_table_scans(plan_rows) -> list[str]:
+    """
+    Возвращает строки плана, в которых SQLite читает таблицу целиком.
+    'SCAN t USING ... INDEX' - это обход индекса, он допустим;
+    'SCAN t VIRTUAL TABLE INDEX' - поиск по индексу FTS5, тоже допустим.
+    """
+    return [
+        detail for detail in plan_rows
+        if detail.startswith("SCAN ") and " USING " not in detail and " VIRTUAL TABLE INDEX " not in detail
+    ]
+
+def main() -> int:
+    """
+    Строит схему из моделей во временной базе и проверяет через
+    EXPLAIN QUERY PLAN, что ни один горячий запрос не читает таблицу целиком.
+    """
+    print("--- Проверка планов выполнения горячих запросов ---")
+
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+
+    failed = 0
+    with engine.connect() as conn:
+        for name, query in HOT_QUERIES:
+            compiled = query.compile(engine, compile_kwargs={"literal_binds": True})
+            rows = conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).all()
+            plan = [row[-1] for row in rows]
+            scans = find_table_scans(plan)
+            if scans:
+                failed += 1
+                print(f"\n❌ {name}: полный просмотр таблицы")
+            else:
+                print(f"\n✅ {name}")
+            for detail in plan:
+                print(f"   {detail}")
+
+    print("\n--- Проверка завершена ---")
+    if failed:
+        print(f"❌ Запросов без индекса: {failed}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+# File: client_sync.py
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import DateTime, and_, delete, func, literal, or_, update
+from sqlalchemy.future import select
+
+# Импортируем наши собственные модули
+import crud
+import models
+import upstream
+from database import SessionLocal, insert
+from settings import settings
+
+# =============================================================================
+# ПЕРИОДИЧЕСКАЯ СИНХРОНИЗАЦИЯ ДАННЫХ КЛИЕНТОВ ИЗ OZON
+# Общая часть для локальных копий (остатки - stock_sync.py, товары -
+# catalog_sync.py). У каждой копии своя таблица данных (client_id,
+# generation, ...) и таблица состояния по клиентам (StockSyncState и т.п.).
+#
+# Проход синхронизации клиента идет страницами Ozon. Строки страницы и
+# курсор Ozon пишутся одной транзакцией (save_page), поэтому прерванный
+# проход продолжается с той же страницы. Строки помечаются номером прохода;
+# после последней страницы строки клиента с другим номером удаляются -
+# это то, что исчезло в Ozon.
+#
+# Клиента синхронизирует один воркер: он берет клиента под аренду
+# (locked_until) и продлевает ее с каждой страницей. Аренда продлевается
+# первым запросом транзакции: если ее уже забрал другой воркер (проход
+# завис дольше <prefix>_lease_seconds), транзакция откатывается до записи
+# строк и проход прерывается (LeaseLost). Клиент попадает
+# в синхронизацию, когда у него есть ключи Ozon и включены права на все
+# методы копии. Настройки копии: <prefix>_concurrency, _interval_seconds,
+# _retry_seconds, _scan_seconds, _lease_seconds в settings.py.
+# =============================================================================
+
+logger = logging.getLogger("client_sync")
+
+
+def _now() -> datetime:
+    return datetime.utcnow()
+
+
+class LeaseLost(Exception):
+    """Аренду клиента забрал другой воркер: этот проход больше ничего не пишет."""
+
+
+class ClientSync:
+    """
+    Синхронизация одной локальной копии. run_pass(sync, state, headers)
+    выполняет проход клиента с курсора state.cursor и для каждой страницы
+    вызывает sync.save_page(); после последней страницы - save_page(cursor=None).
+    """
+
+    def __init__(
+        self,
+        settings_prefix: str,
+        title: str,
+        state_model,
+        data_model,
+        required_methods: tuple[str, ...],
+        run_pass: Callable[["ClientSync", object, dict], Awaitable[None]],
+    ):
+        self.settings_prefix = settings_prefix
+        self.title = title
+        self.state_model = state_model
+        self.data_model = data_model
+        self.required_methods = required_methods
+        self.run_pass = run_pass
+        self._active: set[asyncio.Task] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _setting(self, name: str):
+        return getattr(settings, f"{self.settings_prefix}_{name}")
+
+    def _lease_until(self) -> datetime:
+        return _now() + timedelta(seconds=self._setting("lease_seconds"))
+
+    # --- Для прохода синхронизации ---
+
+    async def call(self, client_id: int, method: str, payload: dict, headers: dict) -> dict:
+        """Запрос в Ozon с учетом общих лимитов: при исчерпании ждем новое окно."""
+        return await upstream.call_ozon_within_quota(client_id, method, payload, headers)
+
+    async def save_page(self, state, cursor: Optional[str], write: Optional[Callable] = None) -> None:
+        """
+        Записывает страницу: write(db) и курсор следующей страницы - одной
+        транзакцией, заодно продлевает аренду. cursor=None - страница последняя,
+        проход завершается.
+        """
+        lease = self._lease_until()
+        async with SessionLocal() as db:
+            await self._renew_lease(db, state, cursor=cursor, locked_until=lease)
+            if write is not None:
+                await write(db)
+            await db.commit()
+        state.locked_until = lease
+        state.cursor = cursor
+
+    async def _renew_lease(self, db, state, **values) -> None:
+        """
+        Первый запрос транзакции прохода: обновляет состояние клиента, только
+        пока аренда за этим проходом. Иначе откатывает транзакцию - LeaseLost.
+        """
+        State = self.state_model
+        result = await db.execute(
+            update(State)
+            .where(State.client_id == state.client_id, State.locked_until == state.locked_until)
+            .values(**values)
+        )
+        if result.rowcount != 1:
+            await db.rollback()
+            raise LeaseLost(f"Аренду синхронизации {self.title} клиента {state.client_id} забрал другой воркер")
+
+    async def _finish_pass(self, state) -> int:
+        """Удаляет строки, не полученные в этом проходе, и начинает следующий проход."""
+        State, Data = self.state_model, self.data_model
+        async with SessionLocal() as db:
+            await self._renew_lease(
+                db, state,
+                generation=state.generation + 1,
+                cursor=None,
+                last_synced_at=_now(),
+                error=None,
+                next_run_at=_now() + timedelta(seconds=self._setting("interval_seconds")),
+                locked_until=None,
+            )
+            await db.execute(
+                delete(Data).where(Data.client_id == state.client_id, Data.generation != state.generation)
+            )
+            rows = (await db.execute(
+                select(func.count()).select_from(Data).where(Data.client_id == state.client_id)
+            )).scalar()
+            await db.execute(update(State).where(State.client_id == state.client_id).values(rows=rows))
+            await db.commit()
+        return rows
+
+    async def _release(self, state, error: str, retry_seconds: float) -> None:
+        State = self.state_model
+        async with SessionLocal() as db:
+            await db.execute(
+                update(State)
+                .where(State.client_id == state.client_id, State.locked_until == state.locked_until)
+                .values(error=error[:1000], next_run_at=_now() + timedelta(seconds=retry_seconds), locked_until=None)
+            )
+            await db.commit()
+
+    async def sync_client(self, state) -> int:
+        """Выполняет (или продолжает) проход синхронизации клиента. Возвращает число строк."""
+        async with SessionLocal() as db:
+            for method in self.required_methods:
+                if not await crud.check_client_permission(db=db, client_id=state.client_id, permission_name=method):
+                    raise upstream.OzonError(f"У клиента нет разрешения на вызов метода '{method}'")
+            headers = await upstream.client_headers(db, state.client_id)
+        await self.run_pass(self, state, headers)
+        if state.cursor is not None:
+            raise RuntimeError("Проход синхронизации закончился без последней страницы")
+        return await self._finish_pass(state)
+
+    async def _process(self, state) -> None:
+        try:
+            rows = await self.sync_client(state)
+        except upstream.OzonError as exc:
+            # Нет прав или ключей: повторяем со следующим плановым проходом
+            await self._release(state, str(exc), self._setting("interval_seconds"))
+        except LeaseLost as exc:
+            # Клиента синхронизирует новый владелец аренды, освобождать нечего
+            logger.warning("%s", exc)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            if not isinstance(exc, upstream.OzonTransientError):
+                logger.exception("Ошибка синхронизации %s клиента %s", self.title, state.client_id)
+            # Курсор сохранен: следующая попытка продолжит проход
+            await self._release(state, str(exc), self._setting("retry_seconds"))
+        else:
+            logger.info("Синхронизация %s клиента %s: %s строк", self.title, state.client_id, rows)
+
+    # --- Планировщик ---
+
+    async def _ensure_states(self) -> None:
+        """Заводит состояние синхронизации для клиентов, у которых появились ключи Ozon."""
+        State = self.state_model
+        async with SessionLocal() as db:
+            await db.execute(
+                insert(State)
+                .from_select(
+                    ["client_id", "generation", "rows", "next_run_at"],
+                    select(models.ClientOzonAuth.client_id, literal(1), literal(0), literal(_now(), DateTime))
+                    .where(models.ClientOzonAuth.client_id.not_in(select(State.client_id))),
+                )
+                .on_conflict_do_nothing()
+            )
+            await db.commit()
+
+    async def _claim(self, limit: int) -> list:
+        State = self.state_model
+        now = _now()
+        due = and_(State.next_run_at <= now, or_(State.locked_until.is_(None), State.locked_until < now))
+        claimed = []
+        async with SessionLocal() as db:
+            result = await db.execute(select(State.client_id).where(due).order_by(State.next_run_at).limit(limit))
+            for client_id in result.scalars().all():
+                # Условие повторяется в UPDATE: клиента получит один воркер
+                result = await db.execute(
+                    update(State)
+                    .where(State.client_id == client_id, due)
+                    .values(locked_until=self._lease_until())
+                    .returning(State)
+                    .execution_options(synchronize_session=False)
+                )
+                state = result.scalars().first()
+                await db.commit()
+                if state is not None:
+                    claimed.append(state)
+        return claimed
+
+    async def request_sync(self, client_id: int) -> bool:
+        """Ставит клиента в очередь на синхронизацию сейчас. False - клиент без ключей Ozon."""
+        State = self.state_model
+        await self._ensure_states()
+        async with SessionLocal() as db:
+            result = await db.execute(update(State).where(State.client_id == client_id).values(next_run_at=_now()))
+            await db.commit()
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return result.rowcount > 0
+
+    def _done(self, task: asyncio.Task) -> None:
+        self._active.discard(task)
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        concurrency = self._setting("concurrency")
+        while True:
+            self._wakeup.clear()
+            free = concurrency - len(self._active)
+            if free > 0:
+                try:
+                    await self._ensure_states()
+                    states = await self._claim(free)
+                except Exception:
+                    logger.exception("Не удалось выбрать клиентов для синхронизации %s", self.title)
+                    states = []
+                for state in states:
+                    task = asyncio.create_task(self._process(state))
+                    self._active.add(task)
+                    task.add_done_callback(self._done)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._setting("scan_seconds"))
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        """Запускает синхронизацию (событие startup); 0 в <prefix>_concurrency - выключена."""
+        if self._setting("concurrency") > 0 and self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in list(self._active):
+            task.cancel()
+        # Прерванный проход продолжится по сохраненному курсору, когда истечет аренда
+        await asyncio.gather(*self._active, return_exceptions=True)
@@ -1,14 +1,66 @@
 # In: crud.py
 
+import re
+from datetime import datetime
+
+from sqlalchemy import and_, column, distinct, func, table, text, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload 
 from typing import List, Optional
 
+import database
 import models
 import schemas
 import security
 
+# Все связи клиента, которые нужны схеме schemas.Client
+CLIENT_RELATIONS = (
+    selectinload(models.Client.user),
+    selectinload(models.Client.ozon_auth),
+    selectinload(models.Client.permissions).selectinload(models.ClientPermission.permission),
+    selectinload(models.Client.warehouses).selectinload(models.ClientWarehouse.our_warehouse),
+)
+
+# --- Общие функции записи ---
+async def save_new(db: AsyncSession, db_obj):
+    """
+    Сохраняет новый объект одним INSERT и возвращает его без refresh()
+    и повторного SELECT: id приходит из INSERT, остальные поля уже в объекте.
+    Связи, нужные для ответа, задаются при создании объекта.
+    При нарушении уникальности откатывает сессию и пробрасывает IntegrityError.
+    """
+    db.add(db_obj)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise
+    return db_obj
+
+async def update_returning(db: AsyncSession, model, object_id: int, values: dict, *options):
+    """
+    Обновляет строку одним UPDATE ... RETURNING и возвращает объект
+    (или None, если строки нет). Связи из options подгружаются сразу.
+    При нарушении уникальности откатывает сессию и пробрасывает IntegrityError.
+    """
+    try:
+        result = await db.execute(
+            update(model)
+            .where(model.id == object_id)
+            .values(**values)
+            .returning(model)
+            .options(*options)
+            .execution_options(populate_existing=True)
+        )
+        db_obj = result.scalars().first()
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise
+    return db_obj
+
 # --- Функции для работы с User ---
 async def get_user_by_login(db: AsyncSession, login: str):
     """Ищет пользователя по логину."""
@@ -17,7 +69,7 @@ async def get_user_by_login(db: AsyncSession, login: str):
 
 async def create_user(db: AsyncSession, user: schemas.UserCreate):
     """Создает нового пользователя."""
-    hashed_password = security.get_password_hash(user.password)
+    hashed_password = await security.get_password_hash_async(user.password)
     db_user = models.User(
         login=user.login,
         email=user.email,
@@ -36,31 +88,29 @@ async def create_client_with_user(db: AsyncSession, client_data: schemas.ClientC
     Гарантированно подгружает все связи перед возвратом.
     """
     # Локальный импорт для разрыва циклической зависимости
-    from security import get_password_hash 
+    from security import get_password_hash_async
     
     # 1. Создаем объекты в памяти (БЕЗ КОММИТА)
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     db_user = models.User(
         login=user_data.login,
         email=user_data.email,
         password_hash=hashed_password,
     )
     
-    # Связываем пользователя и клиента сразу
-    db_client = models.Client(**client_data.model_dump(), user=db_user)
-    
-    # 2. Добавляем оба объекта в сессию
-    db.add(db_client)
-    
-    # 3. Коммитим все вместе
-    await db.commit()
-    
-    # 4. --- ФИНАЛЬНОЕ ИСПРАВЛЕНИЕ ---
-    # Обновляем ТОЛЬКО что созданный объект, чтобы SQLAlchemy
-    # подгрузил его связи в рамках ТОЙ ЖЕ активной сессии.
-    await db.refresh(db_client, ['user', 'permissions', 'ozon_auth', 'warehouses'])
+    # Связываем пользователя и клиента сразу. У нового клиента нет ни прав,
+    # ни складов, ни ключей - задаем это явно, чтобы ответ не требовал
+    # подгрузки связей из базы.
+    db_client = models.Client(
+        **client_data.model_dump(),
+        user=db_user,
+        ozon_auth=None,
+        permissions=[],
+        warehouses=[],
+    )
     
-    return db_client
+    # 2. Сохраняем оба объекта одним коммитом (два INSERT, без refresh)
+    return await save_new(db, db_client)
 
 # --- Функции для работы с OzonAuth ---
 
@@ -84,18 +134,38 @@ async def get_ozon_auth_by_client_id(db: AsyncSession, client_id: int):
     )
     return result.scalars().first()
 
+
+async def upsert_ozon_auths(db: AsyncSession, rows: list[dict]) -> set[int]:
+    """
+    Записывает зашифрованные ключи Ozon многих клиентов одним INSERT ... ON CONFLICT
+    (без commit). Возвращает ID клиентов, у которых ключи уже были.
+    """
+    client_ids = [row["client_id"] for row in rows]
+    result = await db.execute(
+        select(models.ClientOzonAuth.client_id).where(models.ClientOzonAuth.client_id.in_(client_ids))
+    )
+    existing = set(result.scalars().all())
+    now = datetime.utcnow()
+    statement = database.insert(models.ClientOzonAuth)
+    statement = statement.on_conflict_do_update(
+        index_elements=[models.ClientOzonAuth.client_id],
+        set_={
+            "encrypted_ozon_client_id": statement.excluded.encrypted_ozon_client_id,
+            "encrypted_ozon_api_key": statement.excluded.encrypted_ozon_api_key,
+            "updated_at": statement.excluded.updated_at,
+        },
+    )
+    await db.execute(statement, [{**row, "created_at": now, "updated_at": now} for row in rows])
+    return existing
+
+
 async def get_clients(db: AsyncSession, skip: int = 0, limit: int = 100) -> list[models.Client]:
     """
     Получает список клиентов с принудительной загрузкой ВСЕХ связей.
     """
     result = await db.execute(
-        select(models.Client).options(
-            selectinload(models.Client.user),
-            selectinload(models.Client.ozon_auth),
-            # Вложенная "жадная" загрузка решает ошибку с MissingGreenlet
-            selectinload(models.Client.permissions).selectinload(models.ClientPermission.permission),
-            selectinload(models.Client.warehouses).selectinload(models.ClientWarehouse.our_warehouse)
-        ).offset(skip).limit(limit)
+        # Вложенная "жадная" загрузка решает ошибку с MissingGreenlet
+        select(models.Client).options(*CLIENT_RELATIONS).offset(skip).limit(limit)
     )
     return result.scalars().all()
 
@@ -104,15 +174,19 @@ async def get_client(db: AsyncSession, client_id: int) -> models.Client | None:
     Получает одного клиента по ID с принудительной загрузкой ВСЕХ связей.
     """
     result = await db.execute(
-        select(models.Client).options(
-            selectinload(models.Client.user),
-            selectinload(models.Client.ozon_auth),
-            selectinload(models.Client.permissions).selectinload(models.ClientPermission.permission),
-            selectinload(models.Client.warehouses).selectinload(models.ClientWarehouse.our_warehouse)
-        ).filter(models.Client.id == client_id)
+        select(models.Client).options(*CLIENT_RELATIONS).filter(models.Client.id == client_id)
     )
     return result.scalars().first()
 
+async def update_client(db: AsyncSession, client_id: int, update_data: dict) -> models.Client | None:
+    """
+    Обновляет переданные поля клиента и возвращает его со ВСЕМИ связями.
+    Один UPDATE ... RETURNING вместо SELECT + UPDATE + refresh + повторного SELECT.
+    """
+    if not update_data:
+        return await get_client(db, client_id=client_id)
+    return await update_returning(db, models.Client, client_id, update_data, *CLIENT_RELATIONS)
+
 
 async def assign_permission_to_client(
     db: AsyncSession, client_id: int, permission_id: int, enabled: bool
@@ -162,4 +236,178 @@ async def check_client_permission(db: AsyncSession, client_id: int, permission_n
             models.ClientPermission.enabled == True
         )
     )
-    return result.scalars().first() is not None    
\ No newline at end of file
+    return result.scalars().first() is not None
+
+def permitted_clients_query(permission_name: str, client_id: Optional[int] = None):
+    """ID клиентов с включенным правом permission_name."""
+    query = (
+        select(models.ClientPermission.client_id)
+        .join(models.Permission)
+        .filter(models.Permission.name == permission_name, models.ClientPermission.enabled == True)
+    )
+    if client_id is not None:
+        query = query.filter(models.ClientPermission.client_id == client_id)
+    return query
+
+# --- Функции для работы с остатками (stock_sync.py) ---
+
+def stock_rollup_query(
+    group_by: str = "our_warehouse",
+    client_id: Optional[int] = None,
+    sku: Optional[int] = None,
+    our_warehouse_id: Optional[int] = None,
+):
+    """
+    Свод остатков по нашим складам (group_by="our_warehouse") или по
+    заводам SAP (group_by="sap_plant_code"). Склад Ozon сопоставляется
+    нашему складу через client_warehouses; остатки на несопоставленных
+    складах в свод не попадают.
+    """
+    stock = models.StockSnapshot
+    link = models.ClientWarehouse
+    warehouse = models.OurWarehouse
+    if group_by == "sap_plant_code":
+        keys = (warehouse.sap_plant_code,)
+    else:
+        keys = (warehouse.id.label("our_warehouse_id"), warehouse.name.label("our_warehouse_name"), warehouse.sap_plant_code)
+    query = (
+        select(
+            *keys,
+            func.count(distinct(stock.client_id)).label("clients"),
+            func.count(distinct(stock.sku)).label("skus"),
+            func.sum(stock.present).label("present"),
+            func.sum(stock.reserved).label("reserved"),
+        )
+        .select_from(stock)
+        .join(link, and_(link.client_id == stock.client_id, link.mp_warehouse_id == stock.mp_warehouse_id))
+        .join(warehouse, warehouse.id == link.our_warehouse_id)
+        .group_by(*keys)
+        .order_by(*keys)
+    )
+    if client_id is not None:
+        query = query.filter(stock.client_id == client_id)
+    if sku is not None:
+        query = query.filter(stock.sku == sku)
+    if our_warehouse_id is not None:
+        query = query.filter(link.our_warehouse_id == our_warehouse_id)
+    return query
+
+async def get_stock_rollup(db: AsyncSession, **filters) -> list[dict]:
+    result = await db.execute(stock_rollup_query(**filters))
+    return [dict(row) for row in result.mappings().all()]
+
+async def get_stocks(
+    db: AsyncSession, client_id: int, sku: Optional[int] = None, skip: int = 0, limit: int = 100
+) -> List[models.StockSnapshot]:
+    """Остатки клиента по складам Ozon."""
+    query = select(models.StockSnapshot).filter(models.StockSnapshot.client_id == client_id)
+    if sku is not None:
+        query = query.filter(models.StockSnapshot.sku == sku)
+    result = await db.execute(
+        query.order_by(models.StockSnapshot.sku, models.StockSnapshot.mp_warehouse_id).offset(skip).limit(limit)
+    )
+    return result.scalars().all()
+
+# --- Функции для работы с каталогом товаров (catalog_sync.py) ---
+
+# Полнотекстовый индекс названий (FTS5), см. models.CATALOG_FTS_DDL
+catalog_fts = table("catalog_products_fts", column("rowid"), column("rank"))
+_SEARCH_TOKEN_RE = re.compile(r"\w+")
+
+def catalog_match_expression(q: str) -> Optional[str]:
+    """
+    Запрос FTS5 из строки пользователя: все слова обязательны, каждое - как
+    префикс ("кофе зерн" найдет "Кофе в зернах"). Слова берутся в кавычки,
+    поэтому синтаксис FTS5 (OR, NEAR, *) из строки не работает. "ё" заменяется
+    на "е", как в индексе (models.CATALOG_FTS_DDL).
+    """
+    tokens = _SEARCH_TOKEN_RE.findall(q.replace("ё", "е").replace("Ё", "Е"))
+    return " ".join(f'"{token}"*' for token in tokens) or None
+
+def catalog_search_queries(q: str, client_ids, limit: int) -> list:
+    """
+    Запросы поиска по каталогу в порядке приоритета: точный SKU или ID товара
+    Ozon, точный артикул, затем совпадения в названии по релевантности (bm25).
+    client_ids - список или подзапрос с ID клиентов, среди которых ищем.
+    """
+    product = models.CatalogProduct
+    q = q.strip()
+    queries = []
+    if q.isdigit():
+        number = int(q)
+        for key in (product.sku, product.product_id):
+            queries.append((
+                "sku" if key is product.sku else "product_id",
+                select(product).where(key == number, product.client_id.in_(client_ids)).limit(limit),
+            ))
+    queries.append((
+        "offer_id",
+        select(product).where(product.offer_id == q, product.client_id.in_(client_ids)).limit(limit),
+    ))
+    expression = catalog_match_expression(q)
+    if expression is not None:
+        queries.append((
+            "name",
+            select(product)
+            .join(catalog_fts, catalog_fts.c.rowid == product.id)
+            .where(text("catalog_products_fts MATCH :match").bindparams(match=expression))
+            .where(product.client_id.in_(client_ids))
+            .order_by(catalog_fts.c.rank)
+            .limit(limit),
+        ))
+    return queries
+
+async def search_catalog(
+    db: AsyncSession, q: str, permission_name: str, client_id: Optional[int] = None, limit: int = 20
+) -> list[tuple[str, models.CatalogProduct]]:
+    """
+    Ищет товары по SKU, артикулу или словам названия среди клиентов
+    с включенным правом permission_name. Возвращает пары (что совпало, товар).
+    """
+    client_ids = (await db.execute(permitted_clients_query(permission_name, client_id))).scalars().all()
+    if not client_ids:
+        return []
+    found: dict[int, tuple[str, models.CatalogProduct]] = {}
+    for match, query in catalog_search_queries(q, client_ids, limit):
+        for product in (await db.execute(query)).scalars().all():
+            found.setdefault(product.id, (match, product))
+        if len(found) >= limit:
+            break
+    return list(found.values())[:limit]
+
+# --- Функции для работы со справочниками Ozon (reference_sync.py) ---
+
+async def get_ozon_categories(db: AsyncSession, parent_id: Optional[int] = None) -> List[models.OzonCategory]:
+    """Дочерние категории parent_id; без parent_id - корни дерева."""
+    condition = (
+        models.OzonCategory.parent_id.is_(None) if parent_id is None
+        else models.OzonCategory.parent_id == parent_id
+    )
+    result = await db.execute(select(models.OzonCategory).filter(condition).order_by(models.OzonCategory.name))
+    return result.scalars().all()
+
+async def get_ozon_category_types(db: AsyncSession, category_id: int) -> List[models.OzonCategoryType]:
+    result = await db.execute(
+        select(models.OzonCategoryType)
+        .filter(models.OzonCategoryType.description_category_id == category_id)
+        .order_by(models.OzonCategoryType.name)
+    )
+    return result.scalars().all()
+
+async def get_ozon_type_attributes(db: AsyncSession, category_id: int, type_id: int) -> List[models.OzonTypeAttribute]:
+    """Характеристики типа товара: сначала обязательные."""
+    result = await db.execute(
+        select(models.OzonTypeAttribute)
+        .filter(
+            models.OzonTypeAttribute.description_category_id == category_id,
+            models.OzonTypeAttribute.type_id == type_id,
+        )
+        .order_by(models.OzonTypeAttribute.is_required.desc(), models.OzonTypeAttribute.attribute_id)
+    )
+    return result.scalars().all()
+
+async def get_ozon_attributes(db: AsyncSession, attribute_ids: list[int]) -> List[models.OzonAttribute]:
+    result = await db.execute(
+        select(models.OzonAttribute).filter(models.OzonAttribute.id.in_(attribute_ids)).order_by(models.OzonAttribute.id)
+    )
+    return result.scalars().all()
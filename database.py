@@ -1,19 +1,39 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./database.db"
+from settings import settings
+
+# Тот же адрес, что у Alembic (alembic/env.py) и служебных скриптов
+SQLALCHEMY_DATABASE_URL = settings.database_url
 
 # Асинхронный "движок" для SQLAlchemy
+# (check_same_thread - параметр драйвера sqlite3, другим драйверам он не нужен)
 engine = create_async_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {},
 )
 
-# Асинхронная сессия
+# Асинхронная сессия.
+# expire_on_commit=False: после commit() объекты остаются заполненными,
+# поэтому ответ можно собрать без refresh() и повторного SELECT.
 SessionLocal = sessionmaker(
-    autocommit=False, autoflush=False, bind=engine, class_=AsyncSession
+    autocommit=False, autoflush=False, bind=engine, class_=AsyncSession,
+    expire_on_commit=False,
 )
 
-Base = declarative_base()
+def insert(entity):
+    """
+    INSERT с ON CONFLICT (on_conflict_do_update/on_conflict_do_nothing и
+    excluded) для диалекта базы из DATABASE_URL. Такой INSERT есть у SQLite и
+    PostgreSQL; у остальных баз синтаксис другой, для них - NotImplementedError.
+    """
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif engine.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise NotImplementedError(f"INSERT ... ON CONFLICT не поддерживается для базы {engine.dialect.name}")
+    return dialect_insert(entity)
 
 # Асинхронная зависимость для получения сессии, которой не хватало
 async def get_db():
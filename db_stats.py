@@ -0,0 +1,119 @@
+# File: db_stats.py
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+
+# =============================================================================
+# СТАТИСТИКА SQL-ЗАПРОСОВ В ПРЕДЕЛАХ ОДНОГО HTTP-ЗАПРОСА
+# Слушатели событий движка считают запросы, суммарное время в базе и
+# одинаковые запросы (один и тот же SQL с разными параметрами) - типичный
+# признак N+1, когда связь догружается по одной строке.
+# Сбор идет только внутри track(): его открывает MetricsMiddleware на каждый
+# HTTP-запрос, а в проверках - assert_max_statements().
+# =============================================================================
+
+_current: ContextVar[Optional["StatementStats"]] = ContextVar("db_statement_stats", default=None)
+
+
+class StatementStats:
+    """
+    Счетчики SQL-запросов одного HTTP-запроса (или блока кода).
+    Вложенный блок учитывается и во внешнем (parent): так проверка вокруг
+    вызова приложения видит запросы, собранные его middleware.
+    """
+    __slots__ = ("count", "seconds", "by_statement", "parent")
+
+    def __init__(self, parent: Optional["StatementStats"] = None):
+        self.count = 0
+        self.seconds = 0.0
+        self.by_statement: dict[str, int] = {}
+        self.parent = parent
+
+    def repeated(self, threshold: int = 2) -> dict[str, int]:
+        """Запросы, выполненные не меньше threshold раз (кандидаты в N+1)."""
+        return {statement: n for statement, n in self.by_statement.items() if n >= threshold}
+
+    def summary(self) -> str:
+        lines = [f"SQL-запросов: {self.count}, время в базе: {self.seconds * 1000:.2f} мс"]
+        for statement, n in sorted(self.by_statement.items(), key=lambda item: -item[1]):
+            lines.append(f"   {n} x {' '.join(statement.split())[:160]}")
+        return "\n".join(lines)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    stats = _current.get()
+    if stats is None:
+        return
+    while stats is not None:
+        stats.count += 1
+        stats.by_statement[statement] = stats.by_statement.get(statement, 0) + 1
+        stats = stats.parent
+    context._db_stats_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = getattr(context, "_db_stats_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stats = _current.get()
+    while stats is not None:
+        stats.seconds += elapsed
+        stats = stats.parent
+
+
+def instrument_engine(engine) -> None:
+    """Подключает сбор статистики к асинхронному движку."""
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def track():
+    """Собирает статистику SQL-запросов, выполненных внутри блока."""
+    stats = StatementStats(parent=_current.get())
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def untracked():
+    """Запросы внутри блока не учитываются: например, перечитывание строки при длинном опросе."""
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def assert_max_statements(limit: int, allow_repeated: bool = False):
+    """
+    Проверка для скриптов и тестов: блок должен уложиться в limit SQL-запросов
+    и (если не allow_repeated) не выполнять один и тот же запрос дважды.
+        with db_stats.assert_max_statements(4):
+            await client.post("/clients/", json=...)
+    """
+    with track() as stats:
+        yield stats
+    if stats.count > limit:
+        raise AssertionError(f"Ожидалось не больше {limit} SQL-запросов\n{stats.summary()}")
+    if not allow_repeated and stats.repeated():
+        raise AssertionError(f"Повторяющиеся SQL-запросы (возможен N+1)\n{stats.summary()}")
+
+
+def debug_headers(stats: StatementStats) -> list[tuple[bytes, bytes]]:
+    """Заголовки ответа со статистикой запроса (включаются настройкой DB_DEBUG_HEADERS)."""
+    repeated = stats.repeated()
+    return [
+        (b"x-db-statements", str(stats.count).encode()),
+        (b"x-db-time-ms", f"{stats.seconds * 1000:.2f}".encode()),
+        # Сколько выполнений были лишними повторами уже выполненного SQL
+        (b"x-db-repeated-statements", str(sum(n - 1 for n in repeated.values())).encode()),
+    ]
@@ -0,0 +1,77 @@
+# File: executors.py
+
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Optional
+
+from settings import settings
+
+# =============================================================================
+# ОБЩИЕ ПУЛЫ ДЛЯ ТЯЖЕЛОЙ РАБОТЫ ВНЕ ЦИКЛА СОБЫТИЙ
+# run_in_thread - для кода, который отпускает GIL (bcrypt, ввод-вывод) или
+#     долго обходит Python-объекты (сериализация больших списков): цикл
+#     событий продолжает обслуживать другие запросы.
+# run_cpu_bound - для чистой CPU-работы над данными, которые можно передать
+#     в другой процесс (строки, байты, кортежи). Пул процессов включается
+#     настройкой OFFLOAD_PROCESS_WORKERS, иначе используется пул потоков.
+# run_sized - выносит работу в поток, только если данных больше порога:
+#     для маленьких объемов передача в пул дороже самой работы.
+# =============================================================================
+
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _threads() -> ThreadPoolExecutor:
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(
+            max_workers=settings.offload_thread_workers, thread_name_prefix="offload"
+        )
+    return _thread_pool
+
+
+def _processes() -> Optional[ProcessPoolExecutor]:
+    global _process_pool
+    if _process_pool is None and settings.offload_process_workers > 0:
+        # spawn, а не fork: в воркере уже работают потоки (aiosqlite, пул потоков)
+        _process_pool = ProcessPoolExecutor(
+            max_workers=settings.offload_process_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _process_pool
+
+
+async def run_in_thread(fn: Callable, *args, **kwargs):
+    """Выполняет fn в общем пуле потоков."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_threads(), partial(fn, *args, **kwargs))
+
+
+async def run_cpu_bound(fn: Callable, *args):
+    """
+    Выполняет fn в пуле процессов (если он включен) или в пуле потоков.
+    fn должна быть функцией уровня модуля, аргументы - сериализуемыми pickle.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_processes() or _threads(), partial(fn, *args))
+
+
+async def run_sized(size: int, threshold: int, fn: Callable, *args, **kwargs):
+    """Выполняет fn в пуле потоков, если size >= threshold, иначе сразу в цикле событий."""
+    if size < threshold:
+        return fn(*args, **kwargs)
+    return await run_in_thread(fn, *args, **kwargs)
+
+
+def shutdown() -> None:
+    """Останавливает пулы (событие shutdown)."""
+    global _thread_pool, _process_pool
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False, cancel_futures=True)
+        _thread_pool = None
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
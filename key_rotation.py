@@ -0,0 +1,220 @@
+# File: key_rotation.py
+
+import asyncio
+import sys
+from datetime import datetime
+from typing import Optional
+from cryptography.fernet import InvalidToken
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.future import select
+
+# Импортируем наши собственные модули
+import models
+import security
+import executors
+from database import SessionLocal
+
+# =============================================================================
+# ОНЛАЙН-РОТАЦИЯ КЛЮЧА ШИФРОВАНИЯ OZON
+# Порядок ротации:
+#   1. В OZON_CRYPT_KEY новый ключ ставится первым, старый - через запятую.
+#      После перезапуска новые данные шифруются новым ключом, старые
+#      по-прежнему расшифровываются (MultiFernet в security.py).
+#   2. Запускается перешифровка: POST /admin/key-rotation/ или
+#      `python key_rotation.py [batch_size] [start_after_id]`.
+#   3. Когда задача закончилась без ошибок и failed == 0, старый ключ
+#      убирается из настроек. Строки из failed_ids не расшифровываются ни
+#      одним из ключей - их нужно разобрать вручную (обычно это ключи,
+#      зашифрованные давно удаленным ключом), остальные строки ротация
+#      при этом перешифровывает.
+# Строки обрабатываются пачками по id, каждая пачка пишется отдельной
+# короткой транзакцией, так что долгой блокировки на запись нет.
+# Уже перешифрованные строки пропускаются, поэтому повторный запуск
+# продолжает работу с места остановки.
+# =============================================================================
+
+auth_table = models.ClientOzonAuth.__table__
+
+# Сколько id битых строк хранить в прогрессе; счетчик failed считает все
+MAX_FAILED_IDS = 1000
+
+# Условие по старым значениям защищает от гонки: если ключи клиента обновили,
+# пока пачка перешифровывалась, такая строка не будет перезаписана.
+# updated_at оставляем прежним - содержимое ключей не менялось.
+_ROTATE_STATEMENT = (
+    update(auth_table)
+    .where(
+        auth_table.c.id == bindparam("b_id"),
+        auth_table.c.encrypted_ozon_client_id == bindparam("b_old_client_id"),
+        auth_table.c.encrypted_ozon_api_key == bindparam("b_old_api_key"),
+    )
+    .values(
+        encrypted_ozon_client_id=bindparam("b_new_client_id"),
+        encrypted_ozon_api_key=bindparam("b_new_api_key"),
+        updated_at=auth_table.c.updated_at,
+    )
+)
+
+
+class RotationProgress:
+    """Состояние задачи перешифровки."""
+
+    def __init__(self, start_after_id: int = 0):
+        self.running = False
+        self.total = 0
+        self.processed = 0
+        self.rotated = 0
+        self.skipped = 0
+        self.failed = 0
+        self.failed_ids: list[int] = []
+        self.last_id = start_after_id
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+def _rotate_batch(rows) -> tuple[list[dict], list[int]]:
+    """
+    Перешифровывает пачку строк. Строки, уже зашифрованные основным ключом,
+    пропускаются. Возвращает параметры UPDATE и id строк, которые не
+    расшифровываются ни одним ключом: одна такая строка не должна
+    останавливать ротацию всей таблицы.
+    """
+    updates = []
+    failed = []
+    for row_id, old_client_id, old_api_key in rows:
+        if not (security.needs_rotation(old_client_id) or security.needs_rotation(old_api_key)):
+            continue
+        try:
+            new_client_id = security.rotate_data(old_client_id)
+            new_api_key = security.rotate_data(old_api_key)
+        except InvalidToken:
+            failed.append(row_id)
+            continue
+        updates.append({
+            "b_id": row_id,
+            "b_old_client_id": old_client_id,
+            "b_old_api_key": old_api_key,
+            "b_new_client_id": new_client_id,
+            "b_new_api_key": new_api_key,
+        })
+    return updates, failed
+
+
+async def rotate_ozon_credentials(
+    progress: RotationProgress,
+    batch_size: int = 500,
+    pause_seconds: float = 0.05,
+) -> RotationProgress:
+    """
+    Перешифровывает все записи client_ozon_auth основным ключом, начиная
+    с progress.last_id. Прогресс обновляется после каждой пачки.
+    """
+    progress.running = True
+    progress.started_at = datetime.utcnow()
+    try:
+        async with SessionLocal() as db:
+            progress.total = await db.scalar(
+                select(func.count()).select_from(auth_table).where(auth_table.c.id > progress.last_id)
+            )
+
+        while True:
+            # Чтение пачки - отдельная короткая транзакция
+            async with SessionLocal() as db:
+                result = await db.execute(
+                    select(
+                        auth_table.c.id,
+                        auth_table.c.encrypted_ozon_client_id,
+                        auth_table.c.encrypted_ozon_api_key,
+                    )
+                    .where(auth_table.c.id > progress.last_id)
+                    .order_by(auth_table.c.id)
+                    .limit(batch_size)
+                )
+                rows = result.all()
+            if not rows:
+                break
+
+            # Fernet - CPU-работа, выносим ее из цикла событий (в пул процессов,
+            # если он включен, поэтому передаем простые кортежи)
+            updates, failed = await executors.run_cpu_bound(_rotate_batch, [tuple(row) for row in rows])
+
+            # Запись пачки - вторая короткая транзакция
+            rotated = 0
+            if updates:
+                async with SessionLocal() as db:
+                    conn = await db.connection()
+                    result = await conn.execute(_ROTATE_STATEMENT, updates)
+                    await db.commit()
+                    rotated = result.rowcount if result.rowcount >= 0 else len(updates)
+
+            progress.processed += len(rows)
+            progress.rotated += rotated
+            progress.skipped += len(rows) - rotated - len(failed)
+            progress.failed += len(failed)
+            room = MAX_FAILED_IDS - len(progress.failed_ids)
+            if room > 0:
+                progress.failed_ids.extend(failed[:room])
+            progress.last_id = rows[-1][0]
+
+            # Даем другим запросам забрать блокировку на запись
+            await asyncio.sleep(pause_seconds)
+    except Exception as e:
+        progress.error = str(e)
+        raise
+    finally:
+        progress.running = False
+        progress.finished_at = datetime.utcnow()
+    return progress
+
+
+# --- Фоновая задача для админского эндпоинта ---
+
+current_progress: Optional[RotationProgress] = None
+_current_task: Optional[asyncio.Task] = None
+
+def start_rotation(batch_size: int, start_after_id: int) -> Optional[RotationProgress]:
+    """
+    Запускает перешифровку фоном в текущем процессе.
+    Возвращает None, если задача уже выполняется.
+    """
+    global current_progress, _current_task
+    if current_progress is not None and current_progress.running:
+        return None
+    current_progress = RotationProgress(start_after_id=start_after_id)
+    current_progress.running = True
+    _current_task = asyncio.create_task(
+        rotate_ozon_credentials(current_progress, batch_size=batch_size)
+    )
+    # Ошибка уже записана в progress.error, здесь только забираем исключение
+    _current_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+    return current_progress
+
+
+async def main(batch_size: int, start_after_id: int):
+    print(f"--- Перешифровка ключей Ozon (пачка {batch_size}, с id > {start_after_id}) ---")
+    progress = RotationProgress(start_after_id=start_after_id)
+    task = asyncio.create_task(rotate_ozon_credentials(progress, batch_size=batch_size))
+    while not task.done():
+        await asyncio.sleep(1)
+        print(f"   {progress.processed}/{progress.total}, перешифровано {progress.rotated}, последний id {progress.last_id}")
+    try:
+        await task
+    except Exception as e:
+        print(f"\n❌ ОШИБКА: {e}")
+        print(f"   Продолжить можно так: python key_rotation.py {batch_size} {progress.last_id}")
+        return
+    if progress.failed:
+        print(f"\n⚠️ Не расшифровались ни одним ключом: {progress.failed} строк, id: {progress.failed_ids}")
+        print("   Старый ключ убирать рано - сначала разберите эти строки.")
+        return
+    print(f"\n✅ УСПЕХ: обработано {progress.processed}, перешифровано {progress.rotated}, пропущено {progress.skipped}.")
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        batch_size=int(sys.argv[1]) if len(sys.argv) > 1 else 500,
+        start_after_id=int(sys.argv[2]) if len(sys.argv) > 2 else 0,
+    ))
@@ -0,0 +1,88 @@
+# File: loop_watchdog.py
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+import metrics
+
+# =============================================================================
+# СТОРОЖ ЦИКЛА СОБЫТИЙ
+# Корутина в цикле событий регулярно обновляет отметку времени, а отдельный
+# поток проверяет, что отметка свежая. Если цикл не обновлял ее дольше
+# порога, значит, какой-то обработчик выполняется синхронно и держит все
+# остальные запросы. Поток снимает стек потока цикла событий в этот момент
+# и пишет его в лог "loop_watchdog" - по стеку видно, какой код блокирует.
+# Об одной блокировке сообщается один раз.
+# =============================================================================
+
+logger = logging.getLogger("loop_watchdog")
+
+
+class LoopWatchdog:
+    def __init__(self, threshold_seconds: float):
+        self.threshold = threshold_seconds
+        # Отметка обновляется чаще порога, чтобы точность была около четверти порога
+        self.interval = threshold_seconds / 4
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    async def _beat(self) -> None:
+        while True:
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self) -> None:
+        reported_heartbeat = None
+        while not self._stop.wait(self.interval):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat
+            if stalled < self.threshold + self.interval or heartbeat == reported_heartbeat:
+                continue
+            reported_heartbeat = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "<стек недоступен>\n"
+            metrics.event_loop_blocks_total.inc()
+            logger.warning(
+                "Цикл событий заблокирован уже %.0f мс (порог %.0f мс). Сейчас выполняется:\n%s",
+                stalled * 1000, self.threshold * 1000, stack,
+            )
+
+    def start(self) -> None:
+        """Запускается из цикла событий (событие startup)."""
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._beat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+_watchdog: Optional[LoopWatchdog] = None
+
+
+def start(threshold_ms: int) -> None:
+    """Включает сторожа с порогом threshold_ms; 0 - выключен."""
+    global _watchdog
+    if threshold_ms > 0 and _watchdog is None:
+        _watchdog = LoopWatchdog(threshold_ms / 1000)
+        _watchdog.start()
+
+
+def stop() -> None:
+    global _watchdog
+    if _watchdog is not None:
+        _watchdog.stop()
+        _watchdog = None
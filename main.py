@@ -1,51 +1,82 @@
-from fastapi import Depends, FastAPI, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi import Depends, FastAPI, HTTPException
 from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from jose import JWTError, jwt
-from datetime import timedelta
 from dotenv import load_dotenv
 load_dotenv()
 
 import models
 import schemas
 import database
-import utils
+import migrations
+import metrics
+import db_stats
+import admission
+import profiling
+import executors
+import loop_watchdog
+import server_timing
+import upstream
+import report_jobs
+import stock_sync
+import catalog_sync
+import reference_sync
+import write_coalescer
 import crud
+import security
 from settings import settings
-from routers import permissions, clients, client_permissions, warehouses, ozon_auth, auth, proxy
+from serialization import FastJSONResponse
+from routers import permissions, clients, client_permissions, warehouses, ozon_auth, auth, proxy, key_rotation
+from routers import metrics as metrics_router, profiles, ozon_quota as ozon_quota_router
+from routers import report_jobs as report_jobs_router, artifacts as artifacts_router, stocks, catalog, reference
+from routers import upstream_queue, service_keys as service_keys_router
 
-app = FastAPI()
-
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# Все ответы по умолчанию рендерятся через orjson (см. serialization.py)
+app = FastAPI(default_response_class=FastJSONResponse)
+# Адаптивный лимит запросов к /proxy/* и сброс лишних с 503 (см. admission.py)
+app.add_middleware(admission.AdmissionMiddleware)
+# Метрики Prometheus: время по маршрутам, коды ответов, SQL-запросы на запрос (см. metrics.py)
+app.add_middleware(metrics.MetricsMiddleware)
+# Заголовок Server-Timing с этапами обработки запроса (см. server_timing.py)
+app.add_middleware(server_timing.ServerTimingMiddleware)
+# Профилирование отдельных запросов по заголовку X-Profile (см. profiling.py)
+app.add_middleware(profiling.ProfilingMiddleware)
+db_stats.instrument_engine(database.engine)
 
 # --- Событие при старте приложения ---
 @app.on_event("startup")
 async def on_startup():
-    # Асинхронно создаем таблицы
-    async with database.engine.begin() as conn:
-        await conn.run_sync(models.Base.metadata.create_all)
+    # Таблицы создает и меняет только Alembic (`python migrations.py`).
+    # Здесь лишь сверяем ревизию базы и не стартуем при расхождении.
+    await migrations.check_database_revision(database.engine)
+    metrics.start_loop_lag_monitor()
+    loop_watchdog.start(settings.loop_block_threshold_ms)
+    # Фоновые задачи на отчеты Ozon, в том числе прерванные прошлым запуском
+    report_jobs.start()
+    # Локальная копия остатков клиентов для сводов по нашим складам
+    stock_sync.start()
+    # Локальная копия каталога товаров для поиска по артикулу, SKU и названию
+    catalog_sync.start()
+    # Общая копия справочников Ozon (дерево категорий, характеристики)
+    reference_sync.start()
+
+# --- Событие при остановке приложения ---
+@app.on_event("shutdown")
+async def on_shutdown():
+    await report_jobs.stop()
+    await stock_sync.stop()
+    await catalog_sync.stop()
+    await reference_sync.stop()
+    await write_coalescer.coalescer.close()
+    loop_watchdog.stop()
+    metrics.stop_loop_lag_monitor()
+    await upstream.close_client()
+    executors.shutdown()
 
 # --- Зависимости ---
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm])
-        login: str = payload.get("sub")
-        if login is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(login=login)
-    except JWTError:
-        raise credentials_exception
-    
-    user = await crud.get_user_by_login(db, login=token_data.login)
-    if user is None:
-        raise credentials_exception
+# Проверка токена - в security.get_current_user: тип токена, отзыв по jti,
+# ключи сервисных учетных записей
+async def get_current_user(user: models.User = Depends(security.get_current_user)):
     return user
 
 # --- Эндпоинты ---
@@ -59,6 +90,8 @@ async def create_user_route(user: schemas.ClientCreate, db: AsyncSession = Depen
     if result.scalars().first():
         raise HTTPException(status_code=400, detail="INN already registered")
 
+    # utils тянет за собой лишние зависимости - импортируем только здесь
+    import utils
     return await utils.create_user(db=db, user=user)
 
 @app.get("/users/me/", response_model=schemas.Client)
@@ -77,4 +110,15 @@ app.include_router(client_permissions.router)
 app.include_router(warehouses.router)
 app.include_router(ozon_auth.router)
 app.include_router(auth.router)
-app.include_router(proxy.router)
\ No newline at end of file
+app.include_router(proxy.router)
+app.include_router(key_rotation.router)
+app.include_router(metrics_router.router)
+app.include_router(profiles.router)
+app.include_router(ozon_quota_router.router)
+app.include_router(report_jobs_router.router)
+app.include_router(artifacts_router.router)
+app.include_router(stocks.router)
+app.include_router(catalog.router)
+app.include_router(reference.router)
+app.include_router(upstream_queue.router)
+app.include_router(service_keys_router.router)
\ No newline at end of file
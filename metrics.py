@@ -0,0 +1,316 @@
+# File: metrics.py
+
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable, Optional
+
+import db_stats
+import upstream
+from settings import settings
+
+# =============================================================================
+# МЕТРИКИ В ФОРМАТЕ PROMETHEUS
+# Без внешних зависимостей: счетчики и гистограммы с фиксированными бакетами.
+# Серия (набор значений меток) создается один раз при первом наблюдении,
+# дальше каждое наблюдение - это поиск бакета и пара инкрементов.
+# Метки берутся только из ограниченных множеств: шаблон маршрута (а не сам
+# путь), код ответа, ozon_path уже прошедший проверку прав по справочнику.
+# =============================================================================
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self, lines: list) -> None:
+        lines.append(f"# HELP {self.name} {self.documentation}")
+        lines.append(f"# TYPE {self.name} counter")
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+
+
+class Gauge:
+    """Значение выставляется вручную или вычисляется функцией в момент сбора."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 collect: Optional[Callable[[], dict]] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict = {}
+        self._collect = collect
+
+    def set(self, value: float, labels: tuple = ()) -> None:
+        self._values[labels] = value
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels: tuple = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def render(self, lines: list) -> None:
+        values = self._collect() if self._collect is not None else self._values
+        lines.append(f"# HELP {self.name} {self.documentation}")
+        lines.append(f"# TYPE {self.name} gauge")
+        for labels, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # Серия: счетчики по бакетам (последний - +Inf) и сумма значений
+        self._series: dict = {}
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self, lines: list) -> None:
+        lines.append(f"# HELP {self.name} {self.documentation}")
+        lines.append(f"# TYPE {self.name} histogram")
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                bucket_labels = _format_labels(self.labelnames, labels, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            cumulative += series[-2]
+            bucket_labels = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+
+
+def _collect_pool_usage() -> dict:
+    usage = upstream.pool_usage()
+    if usage is None:
+        return {}
+    total, idle = usage
+    return {("active",): total - idle, ("idle",): idle}
+
+
+# --- HTTP-запросы к приложению ---
+http_requests_in_flight = Gauge("http_requests_in_flight", "Запросы, которые обрабатываются прямо сейчас")
+http_requests_total = Counter("http_requests_total", "Обработанные запросы", ("method", "route", "status"))
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Время обработки запроса", ("method", "route")
+)
+http_request_db_statements = Histogram(
+    "http_request_db_statements", "SQL-запросов на один HTTP-запрос", ("method", "route"), COUNT_BUCKETS
+)
+http_request_db_duration = Histogram(
+    "http_request_db_duration_seconds", "Время в базе данных за один HTTP-запрос", ("method", "route")
+)
+
+# --- База данных ---
+db_statements_total = Counter("db_statements_total", "SQL-запросы, выполненные при обработке HTTP-запросов")
+db_repeated_statements_total = Counter(
+    "db_repeated_statements_total", "Повторы одинакового SQL в одном HTTP-запросе (возможен N+1)", ("method", "route")
+)
+
+# --- Запросы в Ozon ---
+ozon_requests_total = Counter("ozon_upstream_requests_total", "Запросы в Ozon", ("ozon_path", "status"))
+ozon_requests_in_flight = Gauge("ozon_upstream_requests_in_flight", "Запросы в Ozon, ожидающие ответа")
+ozon_connect_duration = Histogram(
+    "ozon_upstream_connect_seconds", "Установка соединения с Ozon (0 при повторном использовании)", ("ozon_path",)
+)
+ozon_response_duration = Histogram(
+    "ozon_upstream_response_seconds", "Ответ Ozon после установки соединения", ("ozon_path",)
+)
+httpx_pool_connections = Gauge(
+    "httpx_pool_connections", "Соединения в пуле общего HTTP-клиента", ("state",), collect=_collect_pool_usage
+)
+upstream_scheduler_active = Gauge(
+    "upstream_scheduler_active", "Запросы в Ozon, получившие слот очереди", ("contract_status",)
+)
+upstream_scheduler_waiting = Gauge(
+    "upstream_scheduler_waiting", "Запросы в Ozon, ожидающие слот очереди", ("contract_status",)
+)
+upstream_scheduler_wait = Histogram(
+    "upstream_scheduler_wait_seconds", "Ожидание слота очереди запросов в Ozon", ("contract_status",)
+)
+
+# --- Допуск запросов в прокси (admission.py) ---
+admission_limit = Gauge("proxy_admission_limit", "Текущий адаптивный лимит одновременных запросов прокси")
+admission_in_flight = Gauge("proxy_admission_in_flight", "Запросы прокси, допущенные в обработку")
+admission_queued = Gauge("proxy_admission_queued", "Запросы прокси в очереди на допуск")
+admission_rejected_total = Counter(
+    "proxy_admission_rejected_total", "Запросы прокси, сброшенные с 503", ("reason",)
+)
+
+# --- Цикл событий ---
+event_loop_lag = Gauge("event_loop_lag_seconds", "Последняя измеренная задержка цикла событий")
+event_loop_lag_histogram = Histogram("event_loop_lag_distribution_seconds", "Задержка цикла событий")
+event_loop_blocks_total = Counter("event_loop_blocks_total", "Блокировки цикла событий дольше порога (loop_watchdog.py)")
+
+REGISTRY = (
+    http_requests_in_flight, http_requests_total, http_request_duration,
+    http_request_db_statements, http_request_db_duration,
+    db_statements_total, db_repeated_statements_total,
+    ozon_requests_total, ozon_requests_in_flight, ozon_connect_duration, ozon_response_duration,
+    httpx_pool_connections,
+    upstream_scheduler_active, upstream_scheduler_waiting, upstream_scheduler_wait,
+    admission_limit, admission_in_flight, admission_queued, admission_rejected_total,
+    event_loop_lag, event_loop_lag_histogram, event_loop_blocks_total,
+)
+
+
+def render() -> str:
+    """Текст для эндпоинта /metrics в формате Prometheus."""
+    lines: list = []
+    for metric in REGISTRY:
+        metric.render(lines)
+    lines.append("")
+    return "\n".join(lines)
+
+
+# =============================================================================
+# СБОР
+# =============================================================================
+
+logger = logging.getLogger("db_stats")
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware: время обработки по шаблону маршрута, коды ответов,
+    число запросов в работе, SQL-запросы и время в базе на один HTTP-запрос
+    (см. db_stats.py). Повторы одинакового SQL пишутся в лог "db_stats",
+    а при DB_DEBUG_HEADERS=true статистика отдается в заголовках X-DB-*.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        stats = None
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if settings.db_debug_headers:
+                    message["headers"] = list(message.get("headers", [])) + db_stats.debug_headers(stats)
+            await send(message)
+
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            with db_stats.track() as stats:
+                await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_flight.dec()
+            route = scope.get("route")
+            labels = (scope["method"], getattr(route, "path", "<unmatched>"))
+            http_request_duration.observe(elapsed, labels)
+            http_requests_total.inc(labels + (status_code,))
+            if stats is not None:
+                http_request_db_statements.observe(stats.count, labels)
+                http_request_db_duration.observe(stats.seconds, labels)
+                db_statements_total.inc(amount=stats.count)
+                repeated = stats.repeated()
+                if repeated:
+                    db_repeated_statements_total.inc(labels, sum(n - 1 for n in repeated.values()))
+                    logger.warning("Повторяющиеся SQL-запросы в %s %s\n%s", *labels, stats.summary())
+
+
+class UpstreamTimer:
+    """
+    Делит время запроса в Ozon на установку соединения и ответ.
+    Передается в httpx как extensions={"trace": timer.trace}.
+    """
+    __slots__ = ("ozon_path", "started", "connect_started", "connect_seconds")
+
+    def __init__(self, ozon_path: str):
+        self.ozon_path = ozon_path
+        self.started = 0.0
+        self.connect_started = 0.0
+        self.connect_seconds = 0.0
+
+    async def trace(self, event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.started":
+            self.connect_started = time.perf_counter()
+        elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            self.connect_seconds = time.perf_counter() - self.connect_started
+
+    def __enter__(self):
+        ozon_requests_in_flight.inc()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ozon_requests_in_flight.dec()
+        return False
+
+    def record(self, status) -> None:
+        """Записывает итог запроса: код ответа Ozon или 'error' при сетевой ошибке."""
+        total = time.perf_counter() - self.started
+        labels = (self.ozon_path,)
+        ozon_requests_total.inc((self.ozon_path, status))
+        ozon_connect_duration.observe(self.connect_seconds, labels)
+        ozon_response_duration.observe(total - self.connect_seconds, labels)
+
+
+# --- Задержка цикла событий ---
+_loop_lag_task: Optional[asyncio.Task] = None
+
+
+async def _watch_loop_lag(interval: float) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        event_loop_lag.set(lag)
+        event_loop_lag_histogram.observe(lag)
+
+
+def start_loop_lag_monitor(interval: float = 0.5) -> None:
+    """Запускает фоновое измерение задержки цикла событий (событие startup)."""
+    global _loop_lag_task
+    if _loop_lag_task is None:
+        _loop_lag_task = asyncio.create_task(_watch_loop_lag(interval))
+
+
+def stop_loop_lag_monitor() -> None:
+    global _loop_lag_task
+    if _loop_lag_task is not None:
+        _loop_lag_task.cancel()
+        _loop_lag_task = None
@@ -0,0 +1,76 @@
+# File: migrations.py
+
+import re
+from pathlib import Path
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# =============================================================================
+# МИГРАЦИИ И ПРОВЕРКА СХЕМЫ ПРИ СТАРТЕ
+# Схему меняет только Alembic, и запускается он один раз отдельной командой:
+#     python migrations.py
+# Воркеры при старте лишь сверяют ревизию в базе с головной ревизией
+# миграций и не стартуют при расхождении.
+# =============================================================================
+
+BASE_DIR = Path(__file__).resolve().parent
+VERSIONS_DIR = BASE_DIR / "alembic" / "versions"
+
+_REVISION_RE = re.compile(r"^revision\s*(?::[^=]+)?=\s*['\"]([0-9a-f]+)['\"]", re.MULTILINE)
+_DOWN_REVISION_RE = re.compile(r"^down_revision\s*(?::[^=]+)?=\s*(.+)$", re.MULTILINE)
+
+
+def expected_heads() -> set[str]:
+    """
+    Возвращает головные ревизии миграций. Файлы миграций читаются как текст:
+    импорт alembic и его ScriptDirectory стоит сотни миллисекунд на каждый воркер.
+    """
+    revisions, parents = set(), set()
+    for path in VERSIONS_DIR.glob("*.py"):
+        source = path.read_text(encoding="utf-8")
+        revision = _REVISION_RE.search(source)
+        if revision is None:
+            continue
+        revisions.add(revision.group(1))
+        down_revision = _DOWN_REVISION_RE.search(source)
+        if down_revision is not None:
+            parents.update(re.findall(r"['\"]([0-9a-f]+)['\"]", down_revision.group(1)))
+    return revisions - parents
+
+
+async def check_database_revision(engine: AsyncEngine) -> None:
+    """
+    Сверяет ревизию базы (таблица alembic_version) с миграциями.
+    При расхождении выбрасывает RuntimeError, чтобы воркер не стартовал.
+    """
+    expected = expected_heads()
+    try:
+        async with engine.connect() as conn:
+            result = await conn.execute(text("SELECT version_num FROM alembic_version"))
+            current = {row[0] for row in result}
+    except DBAPIError:
+        # Таблицы alembic_version нет - миграции в эту базу не применялись
+        current = set()
+
+    if current != expected:
+        # Закрываем соединения пула: поток aiosqlite иначе не даст процессу завершиться
+        await engine.dispose()
+        raise RuntimeError(
+            f"Схема базы данных не соответствует миграциям: в базе {sorted(current) or 'нет ревизии'}, "
+            f"ожидается {sorted(expected)}. Примените миграции командой `python migrations.py`."
+        )
+
+
+def upgrade_to_head() -> None:
+    """Применяет все миграции. Alembic импортируется только здесь."""
+    from alembic import command
+    from alembic.config import Config
+
+    command.upgrade(Config(str(BASE_DIR / "alembic.ini")), "head")
+
+
+if __name__ == "__main__":
+    print("--- Применение миграций ---")
+    upgrade_to_head()
+    print("--- Миграции применены ---")
@@ -1,12 +1,16 @@
 from sqlalchemy import (
     Column,
     Integer,
+    BigInteger,
     String,
     Boolean,
     ForeignKey,
     DateTime,
+    Index,
+    JSON,
     Enum as SQLAlchemyEnum,
 )
+from sqlalchemy import DDL, event
 from sqlalchemy.orm import relationship, declarative_base
 from datetime import datetime
 import enum
@@ -19,6 +23,13 @@ class ContractStatus(enum.Enum):
     pending = "pending"
     active = "active"
 
+# Статус фоновой задачи на отчет Ozon
+class ReportJobStatus(enum.Enum):
+    pending = "pending"        # ждет очереди или следующего опроса
+    running = "running"        # воркер выполняет шаг задачи
+    succeeded = "succeeded"    # файл отчета скачан
+    failed = "failed"
+
 # --- МОДЕЛЬ USER ---
 class User(Base):
     __tablename__ = "users"
@@ -88,6 +99,10 @@ class OurWarehouse(Base):
 # Связка: какое право выдал какой клиент
 class ClientPermission(Base):
     __tablename__ = "client_permissions"
+    __table_args__ = (
+        # Одно право назначается клиенту не более одного раза
+        Index("ix_client_permissions_client_id_permission_id", "client_id", "permission_id", unique=True),
+    )
     id = Column(Integer, primary_key=True)
     client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
     permission_id = Column(Integer, ForeignKey("permissions.id"), nullable=False)
@@ -99,9 +114,13 @@ class ClientPermission(Base):
 # Модель для хранения складов клиента
 class ClientWarehouse(Base):
     __tablename__ = "client_warehouses"
+    __table_args__ = (
+        # Склад Ozon привязывается у клиента только к одному нашему складу
+        Index("ix_client_warehouses_client_id_mp_warehouse_id", "client_id", "mp_warehouse_id", unique=True),
+    )
     id = Column(Integer, primary_key=True)
     client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
-    mp_warehouse_id = Column(String, nullable=False)         # ID склада из Ozon
+    mp_warehouse_id = Column(String, nullable=False, index=True)  # ID склада из Ozon
 
     # Внешний ключ, ссылающийся на наш справочник
     our_warehouse_id = Column(Integer, ForeignKey("our_warehouses.id"), nullable=False)
@@ -110,3 +129,214 @@ class ClientWarehouse(Base):
     client = relationship("Client", back_populates="warehouses")
     our_warehouse = relationship("OurWarehouse", back_populates="client_warehouses")
 
+
+# Фоновая задача на отчет Ozon: создать -> опрашивать -> скачать (см. report_jobs.py)
+class ReportJob(Base):
+    __tablename__ = "report_jobs"
+    __table_args__ = (
+        # Воркеры выбирают задачи, у которых подошло время следующего шага
+        Index("ix_report_jobs_status_next_run_at", "status", "next_run_at"),
+    )
+    id = Column(Integer, primary_key=True)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False, index=True)
+    method = Column(String, nullable=False)                  # метод Ozon, создающий отчет
+    params = Column(JSON, nullable=False, default=dict)      # тело запроса на создание
+    status = Column(SQLAlchemyEnum(ReportJobStatus), nullable=False, default=ReportJobStatus.pending)
+    report_code = Column(String, nullable=True)              # код отчета в Ozon
+    attempts = Column(Integer, nullable=False, default=0)    # опросов статуса
+    errors = Column(Integer, nullable=False, default=0)      # временных ошибок подряд
+    next_run_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = Column(DateTime, nullable=True)           # аренда задачи воркером
+    file_name = Column(String, nullable=True)
+    file_size = Column(Integer, nullable=True)               # размер без сжатия
+    file_sha256 = Column(String, nullable=True)              # файл в хранилище artifacts.py
+    file_encoding = Column(String, nullable=True)            # "gzip" или None
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    client = relationship("Client")
+
+# Остатки клиента на складах Ozon: локальная копия, которую обновляет stock_sync.py
+class StockSnapshot(Base):
+    __tablename__ = "stock_snapshots"
+    __table_args__ = (
+        # Одна строка на товар клиента на складе Ozon
+        Index("ix_stock_snapshots_client_id_sku_mp_warehouse_id", "client_id", "sku", "mp_warehouse_id", unique=True),
+        # Свод по нашим складам соединяется с client_warehouses по (client_id, mp_warehouse_id);
+        # остатки в индексе, чтобы свод читал только его
+        Index("ix_stock_snapshots_rollup", "client_id", "mp_warehouse_id", "sku", "present", "reserved"),
+    )
+    id = Column(Integer, primary_key=True)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    sku = Column(BigInteger, nullable=False)
+    mp_warehouse_id = Column(String, nullable=False)          # ID склада из Ozon
+    offer_id = Column(String, nullable=True)                  # артикул продавца
+    warehouse_name = Column(String, nullable=True)
+    present = Column(Integer, nullable=False, default=0)
+    reserved = Column(Integer, nullable=False, default=0)
+    generation = Column(Integer, nullable=False)              # проход синхронизации, в котором строка получена
+    synced_at = Column(DateTime, default=datetime.utcnow)
+
+# Состояние синхронизации остатков клиента (stock_sync.py)
+class StockSyncState(Base):
+    __tablename__ = "stock_sync_state"
+    client_id = Column(Integer, ForeignKey("clients.id"), primary_key=True)
+    generation = Column(Integer, nullable=False, default=1)   # номер текущего прохода
+    cursor = Column(String, nullable=True)                    # курсор Ozon внутри прохода
+    rows = Column(Integer, nullable=False, default=0)         # строк после последнего прохода
+    next_run_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = Column(DateTime, nullable=True)            # аренда воркером
+    last_synced_at = Column(DateTime, nullable=True)
+    error = Column(String, nullable=True)
+
+# Товары клиента: локальная копия каталога Ozon, которую обновляет catalog_sync.py
+class CatalogProduct(Base):
+    __tablename__ = "catalog_products"
+    __table_args__ = (
+        Index("ix_catalog_products_client_id_product_id", "client_id", "product_id", unique=True),
+        # Поиск по артикулу и SKU идет по всем клиентам сразу
+        Index("ix_catalog_products_offer_id", "offer_id"),
+        Index("ix_catalog_products_sku", "sku"),
+    )
+    id = Column(Integer, primary_key=True)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    product_id = Column(BigInteger, nullable=False)           # ID товара в Ozon
+    offer_id = Column(String, nullable=False)                 # артикул продавца
+    sku = Column(BigInteger, nullable=True)
+    name = Column(String, nullable=False, default="")
+    archived = Column(Boolean, nullable=False, default=False)
+    ozon_updated_at = Column(DateTime, nullable=True)         # время изменения карточки в Ozon
+    generation = Column(Integer, nullable=False)              # проход синхронизации, в котором строка получена
+    synced_at = Column(DateTime, default=datetime.utcnow)
+
+# Полнотекстовый индекс SQLite FTS5 по названиям товаров. Индекс хранит только
+# токены (content=catalog_products) и обновляется триггерами. Миграция
+# a1f5c7e2b846 создает то же самое; здесь - для metadata.create_all().
+# unicode61 не приравнивает "ё" к "е": индексируем название с заменой
+# (crud.catalog_match_expression делает ту же замену в запросе)
+_FTS_NAME = "replace(replace({}.name, 'ё', 'е'), 'Ё', 'Е')"
+CATALOG_FTS_DDL = (
+    "CREATE VIRTUAL TABLE catalog_products_fts USING fts5("
+    "name, content='catalog_products', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER catalog_products_fts_insert AFTER INSERT ON catalog_products BEGIN "
+    f"INSERT INTO catalog_products_fts(rowid, name) VALUES (new.id, {_FTS_NAME.format('new')}); END",
+    "CREATE TRIGGER catalog_products_fts_delete AFTER DELETE ON catalog_products BEGIN "
+    f"INSERT INTO catalog_products_fts(catalog_products_fts, rowid, name) VALUES ('delete', old.id, {_FTS_NAME.format('old')}); END",
+    "CREATE TRIGGER catalog_products_fts_update AFTER UPDATE OF name ON catalog_products BEGIN "
+    f"INSERT INTO catalog_products_fts(catalog_products_fts, rowid, name) VALUES ('delete', old.id, {_FTS_NAME.format('old')}); "
+    f"INSERT INTO catalog_products_fts(rowid, name) VALUES (new.id, {_FTS_NAME.format('new')}); END",
+)
+for _statement in CATALOG_FTS_DDL:
+    event.listen(CatalogProduct.__table__, "after_create", DDL(_statement))
+
+# Состояние синхронизации каталога клиента (catalog_sync.py)
+class CatalogSyncState(Base):
+    __tablename__ = "catalog_sync_state"
+    client_id = Column(Integer, ForeignKey("clients.id"), primary_key=True)
+    generation = Column(Integer, nullable=False, default=1)   # номер текущего прохода
+    cursor = Column(String, nullable=True)                    # last_id Ozon внутри прохода
+    rows = Column(Integer, nullable=False, default=0)         # товаров после последнего прохода
+    next_run_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = Column(DateTime, nullable=True)            # аренда воркером
+    last_synced_at = Column(DateTime, nullable=True)
+    error = Column(String, nullable=True)
+
+# --- Справочники Ozon: дерево категорий и характеристики (reference_sync.py) ---
+# Одинаковы для всех продавцов, поэтому хранятся один раз, без client_id.
+
+# Категория дерева Ozon; id - description_category_id
+class OzonCategory(Base):
+    __tablename__ = "ozon_categories"
+    id = Column(Integer, primary_key=True)
+    parent_id = Column(Integer, nullable=True, index=True)    # None - корень дерева
+    name = Column(String, nullable=False)
+    disabled = Column(Boolean, nullable=False, default=False)  # создавать товары нельзя
+    generation = Column(Integer, nullable=False)              # проход обновления, в котором получена
+
+# Тип товара - лист дерева внутри категории
+class OzonCategoryType(Base):
+    __tablename__ = "ozon_category_types"
+    __table_args__ = (
+        Index("ix_ozon_category_types_category_id_type_id", "description_category_id", "type_id", unique=True),
+    )
+    id = Column(Integer, primary_key=True)
+    description_category_id = Column(Integer, nullable=False)
+    type_id = Column(Integer, nullable=False)
+    name = Column(String, nullable=False)
+    disabled = Column(Boolean, nullable=False, default=False)
+    generation = Column(Integer, nullable=False)
+
+# Характеристика товара; id - ID характеристики Ozon
+class OzonAttribute(Base):
+    __tablename__ = "ozon_attributes"
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    description = Column(String, nullable=True)
+    type = Column(String, nullable=True)                      # String, Integer, Decimal, Boolean, URL...
+    is_collection = Column(Boolean, nullable=False, default=False)
+    dictionary_id = Column(Integer, nullable=False, default=0)  # 0 - значения без справочника
+    generation = Column(Integer, nullable=False)
+
+# Характеристика в типе товара: обязательность и группа зависят от типа
+class OzonTypeAttribute(Base):
+    __tablename__ = "ozon_type_attributes"
+    __table_args__ = (
+        Index(
+            "ix_ozon_type_attributes_category_id_type_id_attribute_id",
+            "description_category_id", "type_id", "attribute_id", unique=True,
+        ),
+        Index("ix_ozon_type_attributes_attribute_id", "attribute_id"),
+    )
+    id = Column(Integer, primary_key=True)
+    description_category_id = Column(Integer, nullable=False)
+    type_id = Column(Integer, nullable=False)
+    attribute_id = Column(Integer, ForeignKey("ozon_attributes.id"), nullable=False)
+    is_required = Column(Boolean, nullable=False, default=False)
+    is_aspect = Column(Boolean, nullable=False, default=False)
+    category_dependent = Column(Boolean, nullable=False, default=False)  # значения справочника зависят от категории
+    group_id = Column(Integer, nullable=True)
+    group_name = Column(String, nullable=True)
+    max_value_count = Column(Integer, nullable=True)
+    generation = Column(Integer, nullable=False)
+
+    attribute = relationship("OzonAttribute", lazy="joined", innerjoin=True)
+
+# Состояние обновления справочников: одна строка (id = 1)
+class ReferenceSyncState(Base):
+    __tablename__ = "reference_sync_state"
+    id = Column(Integer, primary_key=True)
+    generation = Column(Integer, nullable=False, default=1)   # номер текущего прохода
+    cursor = Column(String, nullable=True)                    # None - дерево еще не получено в проходе
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=True)  # чьими ключами обновляем
+    types = Column(Integer, nullable=False, default=0)        # типов товаров после последнего прохода
+    attributes = Column(Integer, nullable=False, default=0)
+    next_run_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = Column(DateTime, nullable=True)            # аренда воркером
+    last_synced_at = Column(DateTime, nullable=True)
+    error = Column(String, nullable=True)
+
+# Ключ сервисной учетной записи для машинных клиентов (service_keys.py).
+# Сам ключ не хранится: только открытая часть для поиска и HMAC всего ключа.
+class ServiceAccountKey(Base):
+    __tablename__ = "service_account_keys"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)  # от чьего имени работает ключ
+    name = Column(String, nullable=False)
+    key_prefix = Column(String, unique=True, nullable=False)
+    key_hash = Column(String, nullable=False)                 # HMAC-SHA256 ключа, hex
+    created_at = Column(DateTime, default=datetime.utcnow)
+    revoked_at = Column(DateTime, nullable=True)              # отозван: ключ больше не принимается
+
+# Отозванный JWT (token_denylist.py): строка живет, пока не истечет сам токен
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+    # Воркеры дочитывают таблицу по id > последнего прочитанного (token_denylist.py):
+    # без AUTOINCREMENT SQLite выдает id удаленной последней строки повторно
+    __table_args__ = {"sqlite_autoincrement": True}
+    id = Column(Integer, primary_key=True)
+    jti = Column(String, unique=True, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)  # срок самого токена (UTC)
+    revoked_at = Column(DateTime, default=datetime.utcnow)
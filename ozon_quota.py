@@ -0,0 +1,186 @@
+# File: ozon_quota.py
+
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Optional
+
+from settings import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: учет ведется только в пределах процесса
+    fcntl = None
+
+# =============================================================================
+# ОБЩИЙ ДЛЯ ВОРКЕРОВ УЧЕТ ЗАПРОСОВ В OZON
+# Воркеры `uvicorn --workers N` на одном сервере ведут счетчики в одном
+# файле, отображенном в память (settings.ozon_quota_file). Файл - это
+# хеш-таблица с открытой адресацией: слот = (клиент, метод, окно, счетчик).
+# Для каждого запроса учитываются два счетчика: клиента в целом (метод "")
+# и клиента по методу. Окно фиксированное: settings.ozon_quota_window_seconds.
+# Проверка и увеличение обоих счетчиков выполняются под блокировкой файла
+# (fcntl.lockf), это несколько микросекунд и никаких внешних сервисов.
+# Слоты прошлых окон переиспользуются. Если свободного слота не нашлось,
+# запрос пропускается без учета: ограничение не должно ронять прокси.
+# Раскладка (версия формата и число слотов) входит в имя файла: воркеры с
+# другими настройками, например во время выкладки, открывают свой файл, а не
+# обрезают чужой - ftruncate отображенного файла роняет другие процессы
+# по SIGBUS.
+# =============================================================================
+
+_MAGIC = b"OZQ1"
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sI")              # магия, число слотов
+# client_id, номер окна, счетчик, длина имени метода, имя метода
+_SLOT = struct.Struct("<QQIH2x96s")
+_METHOD_BYTES = 96
+_MAX_PROBES = 64
+
+SELLER = ""  # "метод" для общего счетчика клиента
+
+
+def layout_path(path: str, slots: int) -> str:
+    """Имя файла для раскладки: ozon_quota.bin -> ozon_quota.v1-4096.bin."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.v{_FORMAT_VERSION}-{slots}{ext}"
+
+
+class QuotaStore:
+    def __init__(self, path: str, slots: int, window_seconds: int):
+        self.slots = slots
+        self.window_seconds = window_seconds
+        self.path = layout_path(path, slots)
+        self._thread_lock = threading.Lock()
+        size = _HEADER.size + slots * _SLOT.size
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        foreign_layout = False
+        with self._locked():
+            header = os.pread(self._fd, _HEADER.size, 0)
+            if len(header) < _HEADER.size or _HEADER.unpack(header)[0] != _MAGIC:
+                # Новый или недописанный файл: заголовок пишется последним,
+                # так что отобразить такой файл еще никто не мог
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, _HEADER.pack(_MAGIC, slots), 0)
+            elif _HEADER.unpack(header)[1] != slots or os.fstat(self._fd).st_size != size:
+                # Рабочая таблица другой раскладки: ее могут держать другие
+                # воркеры, пересоздавать нельзя
+                foreign_layout = True
+        if foreign_layout:
+            os.close(self._fd)
+            raise RuntimeError(
+                f"{self.path}: раскладка файла не совпадает с настройками "
+                f"({slots} слотов), удалите файл при остановленных воркерах"
+            )
+        self._map = mmap.mmap(self._fd, size)
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            if fcntl is not None:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def _offset(self, index: int) -> int:
+        return _HEADER.size + index * _SLOT.size
+
+    def _find_slot(self, client_id: int, method: bytes, window: int,
+                   exclude: Optional[int] = None) -> Optional[tuple[int, int]]:
+        """
+        Ищет слот ключа. Возвращает (смещение, счетчик в текущем окне)
+        или None, если таблица переполнена. Слот exclude уже занят другим
+        ключом этого же запроса, хотя еще не записан.
+        """
+        start = zlib.crc32(b"%d:%s" % (client_id, method)) % self.slots
+        reusable = None
+        for probe in range(min(_MAX_PROBES, self.slots)):
+            offset = self._offset((start + probe) % self.slots)
+            if offset == exclude:
+                continue
+            slot_client, slot_window, count, length, name = _SLOT.unpack_from(self._map, offset)
+            if length == 0 and slot_client == 0:
+                # Пустой слот: дальше этого ключа точно нет
+                return (reusable if reusable is not None else offset), 0
+            if slot_client == client_id and name[:length] == method:
+                return offset, (count if slot_window == window else 0)
+            if reusable is None and slot_window != window:
+                reusable = offset
+        return (reusable, 0) if reusable is not None else None
+
+    def acquire(self, client_id: int, method: str, seller_limit: int, method_limit: int) -> Optional[float]:
+        """
+        Учитывает запрос клиента к методу. Возвращает None, если лимиты
+        позволяют, иначе - через сколько секунд начнется новое окно.
+        Лимит 0 - без ограничения (запрос все равно учитывается).
+        """
+        now = time.time()
+        window = int(now // self.window_seconds)
+        method_key = method.encode()[:_METHOD_BYTES]
+        with self._locked():
+            seller = self._find_slot(client_id, SELLER.encode(), window)
+            per_method = self._find_slot(client_id, method_key, window, exclude=seller and seller[0])
+            if seller is None or per_method is None:
+                return None
+            if (seller_limit and seller[1] >= seller_limit) or (method_limit and per_method[1] >= method_limit):
+                return (window + 1) * self.window_seconds - now
+            for (offset, count), key in ((seller, b""), (per_method, method_key)):
+                _SLOT.pack_into(self._map, offset, client_id, window, count + 1, len(key), key)
+        return None
+
+    def usage(self, client_id: Optional[int] = None) -> list[dict]:
+        """Счетчики текущего окна (все или одного клиента)."""
+        now = time.time()
+        window = int(now // self.window_seconds)
+        rows = []
+        with self._locked():
+            for index in range(self.slots):
+                slot_client, slot_window, count, length, name = _SLOT.unpack_from(self._map, self._offset(index))
+                if slot_window != window or (client_id is not None and slot_client != client_id):
+                    continue
+                rows.append({"client_id": slot_client, "method": name[:length].decode(errors="replace"), "used": count})
+        resets_in = (window + 1) * self.window_seconds - now
+        for row in rows:
+            row["resets_in_seconds"] = round(resets_in, 3)
+        return sorted(rows, key=lambda row: (row["client_id"], row["method"]))
+
+
+_store: Optional[QuotaStore] = None
+
+
+def get_store() -> QuotaStore:
+    """Хранилище открывается при первом обращении - уже в процессе воркера."""
+    global _store
+    if _store is None:
+        _store = QuotaStore(settings.ozon_quota_file, settings.ozon_quota_slots, settings.ozon_quota_window_seconds)
+    return _store
+
+
+def acquire(client_id: int, method: str) -> Optional[float]:
+    """Проверка перед запросом в Ozon: None - можно, иначе секунды до нового окна."""
+    return get_store().acquire(
+        client_id, method, settings.ozon_quota_per_client, settings.ozon_quota_per_method
+    )
+
+
+def headroom(client_id: Optional[int] = None) -> list[dict]:
+    """Использование и остаток лимитов в текущем окне."""
+    rows = get_store().usage(client_id)
+    for row in rows:
+        if row["method"] == SELLER:
+            # Общий счетчик клиента отдаем с method = None
+            row["method"] = None
+            limit = settings.ozon_quota_per_client
+        else:
+            limit = settings.ozon_quota_per_method
+        row["limit"] = limit or None
+        row["remaining"] = max(0, limit - row["used"]) if limit else None
+    return rows
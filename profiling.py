@@ -0,0 +1,185 @@
+# File: profiling.py
+
+import asyncio
+import cProfile
+import io
+import json
+import pstats
+import re
+import time
+from datetime import datetime, timezone
+from itertools import count
+from pathlib import Path
+from typing import Optional
+
+# Импортируем наши собственные модули
+import crud
+import security
+import service_keys
+import token_denylist
+from database import SessionLocal
+from settings import settings
+
+# =============================================================================
+# ПРОФИЛИРОВАНИЕ ОТДЕЛЬНОГО ЗАПРОСА ПО ЗАПРОСУ СУПЕРПОЛЬЗОВАТЕЛЯ
+# Запрос с заголовком `X-Profile: 1` и токеном суперпользователя выполняется
+# под cProfile. Профиль (формат pstats) сохраняется в каталог
+# settings.profile_dir, в ответе приходит его номер в заголовке X-Profile-Id.
+# Скачать профиль: GET /admin/profiles/{id} (файл .prof для snakeviz/pstats)
+# или GET /admin/profiles/{id}?format=text (топ функций текстом).
+# В каталоге хранятся только последние settings.profile_ring_size профилей.
+#
+# Запросы без заголовка проходят мимо: проверяется только список заголовков.
+# cProfile видит весь поток, поэтому в профиль попадут и корутины других
+# запросов, выполнявшихся в это время. Одновременно профилируется один запрос,
+# остальные получают X-Profile-Status: busy.
+# =============================================================================
+
+_PROFILE_ID_RE = re.compile(r"^[0-9]{20,}$")
+_sequence = count()
+_active = False
+
+
+def _profile_dir() -> Path:
+    return Path(settings.profile_dir)
+
+
+def _new_profile_id() -> str:
+    # Время до микросекунд и счетчик процесса: номера упорядочены по времени
+    return datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S%f") + f"{next(_sequence) % 1000:03d}"
+
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+async def _is_superuser(scope) -> bool:
+    """Проверяет токен из Authorization: только суперпользователь может профилировать."""
+    authorization = _header(scope, b"authorization")
+    if not authorization or not authorization.lower().startswith(b"bearer "):
+        return False
+    token = authorization[7:].decode("latin-1")
+    if service_keys.is_service_key(token):
+        async with SessionLocal() as db:
+            user = await service_keys.authenticate(db, token)
+        return bool(user and user.is_superuser)
+    # Та же проверка, что в security.get_current_user: тип токена и отзыв по jti
+    payload = security.decode_token(token)
+    if payload is None:
+        return False
+    async with SessionLocal() as db:
+        if await token_denylist.is_revoked(db, payload.get("jti")):
+            return False
+        user = await crud.get_user_by_login(db, login=payload["sub"])
+    return bool(user and user.is_superuser)
+
+
+def _save_profile(profiler: cProfile.Profile, profile_id: str, meta: dict) -> None:
+    """Пишет профиль и описание к нему, затем удаляет самые старые сверх лимита."""
+    directory = _profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(directory / f"{profile_id}.prof")
+    (directory / f"{profile_id}.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+    profiles = sorted(directory.glob("*.prof"))
+    for old in profiles[:max(0, len(profiles) - settings.profile_ring_size)]:
+        old.unlink(missing_ok=True)
+        old.with_suffix(".json").unlink(missing_ok=True)
+
+
+class ProfilingMiddleware:
+    """ASGI-middleware: профилирует запросы с заголовком X-Profile от суперпользователя."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _header(scope, b"x-profile") is None:
+            await self.app(scope, receive, send)
+            return
+
+        global _active
+        status_value = None
+        if _active:
+            status_value = b"busy"
+        elif not await _is_superuser(scope):
+            status_value = b"forbidden"
+        elif _active:
+            # Пока проверялся токен, профилирование успел занять другой запрос
+            status_value = b"busy"
+        else:
+            # Проверка и захват в одном синхронном шаге, без await между ними
+            _active = True
+
+        if status_value is not None:
+            async def send_with_status(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-profile-status", status_value)]
+                await send(message)
+
+            await self.app(scope, receive, send_with_status)
+            return
+
+        profile_id = _new_profile_id()
+        status_code = 500
+
+        async def send_with_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.disable()
+            _active = False
+            meta = {
+                "id": profile_id,
+                "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            }
+            await asyncio.to_thread(_save_profile, profiler, profile_id, meta)
+
+
+# --- Чтение профилей для админского эндпоинта ---
+
+def list_profiles() -> list[dict]:
+    """Описания сохраненных профилей, новые первыми."""
+    directory = _profile_dir()
+    if not directory.is_dir():
+        return []
+    profiles = []
+    for meta_path in sorted(directory.glob("*.json"), reverse=True):
+        try:
+            profiles.append(json.loads(meta_path.read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            # Файл мог быть удален из кольца между glob и чтением
+            continue
+    return profiles
+
+
+def profile_path(profile_id: str) -> Optional[Path]:
+    """Путь к файлу профиля или None, если такого профиля нет."""
+    if not _PROFILE_ID_RE.match(profile_id):
+        return None
+    path = _profile_dir() / f"{profile_id}.prof"
+    return path if path.is_file() else None
+
+
+def profile_text(path: Path, limit: int = 50) -> str:
+    """Топ функций профиля по суммарному времени, как в `python -m pstats`."""
+    output = io.StringIO()
+    stats = pstats.Stats(str(path), stream=output)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+    return output.getvalue()
@@ -0,0 +1,255 @@
+# File: reference_cache.py
+
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from serialization import dumps
+from settings import settings
+
+# =============================================================================
+# БЫСТРОЕ ЧТЕНИЕ СПРАВОЧНИКОВ
+# Справочники читаются постоянно, а меняются редко. Вместо ORM-объектов,
+# identity map и валидации Pydantic на каждую строку берем простые колонки
+# через Core select, держим строки в памяти процесса и отдаем готовый JSON.
+# Снимок сбрасывают эндпоинты, которые меняют соответствующие таблицы.
+# =============================================================================
+
+# Колонки перечислены в том же порядке, что и поля схем ответа
+OUR_WAREHOUSE_COLUMNS = (
+    models.OurWarehouse.name,
+    models.OurWarehouse.address,
+    models.OurWarehouse.sap_name,
+    models.OurWarehouse.sap_plant_code,
+    models.OurWarehouse.id,
+)
+PERMISSION_COLUMNS = (
+    models.Permission.name,
+    models.Permission.description,
+    models.Permission.is_required,
+    models.Permission.is_active,
+    models.Permission.id,
+)
+
+
+# Сколько разных страниц skip/limit хранить в одном снимке
+MAX_PAGES_PER_SNAPSHOT = 64
+# Сколько снимков прав отдельных клиентов хранить; давно не читанные вытесняются
+MAX_CLIENT_SNAPSHOTS = 1024
+
+
+class _Snapshot:
+    """Строки одной выборки и уже сериализованные страницы из них."""
+    __slots__ = ("rows", "pages", "loaded_at")
+
+    def __init__(self, rows: list, loaded_at: float):
+        self.rows = rows
+        self.pages: dict = {}
+        self.loaded_at = loaded_at
+
+
+_snapshots: dict = {}
+# client_id -> снимок прав клиента, от давно читанных к недавним
+_client_snapshots: OrderedDict = OrderedDict()
+# Номер поколения растет при каждом сбросе. Снимок, загрузка которого
+# началась до сброса, не сохраняется - иначе в кэш попали бы старые данные.
+_generation = 0
+
+
+def _is_fresh(snapshot: Optional[_Snapshot], now: float) -> bool:
+    return snapshot is not None and now - snapshot.loaded_at < settings.reference_cache_ttl_seconds
+
+
+async def _get_snapshot(
+    db: AsyncSession, key, loader: Callable[[AsyncSession], Awaitable[list]]
+) -> _Snapshot:
+    """Возвращает свежий снимок по ключу, при необходимости загружая его из базы."""
+    now = time.monotonic()
+    snapshot = _snapshots.get(key)
+    if _is_fresh(snapshot, now):
+        return snapshot
+
+    generation = _generation
+    snapshot = _Snapshot(await loader(db), now)
+    if generation == _generation:
+        _snapshots[key] = snapshot
+    return snapshot
+
+
+def _page(snapshot: _Snapshot, skip: int, limit: int, to_dict: Callable) -> bytes:
+    """Отдает JSON страницы skip/limit, сериализуя ее только при первом запросе."""
+    content = snapshot.pages.get((skip, limit))
+    if content is None:
+        content = dumps([to_dict(row) for row in snapshot.rows[skip:skip + limit]])
+        if len(snapshot.pages) >= MAX_PAGES_PER_SNAPSHOT:
+            snapshot.pages.clear()
+        snapshot.pages[(skip, limit)] = content
+    return content
+
+
+async def _select_rows(db: AsyncSession, query) -> list:
+    # Выполняем запрос на уровне соединения: без ORM и identity map
+    conn = await db.connection()
+    result = await conn.execute(query)
+    return result.all()
+
+
+# --- Справочник НАШИХ складов ---
+
+async def _load_our_warehouses(db: AsyncSession) -> list:
+    return await _select_rows(db, select(*OUR_WAREHOUSE_COLUMNS).order_by(models.OurWarehouse.id))
+
+def _our_warehouse_dict(row) -> dict:
+    name, address, sap_name, sap_plant_code, id_ = row
+    return {"name": name, "address": address, "sap_name": sap_name, "sap_plant_code": sap_plant_code, "id": id_}
+
+async def our_warehouses_json(db: AsyncSession, skip: int, limit: int) -> bytes:
+    """JSON-список наших складов, как у List[schemas.OurWarehouse]."""
+    snapshot = await _get_snapshot(db, "our_warehouses", _load_our_warehouses)
+    return _page(snapshot, skip, limit, _our_warehouse_dict)
+
+
+# --- Справочник разрешений ---
+
+async def _load_permissions(db: AsyncSession) -> list:
+    return await _select_rows(db, select(*PERMISSION_COLUMNS).order_by(models.Permission.id))
+
+def _permission_dict(row) -> dict:
+    name, description, is_required, is_active, id_ = row
+    return {
+        "name": name,
+        "description": description,
+        "is_required": bool(is_required),
+        "is_active": bool(is_active),
+        "id": id_,
+    }
+
+async def permissions_json(db: AsyncSession, skip: int, limit: int) -> bytes:
+    """JSON-список прав из справочника, как у List[schemas.PermissionRead]."""
+    snapshot = await _get_snapshot(db, "permissions", _load_permissions)
+    return _page(snapshot, skip, limit, _permission_dict)
+
+
+# --- Права конкретного клиента ---
+
+def _client_permissions_loader(client_id: int):
+    async def load(db: AsyncSession) -> list:
+        return await _select_rows(
+            db,
+            select(
+                models.ClientPermission.enabled,
+                models.ClientPermission.id,
+                *PERMISSION_COLUMNS,
+            )
+            .join(models.Permission, models.ClientPermission.permission_id == models.Permission.id)
+            .filter(models.ClientPermission.client_id == client_id)
+            .order_by(models.ClientPermission.id),
+        )
+    return load
+
+def _client_permission_dict(row) -> dict:
+    enabled, link_id = row[0], row[1]
+    return {"enabled": bool(enabled), "id": link_id, "permission": _permission_dict(row[2:])}
+
+async def client_permissions_json(db: AsyncSession, client_id: int) -> Optional[bytes]:
+    """
+    JSON-список прав клиента, как у List[schemas.ClientPermission].
+    Возвращает None, если клиенту не назначено ни одного права.
+    """
+    now = time.monotonic()
+    snapshot = _client_snapshots.get(client_id)
+    if _is_fresh(snapshot, now):
+        _client_snapshots.move_to_end(client_id)
+    else:
+        generation = _generation
+        snapshot = _Snapshot(await _client_permissions_loader(client_id)(db), now)
+        # Пустой результат не храним: иначе кэш рос бы с каждым запрошенным ID,
+        # в том числе несуществующим
+        if generation == _generation and snapshot.rows:
+            _client_snapshots[client_id] = snapshot
+            _client_snapshots.move_to_end(client_id)
+            while len(_client_snapshots) > MAX_CLIENT_SNAPSHOTS:
+                _client_snapshots.popitem(last=False)
+        else:
+            _client_snapshots.pop(client_id, None)
+    if not snapshot.rows:
+        return None
+    return _page(snapshot, 0, len(snapshot.rows), _client_permission_dict)
+
+
+# --- Сопоставление складов Ozon клиентов нашим складам ---
+
+async def _load_client_warehouse_index(db: AsyncSession) -> dict:
+    rows = await _select_rows(
+        db,
+        select(
+            models.ClientWarehouse.client_id,
+            models.ClientWarehouse.mp_warehouse_id,
+            models.OurWarehouse.id,
+            models.OurWarehouse.sap_plant_code,
+            models.OurWarehouse.sap_name,
+        )
+        .join(models.OurWarehouse, models.OurWarehouse.id == models.ClientWarehouse.our_warehouse_id),
+    )
+    return {(client_id, mp_warehouse_id): rest for client_id, mp_warehouse_id, *rest in rows}
+
+async def client_warehouse_index(db: AsyncSession) -> dict:
+    """
+    Словарь (client_id, mp_warehouse_id) -> (id нашего склада, sap_plant_code,
+    sap_name) по всем привязкам складов. Словарь общий, изменять его нельзя.
+    """
+    snapshot = await _get_snapshot(db, "client_warehouses", _load_client_warehouse_index)
+    return snapshot.rows
+
+
+# --- Статусы договоров клиентов (веса в очереди запросов в Ozon) ---
+
+async def _load_client_contract_statuses(db: AsyncSession) -> dict:
+    rows = await _select_rows(db, select(models.Client.id, models.Client.contract_status))
+    return {client_id: (status.value if status is not None else "none") for client_id, status in rows}
+
+async def client_contract_statuses(db: AsyncSession) -> dict:
+    """Словарь client_id -> contract_status. Словарь общий, изменять его нельзя."""
+    snapshot = await _get_snapshot(db, "client_contracts", _load_client_contract_statuses)
+    return snapshot.rows
+
+
+# --- Сброс снимков ---
+
+def _drop(predicate: Callable) -> None:
+    global _generation
+    _generation += 1
+    for key in [key for key in _snapshots if predicate(key)]:
+        del _snapshots[key]
+    # Снимки прав клиентов хранятся отдельно, ключ для predicate - ("client_permissions", client_id)
+    for client_id in [client_id for client_id in _client_snapshots if predicate(("client_permissions", client_id))]:
+        del _client_snapshots[client_id]
+
+def invalidate_our_warehouses() -> None:
+    """
+    Сбрасывает снимок наших складов. Вызывается при любой их записи.
+    Сопоставление складов содержит коды SAP, поэтому сбрасывается тоже.
+    """
+    _drop(lambda key: key in ("our_warehouses", "client_warehouses"))
+
+def invalidate_client_warehouses() -> None:
+    """Сбрасывает сопоставление складов. Вызывается при привязке и отвязке склада клиента."""
+    _drop(lambda key: key == "client_warehouses")
+
+def invalidate_client_contracts() -> None:
+    """Сбрасывает статусы договоров. Вызывается при создании, изменении и удалении клиента."""
+    _drop(lambda key: key == "client_contracts")
+
+def invalidate_permissions() -> None:
+    """
+    Сбрасывает снимок справочника прав. Права клиентов содержат вложенные
+    данные справочника, поэтому их снимки сбрасываются тоже.
+    """
+    _drop(lambda key: key == "permissions" or (isinstance(key, tuple) and key[0] == "client_permissions"))
+
+def invalidate_client_permissions(client_id: int) -> None:
+    """Сбрасывает снимок прав одного клиента."""
+    _drop(lambda key: key == ("client_permissions", client_id))
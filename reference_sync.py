@@ -0,0 +1,383 @@
+# File: reference_sync.py
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import and_, delete, func, or_, tuple_, update
+from sqlalchemy.future import select
+
+# Импортируем наши собственные модули
+import crud
+import models
+import upstream
+from client_sync import LeaseLost
+from database import SessionLocal, insert
+from settings import settings
+
+# =============================================================================
+# ЛОКАЛЬНАЯ КОПИЯ СПРАВОЧНИКОВ OZON
+# Дерево категорий и характеристики типов товаров одинаковы для всех
+# продавцов и меняются редко. Они хранятся в таблицах ozon_categories,
+# ozon_category_types, ozon_attributes и ozon_type_attributes и отдаются
+# роутером /reference без запросов в Ozon и без расхода лимитов.
+#
+# Обновление - один проход на все приложение раз в
+# reference_sync_interval_seconds, ключами любого клиента с включенными
+# правами на оба метода:
+#   1. v1/description-category/tree - все дерево одной транзакцией;
+#   2. v1/description-category/attribute по каждому доступному типу товара,
+#      по одному типу на транзакцию вместе с курсором (категория:тип),
+#      поэтому прерванный проход продолжается с места остановки.
+# Строки помечаются номером прохода; то, что в проходе не встретилось,
+# удаляется в его конце. Если Ozon отказал ключам клиента (4xx), следующая
+# попытка идет ключами следующего подходящего клиента.
+# Проход ведет один воркер: строка reference_sync_state берется под аренду.
+# Как и в client_sync.py, аренда продлевается первым запросом каждой
+# транзакции прохода: потерявший ее воркер откатывается до записи в общие
+# таблицы и до удаления строк (LeaseLost).
+# =============================================================================
+
+logger = logging.getLogger("reference_sync")
+
+TREE_METHOD = "v1/description-category/tree"
+ATTRIBUTE_METHOD = "v1/description-category/attribute"
+REQUIRED_METHODS = (TREE_METHOD, ATTRIBUTE_METHOD)
+
+STATE_ID = 1            # единственная строка reference_sync_state
+_LANGUAGE = "DEFAULT"
+_TYPE_BATCH = 500        # типов товаров, читаемых из базы за раз
+
+State = models.ReferenceSyncState
+Category = models.OzonCategory
+CategoryType = models.OzonCategoryType
+Attribute = models.OzonAttribute
+TypeAttribute = models.OzonTypeAttribute
+
+
+def _now() -> datetime:
+    return datetime.utcnow()
+
+
+def _lease_until() -> datetime:
+    return _now() + timedelta(seconds=settings.reference_sync_lease_seconds)
+
+
+# --- Выбор ключей ---
+
+async def _eligible_clients(db) -> list[int]:
+    """Клиенты с ключами Ozon и включенными правами на оба метода справочников."""
+    query = select(models.ClientOzonAuth.client_id).order_by(models.ClientOzonAuth.client_id)
+    for method in REQUIRED_METHODS:
+        query = query.filter(models.ClientOzonAuth.client_id.in_(crud.permitted_clients_query(method)))
+    result = await db.execute(query)
+    return result.scalars().all()
+
+
+def _choose(candidates: list[int], current: Optional[int], skip_current: bool = False) -> Optional[int]:
+    """Клиент, которым обновлять: текущий, если подходит, иначе следующий по ID (по кругу)."""
+    if not candidates:
+        return None
+    if current in candidates and not skip_current:
+        return current
+    following = [client_id for client_id in candidates if current is None or client_id > current]
+    return (following or candidates)[0]
+
+
+# --- Проход обновления ---
+
+def _flatten_tree(nodes: list, parent_id: Optional[int], generation: int, categories: list, types: list) -> None:
+    for node in nodes:
+        if node.get("type_id"):
+            types.append({
+                "description_category_id": parent_id,
+                "type_id": int(node["type_id"]),
+                "name": node.get("type_name") or "",
+                "disabled": bool(node.get("disabled")),
+                "generation": generation,
+            })
+            continue
+        category_id = int(node["description_category_id"])
+        categories.append({
+            "id": category_id,
+            "parent_id": parent_id,
+            "name": node.get("category_name") or "",
+            "disabled": bool(node.get("disabled")),
+            "generation": generation,
+        })
+        _flatten_tree(node.get("children") or [], category_id, generation, categories, types)
+
+
+def _upsert(model, index_elements: list[str], columns: tuple[str, ...]):
+    statement = insert(model)
+    return statement.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={column: statement.excluded[column] for column in columns},
+    )
+
+
+async def _renew_lease(db, state: models.ReferenceSyncState, **values) -> None:
+    """
+    Первый запрос транзакции прохода: обновляет состояние, только пока
+    аренда за этим проходом. Иначе откатывает транзакцию - LeaseLost.
+    """
+    result = await db.execute(
+        update(State)
+        .where(State.id == STATE_ID, State.locked_until == state.locked_until)
+        .values(**values)
+    )
+    if result.rowcount != 1:
+        await db.rollback()
+        raise LeaseLost("Аренду обновления справочников Ozon забрал другой воркер")
+
+
+async def _save(state: models.ReferenceSyncState, cursor: str, write: Callable) -> None:
+    """write(db) и курсор - одной транзакцией; заодно продлевает аренду."""
+    lease = _lease_until()
+    async with SessionLocal() as db:
+        await _renew_lease(db, state, cursor=cursor, locked_until=lease)
+        await write(db)
+        await db.commit()
+    state.locked_until = lease
+    state.cursor = cursor
+
+
+async def _load_tree(state: models.ReferenceSyncState, headers: dict) -> None:
+    data = await upstream.call_ozon_within_quota(state.client_id, TREE_METHOD, {"language": _LANGUAGE}, headers)
+    categories, types = [], []
+    _flatten_tree(data.get("result") or [], None, state.generation, categories, types)
+
+    async def write(db):
+        if categories:
+            await db.execute(_upsert(Category, ["id"], ("parent_id", "name", "disabled", "generation")), categories)
+        if types:
+            await db.execute(
+                _upsert(CategoryType, ["description_category_id", "type_id"], ("name", "disabled", "generation")),
+                types,
+            )
+
+    await _save(state, "", write)
+
+
+async def _next_types(state: models.ReferenceSyncState) -> list[tuple[int, int]]:
+    """Следующие после курсора доступные типы товаров, полученные в этом проходе."""
+    query = (
+        select(CategoryType.description_category_id, CategoryType.type_id)
+        .where(CategoryType.generation == state.generation, CategoryType.disabled == False)
+        .order_by(CategoryType.description_category_id, CategoryType.type_id)
+        .limit(_TYPE_BATCH)
+    )
+    if state.cursor:
+        category_id, type_id = (int(part) for part in state.cursor.split(":"))
+        query = query.where(
+            tuple_(CategoryType.description_category_id, CategoryType.type_id) > tuple_(category_id, type_id)
+        )
+    async with SessionLocal() as db:
+        return (await db.execute(query)).all()
+
+
+async def _load_attributes(state: models.ReferenceSyncState, category_id: int, type_id: int, headers: dict) -> None:
+    data = await upstream.call_ozon_within_quota(
+        state.client_id, ATTRIBUTE_METHOD,
+        {"description_category_id": category_id, "type_id": type_id, "language": _LANGUAGE},
+        headers,
+    )
+    attributes, links = [], []
+    for item in data.get("result") or []:
+        attribute_id = int(item["id"])
+        attributes.append({
+            "id": attribute_id,
+            "name": item.get("name") or "",
+            "description": item.get("description"),
+            "type": item.get("type"),
+            "is_collection": bool(item.get("is_collection")),
+            "dictionary_id": int(item.get("dictionary_id") or 0),
+            "generation": state.generation,
+        })
+        links.append({
+            "description_category_id": category_id,
+            "type_id": type_id,
+            "attribute_id": attribute_id,
+            "is_required": bool(item.get("is_required")),
+            "is_aspect": bool(item.get("is_aspect")),
+            "category_dependent": bool(item.get("category_dependent")),
+            "group_id": item.get("group_id"),
+            "group_name": item.get("group_name"),
+            "max_value_count": item.get("max_value_count"),
+            "generation": state.generation,
+        })
+
+    async def write(db):
+        if attributes:
+            await db.execute(
+                _upsert(Attribute, ["id"], ("name", "description", "type", "is_collection", "dictionary_id", "generation")),
+                attributes,
+            )
+        if links:
+            await db.execute(
+                _upsert(
+                    TypeAttribute, ["description_category_id", "type_id", "attribute_id"],
+                    ("is_required", "is_aspect", "category_dependent", "group_id", "group_name", "max_value_count", "generation"),
+                ),
+                links,
+            )
+
+    await _save(state, f"{category_id}:{type_id}", write)
+
+
+async def _finish_pass(state: models.ReferenceSyncState) -> tuple[int, int]:
+    """Удаляет то, чего не было в проходе, и начинает следующий проход."""
+    async with SessionLocal() as db:
+        await _renew_lease(
+            db, state,
+            generation=state.generation + 1,
+            cursor=None,
+            last_synced_at=_now(),
+            error=None,
+            next_run_at=_now() + timedelta(seconds=settings.reference_sync_interval_seconds),
+            locked_until=None,
+        )
+        for model in (TypeAttribute, Attribute, CategoryType, Category):
+            await db.execute(delete(model).where(model.generation != state.generation))
+        types = (await db.execute(select(func.count()).select_from(CategoryType))).scalar()
+        attributes = (await db.execute(select(func.count()).select_from(Attribute))).scalar()
+        await db.execute(update(State).where(State.id == STATE_ID).values(types=types, attributes=attributes))
+        await db.commit()
+    return types, attributes
+
+
+async def sync_references(state: models.ReferenceSyncState) -> tuple[int, int]:
+    """Выполняет (или продолжает) проход обновления. Возвращает (типов, характеристик)."""
+    async with SessionLocal() as db:
+        client_id = _choose(await _eligible_clients(db), state.client_id)
+        if client_id is None:
+            raise upstream.OzonError(
+                "Нет клиента с ключами Ozon и включенными правами на " + ", ".join(REQUIRED_METHODS)
+            )
+        headers = await upstream.client_headers(db, client_id)
+        if client_id != state.client_id:
+            await _renew_lease(db, state, client_id=client_id)
+            await db.commit()
+            state.client_id = client_id
+
+    if state.cursor is None:
+        await _load_tree(state, headers)
+    while batch := await _next_types(state):
+        for category_id, type_id in batch:
+            await _load_attributes(state, category_id, type_id, headers)
+    return await _finish_pass(state)
+
+
+async def _release(state: models.ReferenceSyncState, error: str, retry_seconds: float, **values) -> None:
+    async with SessionLocal() as db:
+        await db.execute(
+            update(State)
+            .where(State.id == STATE_ID, State.locked_until == state.locked_until)
+            .values(error=error[:1000], next_run_at=_now() + timedelta(seconds=retry_seconds), locked_until=None, **values)
+        )
+        await db.commit()
+
+
+async def _process(state: models.ReferenceSyncState) -> None:
+    try:
+        types, attributes = await sync_references(state)
+    except upstream.OzonError as exc:
+        # Ozon отказал этим ключам (или их нет): следующая попытка - ключами другого клиента
+        async with SessionLocal() as db:
+            next_client_id = _choose(await _eligible_clients(db), state.client_id, skip_current=True)
+        await _release(state, str(exc), settings.reference_sync_retry_seconds, client_id=next_client_id)
+    except LeaseLost as exc:
+        # Проход ведет новый владелец аренды, освобождать нечего
+        logger.warning("%s", exc)
+    except asyncio.CancelledError:
+        raise
+    except Exception as exc:
+        if not isinstance(exc, upstream.OzonTransientError):
+            logger.exception("Ошибка обновления справочников Ozon")
+        # Курсор сохранен: следующая попытка продолжит проход
+        await _release(state, str(exc), settings.reference_sync_retry_seconds)
+    else:
+        logger.info("Справочники Ozon обновлены: %s типов товаров, %s характеристик", types, attributes)
+
+
+# --- Планировщик ---
+
+async def _ensure_state(db) -> None:
+    await db.execute(
+        insert(State).values(id=STATE_ID, generation=1, types=0, attributes=0, next_run_at=_now())
+        .on_conflict_do_nothing()
+    )
+
+
+async def _claim() -> Optional[models.ReferenceSyncState]:
+    now = _now()
+    due = and_(State.next_run_at <= now, or_(State.locked_until.is_(None), State.locked_until < now))
+    async with SessionLocal() as db:
+        await _ensure_state(db)
+        # Условие в UPDATE: проход получит один воркер
+        result = await db.execute(
+            update(State)
+            .where(State.id == STATE_ID, due)
+            .values(locked_until=_lease_until())
+            .returning(State)
+            .execution_options(synchronize_session=False)
+        )
+        state = result.scalars().first()
+        await db.commit()
+    return state
+
+
+async def request_sync() -> None:
+    """Ставит обновление справочников в очередь на сейчас."""
+    async with SessionLocal() as db:
+        await _ensure_state(db)
+        await db.execute(update(State).where(State.id == STATE_ID).values(next_run_at=_now()))
+        await db.commit()
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+_wakeup: Optional[asyncio.Event] = None
+_task: Optional[asyncio.Task] = None
+_active: Optional[asyncio.Task] = None
+
+
+async def _run() -> None:
+    global _active
+    while True:
+        _wakeup.clear()
+        if _active is None or _active.done():
+            _active = None
+            try:
+                state = await _claim()
+            except Exception:
+                logger.exception("Не удалось начать обновление справочников Ozon")
+                state = None
+            if state is not None:
+                _active = asyncio.create_task(_process(state))
+                _active.add_done_callback(lambda task: _wakeup.set())
+        try:
+            await asyncio.wait_for(_wakeup.wait(), settings.reference_sync_scan_seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start() -> None:
+    """Запускает обновление справочников (событие startup), если оно включено."""
+    global _wakeup, _task
+    if settings.reference_sync_enabled and _task is None:
+        _wakeup = asyncio.Event()
+        _task = asyncio.create_task(_run())
+
+
+async def stop() -> None:
+    global _task, _active
+    if _task is not None:
+        _task.cancel()
+        _task = None
+    if _active is not None:
+        # Прерванный проход продолжится по сохраненному курсору, когда истечет аренда
+        _active.cancel()
+        await asyncio.gather(_active, return_exceptions=True)
+        _active = None
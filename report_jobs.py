@@ -0,0 +1,395 @@
+# File: report_jobs.py
+
+import asyncio
+import hashlib
+import logging
+import random
+import re
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+from urllib.parse import unquote, urlsplit
+
+from fastapi.responses import FileResponse
+from sqlalchemy import and_, or_, update
+from sqlalchemy.future import select
+
+# Импортируем наши собственные модули
+import artifacts
+import crud
+import db_stats
+import executors
+import models
+import ozon_quota
+import upstream
+import upstream_scheduler
+from database import SessionLocal
+from settings import settings
+
+# =============================================================================
+# ФОНОВЫЕ ЗАДАЧИ НА ОТЧЕТЫ OZON
+# Отчеты Ozon (v1/report/*/create и подобные) готовятся асинхронно:
+# метод создания возвращает код отчета, по коду v1/report/info отдает статус,
+# а когда отчет готов - ссылку на файл. Раньше клиент сам держал этот цикл
+# через прокси. Теперь он создает задачу (POST /report-jobs/), а воркер:
+#   1. вызывает метод создания и запоминает код отчета;
+#   2. опрашивает v1/report/info с растущей паузой (report_poll_*);
+#   3. скачивает готовый файл в хранилище artifacts.py (сжатие, дедупликация).
+# Каждый шаг - отдельный короткий заход: между опросами задача не занимает
+# воркер, а лежит в таблице report_jobs с временем следующего шага.
+# Задачу берет один воркер из всех: шаг выполняется под арендой
+# (locked_until). Если воркер упал посреди шага, аренда истекает и задачу
+# подхватывает другой воркер или этот же после перезапуска.
+# Одновременно выполняется не больше settings.report_jobs_concurrency шагов
+# на воркер. Запросы в Ozon учитываются в общих лимитах (ozon_quota.py).
+# =============================================================================
+
+logger = logging.getLogger("report_jobs")
+
+INFO_METHOD = "v1/report/info"
+
+Status = models.ReportJobStatus
+Job = models.ReportJob
+TERMINAL_STATUSES = (Status.succeeded, Status.failed)
+
+_FILE_NAME_RE = re.compile(r"[^\w.-]+")
+_CHUNK_SIZE = 64 * 1024
+
+
+# Временная ошибка: шаг повторяется после паузы
+TransientError = upstream.OzonTransientError
+
+
+class ReportFailed(upstream.OzonError):
+    """Ошибка, после которой задача завершается со статусом failed."""
+
+
+def _now() -> datetime:
+    return datetime.utcnow()
+
+
+def _backoff(attempt: int) -> float:
+    """Пауза перед следующим шагом: удваивается до report_poll_max_seconds, +-20% разброса."""
+    delay = min(settings.report_poll_max_seconds, settings.report_poll_initial_seconds * 2 ** attempt)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _legacy_file(job: models.ReportJob) -> Optional[Path]:
+    """Файл, скачанный до хранилища artifacts.py: лежит в report_dir под номером задачи."""
+    path = Path(settings.report_dir) / f"{job.id}{Path(job.file_name).suffix}"
+    return path if path.is_file() else None
+
+
+def file_response(request, job: models.ReportJob):
+    """Ответ с файлом отчета (Range, ETag) или None, если файла нет."""
+    if job.status != Status.succeeded or not job.file_name:
+        return None
+    if job.file_sha256 is None:
+        path = _legacy_file(job)
+        return path and FileResponse(path, media_type="application/octet-stream", filename=job.file_name)
+    if not artifacts.exists(job.file_sha256, job.file_encoding):
+        return None
+    return artifacts.file_response(request, job.file_sha256, job.file_encoding, job.file_size, job.file_name)
+
+
+# --- Создание задачи и чтение состояния ---
+
+async def submit(db, client_id: int, method: str, params: dict) -> models.ReportJob:
+    """Сохраняет новую задачу и будит планировщик этого воркера."""
+    job = await crud.save_new(db, Job(
+        client_id=client_id,
+        method=method,
+        params=params,
+        status=Status.pending,
+        attempts=0,
+        errors=0,
+        next_run_at=_now(),
+    ))
+    if _runner is not None:
+        _runner.wake()
+    return job
+
+
+async def get_job(job_id: int) -> Optional[models.ReportJob]:
+    async with SessionLocal() as db:
+        return await db.get(Job, job_id)
+
+
+async def wait_for(job_id: int, timeout: float) -> Optional[models.ReportJob]:
+    """
+    Длинный опрос: возвращает задачу, как только она завершилась, или ее
+    текущее состояние через timeout секунд. Задачи своего воркера будят
+    ожидающих сразу, чужие замечаются при перечитывании раз в report_jobs_scan_seconds.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    job = await get_job(job_id)
+    while job is not None and job.status not in TERMINAL_STATUSES:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        try:
+            await asyncio.wait_for(_finished.wait(), min(remaining, settings.report_jobs_scan_seconds))
+        except asyncio.TimeoutError:
+            pass
+        # Повторные чтения одной строки - не N+1, в статистику запроса их не пишем
+        with db_stats.untracked():
+            job = await get_job(job_id)
+    return job
+
+
+# Срабатывает при завершении любой задачи в этом воркере и сразу заменяется новым
+_finished = asyncio.Event()
+
+
+def _notify_finished() -> None:
+    global _finished
+    finished, _finished = _finished, asyncio.Event()
+    finished.set()
+
+
+# --- Запросы в Ozon ---
+
+def _write_chunk(handle, digest, chunk: bytes) -> None:
+    handle.write(chunk)
+    digest.update(chunk)
+
+
+async def _download(job_id: int, client_id: int, url: str, renew) -> dict:
+    """Скачивает файл отчета в хранилище artifacts.py. Возвращает поля файла для задачи."""
+    import httpx
+
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https"):
+        raise ReportFailed(f"Ozon вернул некорректную ссылку на файл: {url!r}")
+    file_name = _FILE_NAME_RE.sub("_", unquote(parts.path.rsplit("/", 1)[-1])) or f"report-{job_id}"
+
+    partial = await executors.run_in_thread(artifacts.new_temp_file)
+    digest = hashlib.sha256()
+    size = 0
+    renewed = time.monotonic()
+    try:
+        handle = await executors.run_in_thread(open, partial, "wb")
+        try:
+            # Файл качается через общий пул, поэтому тоже в очереди клиента
+            async with upstream_scheduler.scheduler.slot(client_id), upstream.get_client().stream("GET", url) as response:
+                if response.status_code >= 500:
+                    raise TransientError(f"Файл отчета недоступен: {response.status_code}")
+                if response.status_code >= 400:
+                    raise ReportFailed(f"Файл отчета недоступен: {response.status_code}")
+                async for chunk in response.aiter_bytes(_CHUNK_SIZE):
+                    await executors.run_in_thread(_write_chunk, handle, digest, chunk)
+                    size += len(chunk)
+                    # Большой файл может качаться дольше аренды - продлеваем ее
+                    if time.monotonic() - renewed > settings.report_job_lease_seconds / 3:
+                        await renew()
+                        renewed = time.monotonic()
+        except httpx.RequestError as exc:
+            raise TransientError(f"Ошибка при скачивании файла отчета: {exc}")
+        finally:
+            await executors.run_in_thread(handle.close)
+        # Сжатие и перенос в хранилище; одинаковый файл хранится один раз
+        sha256, encoding = await executors.run_in_thread(artifacts.store, partial, digest.hexdigest())
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    return {"file_name": file_name, "file_size": size, "file_sha256": sha256, "file_encoding": encoding}
+
+
+# --- Выполнение шага задачи ---
+
+async def _step(job: models.ReportJob, renew) -> dict:
+    """Выполняет один шаг задачи и возвращает поля для записи в таблицу."""
+    now = _now()
+    if job.created_at and now - job.created_at > timedelta(seconds=settings.report_job_timeout_seconds):
+        raise ReportFailed(f"Отчет не готов за {settings.report_job_timeout_seconds} с")
+
+    method = job.method if job.report_code is None else INFO_METHOD
+    retry_after = ozon_quota.acquire(job.client_id, method)
+    if retry_after is not None:
+        # Лимит воркеров исчерпан: ждем новое окно, попытка не считается
+        return {"next_run_at": now + timedelta(seconds=retry_after)}
+
+    async with SessionLocal() as db:
+        headers = await upstream.client_headers(db, job.client_id)
+    if job.report_code is None:
+        data = await upstream.call_ozon(job.method, job.params or {}, headers, job.client_id)
+        code = (data.get("result") or {}).get("code")
+        if not code:
+            raise ReportFailed(f"Ozon не вернул код отчета: {str(data)[:500]}")
+        return {"report_code": code, "errors": 0, "next_run_at": _now() + timedelta(seconds=_backoff(0))}
+
+    data = await upstream.call_ozon(INFO_METHOD, {"code": job.report_code}, headers, job.client_id)
+    result = data.get("result") or {}
+    report_status = result.get("status")
+    if report_status == "success":
+        if not result.get("file"):
+            raise ReportFailed("Ozon сообщил о готовности отчета без ссылки на файл")
+        file_fields = await _download(job.id, job.client_id, result["file"], renew)
+        return {"status": Status.succeeded, "errors": 0, "finished_at": _now(), **file_fields}
+    if report_status == "failed":
+        raise ReportFailed(result.get("error") or "Ozon не смог сформировать отчет")
+    # waiting / processing: опрашиваем дальше с растущей паузой
+    attempts = job.attempts + 1
+    return {"attempts": attempts, "errors": 0, "next_run_at": _now() + timedelta(seconds=_backoff(attempts))}
+
+
+def _lease_until() -> datetime:
+    return _now() + timedelta(seconds=settings.report_job_lease_seconds)
+
+
+def _due_condition(now: datetime):
+    return or_(
+        and_(Job.status == Status.pending, Job.next_run_at <= now),
+        # Воркер взял задачу и пропал: аренда истекла
+        and_(Job.status == Status.running, Job.locked_until < now),
+    )
+
+
+async def _claim(limit: int) -> list[models.ReportJob]:
+    """Берет в работу до limit задач, у которых подошло время шага."""
+    now = _now()
+    claimed = []
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(Job.id).where(_due_condition(now)).order_by(Job.next_run_at).limit(limit)
+        )
+        for job_id in result.scalars().all():
+            # Условие повторяется в UPDATE: из двух воркеров задачу получит один
+            result = await db.execute(
+                update(Job)
+                .where(Job.id == job_id, _due_condition(now))
+                .values(status=Status.running, locked_until=_lease_until())
+                .returning(Job)
+                .execution_options(synchronize_session=False)
+            )
+            job = result.scalars().first()
+            await db.commit()
+            if job is not None:
+                claimed.append(job)
+    return claimed
+
+
+async def _save(job: models.ReportJob, values: dict) -> None:
+    """Записывает итог шага и снимает аренду, если задача все еще за этим воркером."""
+    values.setdefault("status", Status.pending)
+    values["locked_until"] = None
+    async with SessionLocal() as db:
+        await db.execute(
+            update(Job)
+            .where(Job.id == job.id, Job.status == Status.running, Job.locked_until == job.locked_until)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+
+async def _process(job: models.ReportJob) -> None:
+    async def renew():
+        lease = _lease_until()
+        async with SessionLocal() as db:
+            await db.execute(
+                update(Job)
+                .where(Job.id == job.id, Job.locked_until == job.locked_until)
+                .values(locked_until=lease)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        job.locked_until = lease
+
+    try:
+        values = await _step(job, renew)
+        values["error"] = None
+    except upstream.OzonError as exc:
+        values = {"status": Status.failed, "error": str(exc)[:1000], "finished_at": _now()}
+    except asyncio.CancelledError:
+        raise
+    except Exception as exc:
+        if not isinstance(exc, TransientError):
+            logger.exception("Ошибка в шаге задачи на отчет %s", job.id)
+        errors = job.errors + 1
+        if errors >= settings.report_job_max_errors:
+            values = {"status": Status.failed, "errors": errors, "error": str(exc)[:1000], "finished_at": _now()}
+        else:
+            values = {"errors": errors, "error": str(exc)[:1000], "next_run_at": _now() + timedelta(seconds=_backoff(errors))}
+    try:
+        await _save(job, values)
+    except Exception:
+        # Задача останется running и вернется в очередь, когда истечет аренда
+        logger.exception("Не удалось сохранить шаг задачи на отчет %s", job.id)
+        return
+    if values["status"] in TERMINAL_STATUSES:
+        logger.info("Задача на отчет %s завершена: %s", job.id, values["status"].value)
+        _notify_finished()
+
+
+# --- Планировщик воркера ---
+
+class ReportRunner:
+    """Забирает готовые к шагу задачи и выполняет не больше concurrency шагов сразу."""
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self._active: dict[asyncio.Task, models.ReportJob] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    def _done(self, task: asyncio.Task) -> None:
+        self._active.pop(task, None)
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            free = self.concurrency - len(self._active)
+            if free > 0:
+                try:
+                    jobs = await _claim(free)
+                except Exception:
+                    logger.exception("Не удалось выбрать задачи на отчеты")
+                    jobs = []
+                for job in jobs:
+                    task = asyncio.create_task(_process(job))
+                    self._active[task] = job
+                    task.add_done_callback(self._done)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.report_jobs_scan_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        interrupted = list(self._active.values())
+        for task in list(self._active):
+            task.cancel()
+        await asyncio.gather(*self._active, return_exceptions=True)
+        # Прерванные шаги сразу возвращаем в очередь, не дожидаясь конца аренды
+        for job in interrupted:
+            await _save(job, {"next_run_at": _now()})
+
+
+_runner: Optional[ReportRunner] = None
+
+
+def start() -> None:
+    """Запускает планировщик (событие startup); 0 в report_jobs_concurrency - выключен."""
+    global _runner
+    if settings.report_jobs_concurrency > 0 and _runner is None:
+        _runner = ReportRunner(settings.report_jobs_concurrency)
+        _runner.start()
+
+
+async def stop() -> None:
+    global _runner
+    if _runner is not None:
+        await _runner.stop()
+        _runner = None
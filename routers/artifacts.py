@@ -0,0 +1,46 @@
+# File: routers/artifacts.py
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+import models
+import crud
+import report_jobs
+from database import get_db
+from security import get_current_user
+
+router = APIRouter(prefix="/artifacts", tags=["Artifacts"])
+
+@router.api_route("/reports/{job_id}", methods=["GET", "HEAD"])
+async def download_report(
+    job_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """
+    Файл отчета Ozon для клиента, для которого он построен.
+    Клиент получает только свои отчеты и только пока у него включено право
+    на метод, которым отчет создан; суперпользователь - любые.
+    Поддерживаются Range (докачка), ETag/If-None-Match и Accept-Encoding: gzip.
+    """
+    job = await db.get(models.ReportJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Отчет не найден")
+
+    if not current_user.is_superuser:
+        result = await db.execute(select(models.Client.id).filter(models.Client.user_id == current_user.id))
+        if result.scalar() != job.client_id:
+            # Чужие отчеты неотличимы от несуществующих
+            raise HTTPException(status_code=404, detail="Отчет не найден")
+        if not await crud.check_client_permission(db=db, client_id=job.client_id, permission_name=job.method):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Нет разрешения на метод '{job.method}', которым построен отчет",
+            )
+
+    response = report_jobs.file_response(request, job)
+    if response is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Файл отчета недоступен, статус: {job.status.value}")
+    return response
@@ -1,13 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import timedelta
+from typing import Optional
 from settings import settings
 
 import models
 import schemas
 import crud # Мы создадим этот файл на следующем шаге
 import security
+import service_keys
+import token_denylist
 from database import get_db
 
 router = APIRouter(tags=["Authentication"])
@@ -30,20 +32,63 @@ async def login_for_access_token(
         )
     
     # 2. Проверяем пароль
-    if not security.verify_password(form_data.password, user.password_hash):
+    if not await security.verify_password_async(form_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный логин или пароль",
             headers={"WWW-Authenticate": "Bearer"},
         )
         
-    # 3. Создаем токен
-    access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
-    access_token = security.create_access_token(
-        data={"sub": user.login}, expires_delta=access_token_expires
+    # 3. Создаем токены: refresh-токен продлевает доступ без пароля и bcrypt
+    return security.create_token_pair(user.login)
+
+@router.post("/token/refresh", response_model=schemas.Token)
+async def refresh_access_token(payload: schemas.TokenRefresh, db: AsyncSession = Depends(get_db)):
+    """
+    Выдает новую пару токенов по refresh-токену, без пароля и bcrypt.
+    Использованный refresh-токен отзывается и повторно не принимается.
+    """
+    invalid_token = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Недействительный refresh-токен",
+        headers={"WWW-Authenticate": "Bearer"},
     )
-    
-    return {"access_token": access_token, "token_type": "bearer"}
+    claims = security.decode_token(payload.refresh_token, security.REFRESH_TOKEN)
+    if claims is None or not claims.get("jti") or await token_denylist.is_revoked(db, claims["jti"]):
+        raise invalid_token
+    user = await crud.get_user_by_login(db, login=claims["sub"])
+    if user is None:
+        raise invalid_token
+    # Проверка выше - быстрый отказ по памяти; решает вставка jti в базу:
+    # из одновременных запросов с одним токеном новую пару получит один
+    if not await token_denylist.claim(db, claims["jti"], claims["exp"]):
+        raise invalid_token
+    return security.create_token_pair(user.login)
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    payload: Optional[schemas.Logout] = None,
+    token: str = Depends(security.oauth2_scheme),
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(security.get_current_user),
+):
+    """Отзывает текущий access-токен и, если передан, refresh-токен того же пользователя."""
+    if service_keys.is_service_key(token):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Ключ сервисной учетной записи отзывается через /admin/service-keys/",
+        )
+    revoked = []
+    claims = security.decode_token(token)
+    if claims is not None and claims.get("jti"):
+        revoked.append((claims["jti"], claims["exp"]))
+    if payload is not None and payload.refresh_token:
+        refresh = security.decode_token(payload.refresh_token, security.REFRESH_TOKEN)
+        if refresh is None or refresh["sub"] != current_user.login:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Недействительный refresh-токен")
+        if refresh.get("jti"):
+            revoked.append((refresh["jti"], refresh["exp"]))
+    await token_denylist.revoke(db, revoked)
 
 @router.get("/users/me", response_model=schemas.User)
 async def read_users_me(current_user: models.User = Depends(security.get_current_user)):
@@ -60,15 +105,17 @@ async def update_current_user_password(
     Позволяет аутентифицированному пользователю сменить свой пароль.
     """
     # 1. Проверяем, что старый пароль, введенный пользователем, верен
-    if not security.verify_password(password_data.old_password, current_user.password_hash):
+    if not await security.verify_password_async(password_data.old_password, current_user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Неверный старый пароль",
         )
     
     # 2. Устанавливаем новый пароль и снимаем флаг временного пароля
-    current_user.password_hash = security.get_password_hash(password_data.new_password)
+    current_user.password_hash = await security.get_password_hash_async(password_data.new_password)
     current_user.is_temporary_password = False
     
     db.add(current_user)
-    await db.commit()
\ No newline at end of file
+    await db.commit()
+    # Колонки пользователя в памяти у его ключей сервисных учетных записей устарели
+    service_keys.invalidate()
\ No newline at end of file
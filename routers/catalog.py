@@ -0,0 +1,56 @@
+# File: routers/catalog.py
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from typing import List, Optional
+
+import models
+import schemas
+import crud
+import catalog_sync
+from database import get_db
+from security import get_current_superuser, get_current_user
+
+router = APIRouter(prefix="/catalog", tags=["Catalog"])
+
+@router.get("/search", response_model=List[schemas.CatalogSearchHit])
+async def search_catalog(
+    q: str = Query(..., min_length=1, max_length=200),
+    client_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """
+    Поиск товаров по SKU, ID товара Ozon, артикулу или словам названия
+    в локальной копии каталога, без запросов в Ozon. Ищет среди клиентов
+    с включенным правом на v3/product/list: суперпользователь - по всем
+    (или по client_id), клиент - только по своим товарам.
+    """
+    if not current_user.is_superuser:
+        result = await db.execute(select(models.Client.id).filter(models.Client.user_id == current_user.id))
+        own_client_id = result.scalar()
+        if own_client_id is None or client_id not in (None, own_client_id):
+            return []
+        client_id = own_client_id
+    hits = await crud.search_catalog(
+        db, q, permission_name=catalog_sync.LIST_METHOD, client_id=client_id, limit=limit
+    )
+    return [
+        schemas.CatalogSearchHit(match=match, **schemas.CatalogProduct.model_validate(product).model_dump())
+        for match, product in hits
+    ]
+
+@router.get("/sync/", response_model=List[schemas.CatalogSyncState], dependencies=[Depends(get_current_superuser)])
+async def read_catalog_sync_states(db: AsyncSession = Depends(get_db)):
+    """Состояние синхронизации каталога по клиентам."""
+    result = await db.execute(select(models.CatalogSyncState).order_by(models.CatalogSyncState.client_id))
+    return result.scalars().all()
+
+@router.post("/sync/{client_id}", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(get_current_superuser)])
+async def start_catalog_sync(client_id: int):
+    """Запускает синхронизацию каталога клиента, не дожидаясь планового прохода."""
+    if not await catalog_sync.request_sync(client_id):
+        raise HTTPException(status_code=404, detail=f"Клиент с ID {client_id} или его ключи Ozon не найдены.")
+    return {"client_id": client_id, "queued": True}
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Response
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload # <-- 1. ИМПОРТИРУЕМ selectinload
@@ -7,6 +8,8 @@ from security import get_current_superuser
 
 import models
 import schemas
+import crud
+import reference_cache
 from database import get_db
 
 router = APIRouter(
@@ -22,52 +25,37 @@ async def grant_permission_to_client(
     permission_to_grant: schemas.ClientPermissionCreate,
     db: AsyncSession = Depends(get_db)
 ):
-    # Код проверки существования клиента и права остается без изменений
-    client_res = await db.execute(select(models.Client).filter(models.Client.id == client_id))
-    if not client_res.scalars().first():
+    # Проверяем существование клиента и права
+    if not await db.get(models.Client, client_id):
         raise HTTPException(status_code=404, detail=f"Клиент с id={client_id} не найден")
 
-    perm_res = await db.execute(select(models.Permission).filter(models.Permission.id == permission_to_grant.permission_id))
-    if not perm_res.scalars().first():
+    permission = await db.get(models.Permission, permission_to_grant.permission_id)
+    if not permission:
         raise HTTPException(status_code=404, detail=f"Право с id={permission_to_grant.permission_id} не найдено")
-    
-    # ... код проверки на дубликат ...
-    existing_link = await db.execute(select(models.ClientPermission).filter(models.ClientPermission.client_id == client_id, models.ClientPermission.permission_id == permission_to_grant.permission_id))
-    if existing_link.scalars().first():
-        raise HTTPException(status_code=400, detail="Это право уже назначено данному клиенту")
 
-    # Создаем новую связь
+    # Создаем новую связь. Право уже загружено - передаем его сразу,
+    # тогда ответ собирается без refresh() и повторного SELECT.
+    # Дубликат отсекает уникальный индекс (client_id, permission_id).
     db_client_permission = models.ClientPermission(
         client_id=client_id,
-        permission_id=permission_to_grant.permission_id,
+        permission=permission,
         enabled=permission_to_grant.enabled
     )
-    db.add(db_client_permission)
-    await db.commit()
-    await db.refresh(db_client_permission)
-
-    # --- 2. ИСПРАВЛЕНИЕ: Повторно запрашиваем созданную связь с "жадной" загрузкой ---
-    result = await db.execute(
-        select(models.ClientPermission)
-        .options(selectinload(models.ClientPermission.permission)) # Говорим загрузить связанное право
-        .filter(models.ClientPermission.id == db_client_permission.id)
-    )
-    final_link = result.scalars().first()
-    return final_link
+    try:
+        await crud.save_new(db, db_client_permission)
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Это право уже назначено данному клиенту")
+    reference_cache.invalidate_client_permissions(client_id)
+    return db_client_permission
 
 # ПОЛУЧИТЬ ВСЕ ПРАВА КЛИЕНТА (GET)
 @router.get("/", response_model=List[schemas.ClientPermission])
 async def get_client_permissions(client_id: int, db: AsyncSession = Depends(get_db)):
-    # --- 3. ИСПРАВЛЕНИЕ: Добавляем "жадную" загрузку и сюда ---
-    result = await db.execute(
-        select(models.ClientPermission)
-        .options(selectinload(models.ClientPermission.permission)) # Говорим загрузить связанное право
-        .filter(models.ClientPermission.client_id == client_id)
-    )
-    permissions = result.scalars().all()
-    if not permissions:
+    # Отдаем готовый JSON из снимка в памяти, без ORM и валидации каждой строки
+    content = await reference_cache.client_permissions_json(db, client_id=client_id)
+    if content is None:
          raise HTTPException(status_code=404, detail=f"Для клиента с id={client_id} не найдено назначенных прав")
-    return permissions
+    return Response(content=content, media_type="application/json")
 
 # DELETE - этот метод не возвращает тело, исправления не нужны
 @router.delete("/{permission_link_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -81,5 +69,6 @@ async def revoke_permission_from_client(client_id: int, permission_link_id: int,
 
     await db.delete(db_client_permission)
     await db.commit()
+    reference_cache.invalidate_client_permissions(client_id)
     return None
 
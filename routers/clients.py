@@ -1,12 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Response
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
 from typing import List
 
 import models
 import schemas
 import crud
+import reference_cache
 import security
+import executors
+import service_keys
 from database import get_db
+from settings import settings
 
 router = APIRouter(
     prefix="/clients",
@@ -34,6 +40,7 @@ async def create_client_and_user_endpoint(
             client_data=payload.client_data, 
             user_data=payload.user_data
         )
+        reference_cache.invalidate_client_contracts()
         return new_client
     except Exception as e:
         await db.rollback()
@@ -52,7 +59,12 @@ async def read_clients(
 ):
     """Получает список всех клиентов, вызывая исправленную CRUD-функцию."""
     clients = await crud.get_clients(db, skip=skip, limit=limit)
-    return clients
+    # Список большой - сериализуем сразу в байты, без промежуточного dict.
+    # Большие списки - в пуле потоков: все связи уже загружены, к базе сериализация не обращается
+    content = await executors.run_sized(
+        len(clients), settings.offload_min_items, schemas.dump_json, List[schemas.Client], clients
+    )
+    return Response(content=content, media_type="application/json")
 
 # READ (one)
 @router.get("/{client_id}", response_model=schemas.Client)
@@ -61,7 +73,7 @@ async def read_client(client_id: int, db: AsyncSession = Depends(get_db), curren
     db_client = await crud.get_client(db, client_id=client_id)
     if db_client is None:
         raise HTTPException(status_code=404, detail="Клиент не найден")
-    return db_client
+    return Response(content=schemas.dump_json(schemas.Client, db_client), media_type="application/json")
 
 # UPDATE
 @router.patch("/{client_id}", response_model=schemas.Client)
@@ -69,36 +81,20 @@ async def update_client(client_id: int, client_update: schemas.ClientUpdate, db:
     """
     Обновляет данные клиента по ID. Позволяет обновлять только переданные поля.
     """
-    result = await db.execute(select(models.Client).filter(models.Client.id == client_id))
-    db_client = result.scalars().first()
+    update_data = client_update.model_dump(exclude_unset=True)
+    try:
+        # Один UPDATE ... RETURNING вместо SELECT + UPDATE + refresh + повторного SELECT
+        updated_client = await crud.update_client(db, client_id=client_id, update_data=update_data)
+    except IntegrityError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Клиент с таким ИНН уже существует"
+        )
 
-    if db_client is None:
+    if updated_client is None:
         raise HTTPException(status_code=404, detail="Клиент не найден")
-
-    update_data = client_update.dict(exclude_unset=True)
-    for key, value in update_data.items():
-        if key == "password":
-            setattr(db_client, "password_hash", f"{value}_hashed")
-        else:
-            setattr(db_client, key, value)
-
-    db.add(db_client)
-    await db.commit()
-    # refresh() здесь не загружает связи, он только обновляет поля самого объекта
-    await db.refresh(db_client)
-
-    # --- ИСПРАВЛЕНИЕ: Повторно запрашиваем клиента с "жадной" загрузкой всех связей ---
-    final_result = await db.execute(
-        select(models.Client)
-        .options(
-            selectinload(models.Client.ozon_auth),
-            selectinload(models.Client.permissions).selectinload(models.ClientPermission.permission), # <-- Загружаем даже вложенные связи
-            selectinload(models.Client.warehouses).selectinload(models.ClientWarehouse.our_warehouse)
-        )
-        .filter(models.Client.id == client_id)
-    )
-    
-    updated_client = final_result.scalars().first()
+    if "contract_status" in update_data:
+        reference_cache.invalidate_client_contracts()
     return updated_client
 
 # DELETE - этот метод не возвращает тело, поэтому исправления не нужны
@@ -113,5 +109,10 @@ async def delete_client(client_id: int, db: AsyncSession = Depends(get_db)):
 
     await db.delete(db_client)
     await db.commit()
+    reference_cache.invalidate_client_permissions(client_id)
+    reference_cache.invalidate_client_warehouses()
+    reference_cache.invalidate_client_contracts()
+    # Ключи сервисных учетных записей держат колонки пользователя в памяти
+    service_keys.invalidate()
     return None
 
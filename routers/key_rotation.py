@@ -0,0 +1,31 @@
+# File: routers/key_rotation.py
+
+from fastapi import APIRouter, Depends, HTTPException, status
+
+import schemas
+import key_rotation
+from security import get_current_superuser
+
+router = APIRouter(
+    prefix="/admin/key-rotation",
+    tags=["Admin: Key Rotation"],
+    dependencies=[Depends(get_current_superuser)]
+)
+
+@router.post("/", response_model=schemas.KeyRotationStatus, status_code=status.HTTP_202_ACCEPTED)
+async def start_key_rotation(params: schemas.KeyRotationStart):
+    """
+    Запускает фоновую перешифровку ключей Ozon основным ключом шифрования.
+    Прерванную задачу можно продолжить, передав `start_after_id` = `last_id`.
+    """
+    progress = key_rotation.start_rotation(batch_size=params.batch_size, start_after_id=params.start_after_id)
+    if progress is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Перешифровка уже выполняется")
+    return progress.as_dict()
+
+@router.get("/", response_model=schemas.KeyRotationStatus)
+async def get_key_rotation_status():
+    """Возвращает прогресс последней перешифровки в этом процессе."""
+    if key_rotation.current_progress is None:
+        raise HTTPException(status_code=404, detail="Перешифровка еще не запускалась")
+    return key_rotation.current_progress.as_dict()
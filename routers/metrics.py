@@ -0,0 +1,14 @@
+# File: routers/metrics.py
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+import metrics
+
+router = APIRouter(tags=["Monitoring"])
+
+# Эндпоинт для сборщика Prometheus. Без авторизации, как принято для /metrics:
+# доступ к нему ограничивается на уровне сети.
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def read_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
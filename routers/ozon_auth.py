@@ -1,34 +1,43 @@
 # File: routers/ozon_auth.py
 
+import asyncio
+import hashlib
+import time
+
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from typing import Optional # Убедитесь, что Optional импортирован
-import httpx
+from typing import List, Optional # Убедитесь, что Optional импортирован
 
 import models
 import schemas
 import security
 import crud
+import executors
 from database import get_db
+import upstream
+import upstream_scheduler
+from settings import settings
 
 router = APIRouter(prefix="/ozon_auth", tags=["Ozon Auth"])
 
 # --- Ваша превосходная функция валидации остается без изменений ---
 async def validate_ozon_keys(client_id: str, api_key: str):
     # ... (ваш код валидации)
-    url = "https://api-seller.ozon.ru/v1/warehouse/list"
+    url = f"{upstream.OZON_API_URL}/v1/warehouse/list"
     headers = {"Client-Id": client_id, "Api-Key": api_key, "Content-Type": "application/json"}
     payload = {} 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(url, headers=headers, json=payload)
-            if response.status_code == 200: return True
-            elif response.status_code in [401, 403, 404]:
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Неверный Client-Id или Api-Key.")
-            else: response.raise_for_status()
-        except httpx.RequestError as exc:
-            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Не удалось связаться с сервером Ozon.")
+    # httpx импортируется при первом запросе, а не при старте воркера
+    import httpx
+    client = upstream.get_client()
+    try:
+        response = await client.post(url, headers=headers, json=payload)
+        if response.status_code == 200: return True
+        elif response.status_code in [401, 403, 404]:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Неверный Client-Id или Api-Key.")
+        else: response.raise_for_status()
+    except httpx.RequestError as exc:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Не удалось связаться с сервером Ozon.")
 
 # --- УНИВЕРСАЛЬНЫЙ ЭНДПОИНТ ДЛЯ СОЗДАНИЯ КЛЮЧЕЙ ---
 @router.post(
@@ -101,3 +110,139 @@ async def create_or_update_ozon_auth(
     await db.commit()
     await db.refresh(auth_entry)
     return auth_entry
+
+
+# =============================================================================
+# МАССОВАЯ ЗАГРУЗКА КЛЮЧЕЙ (ПОДКЛЮЧЕНИЕ МНОГИХ ПРОДАВЦОВ СРАЗУ)
+# Ключи проверяются в Ozon параллельно, не больше ozon_auth_bulk_concurrency
+# сразу; одинаковая пара ключей проверяется один раз. Пара, которую Ozon
+# принял, помнится ozon_auth_validation_ttl_seconds (по хешу, без самих
+# ключей), поэтому повторная загрузка того же списка не ходит в Ozon.
+# Все прошедшие проверку записи сохраняются одним INSERT ... ON CONFLICT
+# в одной транзакции; ответ - результат по каждой записи в порядке запроса.
+# =============================================================================
+
+# Хеш пары ключей -> время (time.monotonic), до которого проверка действительна
+_valid_pairs: dict[bytes, float] = {}
+_VALID_PAIRS_MAX = 10000
+
+
+def _pair_digest(ozon_client_id: str, api_key: str) -> bytes:
+    return hashlib.sha256(f"{ozon_client_id}\0{api_key}".encode()).digest()
+
+
+def _remember_valid(digest: bytes) -> None:
+    now = time.monotonic()
+    if len(_valid_pairs) >= _VALID_PAIRS_MAX:
+        for key in [key for key, expires in _valid_pairs.items() if expires <= now]:
+            del _valid_pairs[key]
+        if len(_valid_pairs) >= _VALID_PAIRS_MAX:
+            _valid_pairs.clear()
+    _valid_pairs[digest] = now + settings.ozon_auth_validation_ttl_seconds
+
+
+async def _check_key_pair(client_id: int, ozon_client_id: str, api_key: str) -> tuple[str, Optional[str]]:
+    """Проверяет пару ключей в Ozon. Возвращает (статус записи, пояснение)."""
+    digest = _pair_digest(ozon_client_id, api_key)
+    if _valid_pairs.get(digest, 0) > time.monotonic():
+        return "valid", None
+
+    import httpx
+
+    headers = {"Client-Id": ozon_client_id, "Api-Key": api_key, "Content-Type": "application/json"}
+    try:
+        async with upstream_scheduler.scheduler.slot(client_id):
+            response = await upstream.get_client().post(
+                f"{upstream.OZON_API_URL}/v1/warehouse/list", headers=headers, json={}
+            )
+    except httpx.RequestError:
+        return "ozon_unavailable", "Не удалось связаться с сервером Ozon."
+    if response.status_code == 200:
+        _remember_valid(digest)
+        return "valid", None
+    if response.status_code in (401, 403, 404):
+        return "invalid_keys", "Неверный Client-Id или Api-Key."
+    return "ozon_unavailable", f"Ozon ответил {response.status_code} на проверку ключей."
+
+
+def _encrypt_rows(entries: list) -> list[dict]:
+    return [
+        {
+            "client_id": entry.client_id,
+            "encrypted_ozon_client_id": security.encrypt_data(entry.ozon_client_id),
+            "encrypted_ozon_api_key": security.encrypt_data(entry.ozon_api_key),
+        }
+        for entry in entries
+    ]
+
+
+@router.post(
+    "/bulk",
+    response_model=List[schemas.ClientOzonAuthBulkResult],
+    summary="Массово создать или обновить ключи Ozon"
+)
+async def bulk_create_or_update_ozon_auth(
+    payload: schemas.ClientOzonAuthBulkCreate,
+    db: AsyncSession = Depends(get_db),
+    current_admin: models.User = Depends(security.get_current_superuser),
+):
+    """
+    Загружает ключи Ozon многих клиентов за один запрос (только суперпользователь).
+    Записи с неверными ключами, неизвестным клиентом или повтором клиента
+    пропускаются, остальные сохраняются вместе. Результат - по каждой записи.
+    """
+    entries = payload.entries
+    result = await db.execute(
+        select(models.Client.id).where(models.Client.id.in_({entry.client_id for entry in entries}))
+    )
+    known_clients = set(result.scalars().all())
+
+    results: list[Optional[schemas.ClientOzonAuthBulkResult]] = [None] * len(entries)
+    checks: dict[tuple[str, str], asyncio.Task] = {}
+    pending: list[int] = []
+    seen_clients: set[int] = set()
+    semaphore = asyncio.Semaphore(max(1, settings.ozon_auth_bulk_concurrency))
+
+    async def check(entry) -> tuple[str, Optional[str]]:
+        async with semaphore:
+            return await _check_key_pair(entry.client_id, entry.ozon_client_id, entry.ozon_api_key)
+
+    for index, entry in enumerate(entries):
+        if entry.client_id not in known_clients:
+            results[index] = schemas.ClientOzonAuthBulkResult(
+                client_id=entry.client_id, status="client_not_found", detail=f"Клиент с ID {entry.client_id} не найден."
+            )
+        elif entry.client_id in seen_clients:
+            results[index] = schemas.ClientOzonAuthBulkResult(
+                client_id=entry.client_id, status="duplicate_client", detail="Клиент уже встречался выше в списке."
+            )
+        else:
+            seen_clients.add(entry.client_id)
+            pair = (entry.ozon_client_id, entry.ozon_api_key)
+            if pair not in checks:
+                checks[pair] = asyncio.create_task(check(entry))
+            pending.append(index)
+
+    await asyncio.gather(*checks.values())
+
+    accepted = []
+    for index in pending:
+        entry = entries[index]
+        check_status, detail = checks[(entry.ozon_client_id, entry.ozon_api_key)].result()
+        if check_status == "valid":
+            accepted.append(index)
+        else:
+            results[index] = schemas.ClientOzonAuthBulkResult(client_id=entry.client_id, status=check_status, detail=detail)
+
+    if accepted:
+        # Шифрование сотен записей - в пуле потоков, как и сериализация больших списков
+        accepted_entries = [entries[index] for index in accepted]
+        rows = await executors.run_sized(len(accepted_entries), settings.offload_min_items, _encrypt_rows, accepted_entries)
+        existing = await crud.upsert_ozon_auths(db, rows)
+        await db.commit()
+        for index in accepted:
+            client_id = entries[index].client_id
+            results[index] = schemas.ClientOzonAuthBulkResult(
+                client_id=client_id, status="updated" if client_id in existing else "created"
+            )
+    return results
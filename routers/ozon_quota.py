@@ -0,0 +1,22 @@
+# File: routers/ozon_quota.py
+
+from fastapi import APIRouter, Depends
+from typing import List, Optional
+
+import schemas
+import ozon_quota
+from security import get_current_superuser
+
+router = APIRouter(
+    prefix="/admin/ozon-quota",
+    tags=["Admin: Ozon Quota"],
+    dependencies=[Depends(get_current_superuser)]
+)
+
+@router.get("/", response_model=List[schemas.OzonQuotaUsage])
+async def read_ozon_quota(client_id: Optional[int] = None):
+    """
+    Запросы в Ozon в текущем окне по всем воркерам этого сервера:
+    по клиенту в целом (`method` = null) и по каждому методу, с остатком лимита.
+    """
+    return ozon_quota.headroom(client_id)
@@ -1,5 +1,5 @@
 # In: routers/permissions.py
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from typing import List
@@ -7,6 +7,7 @@ from typing import List
 # Абсолютные импорты, которые мы исправили
 import models
 import schemas
+import reference_cache
 from database import get_db
 from security import get_current_superuser
 
@@ -41,6 +42,7 @@ async def create_permission(permission: schemas.PermissionCreate, db: AsyncSessi
     new_perm = models.Permission(**permission.dict())
     db.add(new_perm)
     await db.commit()
+    reference_cache.invalidate_permissions()
     await db.refresh(new_perm)
     return new_perm
 
@@ -49,10 +51,10 @@ async def create_permission(permission: schemas.PermissionCreate, db: AsyncSessi
 async def read_permissions(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
     """
     Возвращает список всех прав из справочника.
+    Отдается готовым JSON из снимка в памяти, без ORM и валидации каждой строки.
     """
-    result = await db.execute(select(models.Permission).offset(skip).limit(limit))
-    permissions = result.scalars().all()
-    return permissions
+    content = await reference_cache.permissions_json(db, skip=skip, limit=limit)
+    return Response(content=content, media_type="application/json")
 
 # READ (one)
 @router.get("/{permission_id}", response_model=schemas.PermissionRead)
@@ -89,6 +91,7 @@ async def update_permission(
 
     db.add(db_perm)
     await db.commit()
+    reference_cache.invalidate_permissions()
     await db.refresh(db_perm)
     return db_perm
 
@@ -106,4 +109,5 @@ async def delete_permission(permission_id: int, db: AsyncSession = Depends(get_d
 
     await db.delete(db_perm)
     await db.commit()
+    reference_cache.invalidate_permissions()
     return None
@@ -0,0 +1,33 @@
+# File: routers/profiles.py
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse, PlainTextResponse
+from typing import List, Literal
+
+import schemas
+import profiling
+from security import get_current_superuser
+
+router = APIRouter(
+    prefix="/admin/profiles",
+    tags=["Admin: Profiling"],
+    dependencies=[Depends(get_current_superuser)]
+)
+
+@router.get("/", response_model=List[schemas.ProfileInfo])
+async def read_profiles():
+    """
+    Сохраненные профили запросов, новые первыми.
+    Профиль снимается, если суперпользователь отправил запрос с заголовком `X-Profile: 1`.
+    """
+    return profiling.list_profiles()
+
+@router.get("/{profile_id}")
+async def read_profile(profile_id: str, format: Literal["pstats", "text"] = Query("pstats")):
+    """Файл профиля в формате pstats или топ функций текстом (`format=text`)."""
+    path = profiling.profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    if format == "text":
+        return PlainTextResponse(profiling.profile_text(path))
+    return FileResponse(path, media_type="application/octet-stream", filename=path.name)
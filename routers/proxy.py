@@ -4,21 +4,89 @@ from fastapi import (
     APIRouter, Request, Depends, HTTPException, 
     status, Response, Body, Header # 1. Убедитесь, что Header импортирован
 )
+from fastapi.responses import StreamingResponse
+import asyncio
+import math
+import time
 from typing import Optional, Any
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 from cryptography.fernet import InvalidToken
-import httpx
 
 import models
 import schemas
 import crud
 from database import get_db
 import security
+import metrics
+import server_timing
+import upstream
+import upstream_scheduler
+import ozon_quota
+import write_coalescer
+from settings import settings
 
 router = APIRouter(prefix="/proxy", tags=["Proxy"])
 
+# Заголовки соединения с Ozon (hop-by-hop) клиенту не передаются
+_HOP_BY_HOP_HEADERS = frozenset({
+    b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization",
+    b"te", b"trailer", b"transfer-encoding", b"upgrade",
+})
+
+def _fits_buffer(response) -> bool:
+    """Ответ с известной длиной до settings.proxy_buffer_max_bytes собираем в память целиком."""
+    try:
+        return int(response.headers["content-length"]) <= settings.proxy_buffer_max_bytes
+    except (KeyError, ValueError):
+        return False
+
+def _forwarded_headers(response, body_length: Optional[int] = None) -> list[tuple[bytes, bytes]]:
+    headers = [(key, value) for key, value in response.headers.raw if key.lower() not in _HOP_BY_HOP_HEADERS]
+    if body_length is not None and not any(key.lower() == b"content-length" for key, _ in headers):
+        headers.append((b"content-length", str(body_length).encode()))
+    return headers
+
+def _check_quota(client_id: int, ozon_path: str) -> None:
+    """Лимиты Ozon общие для всех воркеров: проверяем до расшифровки и запроса."""
+    retry_after = ozon_quota.acquire(client_id, ozon_path)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Превышен лимит запросов в Ozon для клиента (ID: {client_id}) по методу '{ozon_path}'",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+class _UpstreamStream(StreamingResponse):
+    """
+    Тело ответа Ozon по частям. Соединение возвращается в пул, а слот - в
+    очередь клиента ровно один раз: после отправки, обрыва связи или отмены.
+    finally генератора тела для этого не годится: при обрыве до первой
+    части StreamingResponse не начинает его перебор, и слот терялся бы.
+    """
+
+    def __init__(self, response, client_id: int):
+        super().__init__(response.aiter_raw(), status_code=response.status_code)
+        self.raw_headers = _forwarded_headers(response)
+        self._upstream_response = response
+        self._client_id = client_id
+        self._released = False
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.release()
+
+    async def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        upstream_scheduler.scheduler.release(self._client_id)
+        # Закрытие соединения не должно прерваться повторной отменой запроса
+        await asyncio.shield(self._upstream_response.aclose())
+
 # =============================================================================
 # ОБЩАЯ "РАБОЧАЯ" ФУНКЦИЯ (САМАЯ ФИНАЛЬНАЯ ВЕРСИЯ)
 # =============================================================================
@@ -34,25 +102,36 @@ async def _common_proxy_logic(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Доступ запрещен.")
 
     # Проверка прав доступа (остается без изменений)
+    started = time.perf_counter()
     has_permission = await crud.check_client_permission(db=db, client_id=x_target_client_id, permission_name=ozon_path)
+    server_timing.record("permission", started)
     if not has_permission:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"У клиента (ID: {x_target_client_id}) нет разрешения на вызов метода '{ozon_path}'")
 
-    # --- ФИНАЛЬНОЕ ИСПРАВЛЕНИЕ ЗДЕСЬ ---
-    # Заменяем прямой вызов к базе на нашу новую, надежную CRUD-функцию
-    target_client = await crud.get_client(db, client_id=x_target_client_id)
+    # Для пересылки нужны только ключи Ozon: читаем одну строку client_ozon_auth,
+    # а не клиента со всеми связями (это было 7 SQL-запросов вместо одного)
+    started = time.perf_counter()
+    ozon_auth = await crud.get_ozon_auth_by_client_id(db, client_id=x_target_client_id)
+    server_timing.record("keys", started)
 
     # Проверка наличия клиента и его ключей (остается без изменений)
-    if not target_client or not target_client.ozon_auth:
+    if not ozon_auth:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Клиент с ID {x_target_client_id} или его ключи Ozon не найдены.")
 
+    # Запросы, которые могут уйти в Ozon общей пачкой, учитываются в лимитах
+    # один раз на пачку (write_coalescer.py), остальные - здесь
+    coalesce_key = write_coalescer.items_key(request.method, ozon_path)
+    if coalesce_key is None:
+        _check_quota(x_target_client_id, ozon_path)
+
     # Расшифровка ключей (остается без изменений)
+    started = time.perf_counter()
     try:
         # Пытаемся расшифровать Client-Id
-        decrypted_client_id = security.decrypt_data(target_client.ozon_auth.encrypted_ozon_client_id)
+        decrypted_client_id = security.decrypt_data(ozon_auth.encrypted_ozon_client_id)
     except InvalidToken:
         # Если токен невалиден, показываем его
-        failed_value = target_client.ozon_auth.encrypted_ozon_client_id
+        failed_value = ozon_auth.encrypted_ozon_client_id
         raise HTTPException(
             status_code=500,
             detail=f"Не удалось расшифровать Client-Id. Ключ шифрования не подходит. Проблемное значение в базе: '{failed_value}'"
@@ -63,28 +142,62 @@ async def _common_proxy_logic(
 
     try:
         # Пытаемся расшифровать Api-Key
-        decrypted_api_key = security.decrypt_data(target_client.ozon_auth.encrypted_ozon_api_key)
+        decrypted_api_key = security.decrypt_data(ozon_auth.encrypted_ozon_api_key)
     except InvalidToken:
         # Если токен невалиден, показываем его
-        failed_value = target_client.ozon_auth.encrypted_ozon_api_key
+        failed_value = ozon_auth.encrypted_ozon_api_key
         raise HTTPException(
             status_code=500,
             detail=f"Не удалось расшифровать Api-Key. Ключ шифрования не подходит. Проблемное значение в базе: '{failed_value}'"
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Неожиданная ошибка при расшифровке Api-Key: {e}")
+    server_timing.record("decrypt", started)
 
     # Пересылка запроса в Ozon (весь остальной код функции остается без изменений)
-    ozon_api_url = f"https://api-seller.ozon.ru/{ozon_path}"
+    ozon_api_url = f"{upstream.OZON_API_URL}/{ozon_path}"
     headers_to_forward = {
         "Client-Id": decrypted_client_id,
         "Api-Key": decrypted_api_key,
         "Content-Type": request.headers.get("content-type", "application/json"),
+        # Тело отдается без распаковки, поэтому сжатие - только то, что принимает вызывающий
+        # (без заголовка httpx попросил бы gzip, deflate от своего имени)
+        "Accept-Encoding": request.headers.get("accept-encoding", "identity"),
     }
-    
+
+    started = time.perf_counter()
     body_bytes = await request.body()
+    server_timing.record("body", started)
+
+    # Дальше база не нужна: соединение возвращается в пул, пока запрос
+    # ждет пачки, очереди клиента и ответа Ozon
+    await db.close()
+
+    if coalesce_key is not None:
+        items = write_coalescer.batchable_items(body_bytes, coalesce_key)
+        if items is not None:
+            started = time.perf_counter()
+            response = await write_coalescer.coalescer.submit(
+                x_target_client_id, ozon_path, coalesce_key, items,
+                {"Client-Id": decrypted_client_id, "Api-Key": decrypted_api_key},
+            )
+            server_timing.record("upstream", started)
+            return response
+        _check_quota(x_target_client_id, ozon_path)
 
-    async with httpx.AsyncClient() as ozon_client:
+    # httpx импортируется при первом запросе, а не при старте воркера
+    import httpx
+    # Общий клиент из upstream.py: соединения с Ozon переиспользуются между запросами
+    ozon_client = upstream.get_client()
+    # Своя очередь у каждого клиента: тяжелый клиент не занимает весь пул.
+    # Слот держится, пока тело ответа не отдано (для потока - в _UpstreamStream)
+    started = time.perf_counter()
+    await upstream_scheduler.scheduler.acquire(x_target_client_id)
+    server_timing.record("queue", started)
+    streaming = False
+    # ozon_path уже прошел проверку прав, поэтому годится как метка метрик
+    started = time.perf_counter()
+    with metrics.UpstreamTimer(ozon_path) as timer:
         try:
             req = ozon_client.build_request(
                 method=request.method,
@@ -92,13 +205,35 @@ async def _common_proxy_logic(
                 headers=headers_to_forward,
                 params=request.query_params,
                 content=body_bytes,
-                timeout=30.0,
+                extensions={"trace": timer.trace},
             )
-            response = await ozon_client.send(req)
+            response = await ozon_client.send(req, stream=True)
+            buffered = _fits_buffer(response)
+            if buffered:
+                try:
+                    body = b"".join([chunk async for chunk in response.aiter_raw()])
+                finally:
+                    await response.aclose()
+            streaming = not buffered
         except httpx.RequestError as exc:
+            timer.record("error")
             raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Ошибка соединения с Ozon API: {exc}")
+        finally:
+            if not streaming:
+                upstream_scheduler.scheduler.release(x_target_client_id)
+        timer.record(response.status_code)
+    server_timing.record("upstream", started)
 
-    return Response(content=response.content, status_code=response.status_code, headers=dict(response.headers))
+    # Тело пересылается как получено, без распаковки и лишних копий:
+    # Content-Encoding и Content-Length от Ozon остаются верными
+    started = time.perf_counter()
+    if buffered:
+        proxied = Response(content=body, status_code=response.status_code)
+        proxied.raw_headers = _forwarded_headers(response, body_length=len(body))
+    else:
+        proxied = _UpstreamStream(response, x_target_client_id)
+    server_timing.record("response", started)
+    return proxied
 
 # =============================================================================
 # "ТОНКИЕ" ЭНДПОИНТЫ (С ВОЗВРАЩЕННЫМИ `Header` и `Body`)
@@ -0,0 +1,66 @@
+# File: routers/reference.py
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+import models
+import schemas
+import crud
+import reference_sync
+from database import get_db
+from security import get_current_superuser, get_current_user
+
+# Справочники Ozon из локальной копии: запросов в Ozon и расхода лимитов нет
+router = APIRouter(
+    prefix="/reference",
+    tags=["Reference"],
+    dependencies=[Depends(get_current_user)]
+)
+
+@router.get("/categories", response_model=List[schemas.OzonCategory])
+async def read_categories(parent_id: Optional[int] = None, db: AsyncSession = Depends(get_db)):
+    """Категории дерева Ozon: дочерние для parent_id, без него - корневые."""
+    return await crud.get_ozon_categories(db, parent_id=parent_id)
+
+@router.get("/categories/{category_id}", response_model=schemas.OzonCategoryNode)
+async def read_category(category_id: int, db: AsyncSession = Depends(get_db)):
+    """Категория с дочерними категориями и типами товаров в ней."""
+    category = await db.get(models.OzonCategory, category_id)
+    if category is None:
+        raise HTTPException(status_code=404, detail="Категория не найдена")
+    node = schemas.OzonCategoryNode.model_validate(category)
+    node.children = await crud.get_ozon_categories(db, parent_id=category_id)
+    node.types = await crud.get_ozon_category_types(db, category_id=category_id)
+    return node
+
+@router.get("/categories/{category_id}/types/{type_id}/attributes", response_model=List[schemas.OzonTypeAttribute])
+async def read_type_attributes(category_id: int, type_id: int, db: AsyncSession = Depends(get_db)):
+    """Характеристики типа товара в категории, обязательные первыми."""
+    attributes = await crud.get_ozon_type_attributes(db, category_id=category_id, type_id=type_id)
+    if not attributes:
+        raise HTTPException(status_code=404, detail="Тип товара не найден или его характеристики еще не получены")
+    return attributes
+
+@router.get("/attributes", response_model=List[schemas.OzonAttribute])
+async def read_attributes(attribute_id: List[int] = Query(..., alias="id", max_length=1000), db: AsyncSession = Depends(get_db)):
+    """Характеристики по ID: /reference/attributes?id=85&id=9048. Неизвестные ID пропускаются."""
+    return await crud.get_ozon_attributes(db, attribute_ids=attribute_id)
+
+@router.get("/attributes/{attribute_id}", response_model=schemas.OzonAttribute)
+async def read_attribute(attribute_id: int, db: AsyncSession = Depends(get_db)):
+    attribute = await db.get(models.OzonAttribute, attribute_id)
+    if attribute is None:
+        raise HTTPException(status_code=404, detail="Характеристика не найдена")
+    return attribute
+
+@router.get("/sync", response_model=Optional[schemas.ReferenceSyncState], dependencies=[Depends(get_current_superuser)])
+async def read_reference_sync_state(db: AsyncSession = Depends(get_db)):
+    """Состояние обновления справочников; null - обновление еще не запускалось."""
+    return await db.get(models.ReferenceSyncState, reference_sync.STATE_ID)
+
+@router.post("/sync", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(get_current_superuser)])
+async def start_reference_sync():
+    """Запускает обновление справочников, не дожидаясь планового прохода."""
+    await reference_sync.request_sync()
+    return {"queued": True}
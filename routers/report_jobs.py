@@ -0,0 +1,74 @@
+# File: routers/report_jobs.py
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from typing import List, Optional
+
+import models
+import schemas
+import crud
+import report_jobs
+from database import get_db
+from security import get_current_superuser
+
+router = APIRouter(
+    prefix="/report-jobs",
+    tags=["Report Jobs"],
+    dependencies=[Depends(get_current_superuser)]
+)
+
+@router.post("/", response_model=schemas.ReportJob, status_code=status.HTTP_202_ACCEPTED)
+async def create_report_job(job_in: schemas.ReportJobCreate, db: AsyncSession = Depends(get_db)):
+    """
+    Создает задачу на отчет Ozon. Сервер сам вызовет `method` с телом `params`,
+    дождется готовности отчета и скачает файл. Статус: GET /report-jobs/{id}.
+    """
+    # Те же проверки, что у прокси: право клиента на метод и наличие ключей
+    if not await crud.check_client_permission(db=db, client_id=job_in.client_id, permission_name=job_in.method):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"У клиента (ID: {job_in.client_id}) нет разрешения на вызов метода '{job_in.method}'",
+        )
+    if await crud.get_ozon_auth_by_client_id(db, client_id=job_in.client_id) is None:
+        raise HTTPException(status_code=404, detail=f"Клиент с ID {job_in.client_id} или его ключи Ozon не найдены.")
+    return await report_jobs.submit(db, client_id=job_in.client_id, method=job_in.method, params=job_in.params)
+
+@router.get("/", response_model=List[schemas.ReportJob])
+async def read_report_jobs(
+    client_id: Optional[int] = None,
+    job_status: Optional[models.ReportJobStatus] = Query(None, alias="status"),
+    skip: int = 0,
+    limit: int = Query(100, le=1000),
+    db: AsyncSession = Depends(get_db),
+):
+    """Задачи на отчеты, новые первыми."""
+    query = select(models.ReportJob).order_by(models.ReportJob.id.desc()).offset(skip).limit(limit)
+    if client_id is not None:
+        query = query.filter(models.ReportJob.client_id == client_id)
+    if job_status is not None:
+        query = query.filter(models.ReportJob.status == job_status)
+    result = await db.execute(query)
+    return result.scalars().all()
+
+@router.get("/{job_id}", response_model=schemas.ReportJob)
+async def read_report_job(job_id: int, wait: float = Query(0, ge=0, le=60)):
+    """
+    Состояние задачи. С `wait` > 0 ответ придет, когда задача завершится,
+    но не позже чем через `wait` секунд (длинный опрос).
+    """
+    job = await report_jobs.wait_for(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
+
+@router.api_route("/{job_id}/file", methods=["GET", "HEAD"])
+async def read_report_file(job_id: int, request: Request):
+    """Файл готового отчета: поддерживает Range, ETag/If-None-Match и gzip (см. artifacts.py)."""
+    job = await report_jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    response = report_jobs.file_response(request, job)
+    if response is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Файл отчета недоступен, статус задачи: {job.status.value}")
+    return response
@@ -0,0 +1,60 @@
+# File: routers/service_keys.py
+
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+import models
+import schemas
+import service_keys
+from database import get_db
+from security import get_current_superuser
+
+router = APIRouter(
+    prefix="/admin/service-keys",
+    tags=["Admin: Service Keys"],
+    dependencies=[Depends(get_current_superuser)]
+)
+
+@router.post("/", response_model=schemas.ServiceAccountKeyCreated, status_code=status.HTTP_201_CREATED)
+async def create_service_key(payload: schemas.ServiceAccountKeyCreate, db: AsyncSession = Depends(get_db)):
+    """
+    Выпускает ключ для машинного клиента, работающего от имени пользователя `user_id`.
+    Ключ целиком возвращается только в этом ответе: в базе хранится лишь его HMAC.
+    """
+    if await db.get(models.User, payload.user_id) is None:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    api_key, key_prefix, key_hash = service_keys.generate()
+    db_key = models.ServiceAccountKey(
+        user_id=payload.user_id, name=payload.name, key_prefix=key_prefix, key_hash=key_hash
+    )
+    db.add(db_key)
+    await db.commit()
+    service_keys.invalidate()
+    return schemas.ServiceAccountKeyCreated(
+        api_key=api_key, **schemas.ServiceAccountKey.model_validate(db_key).model_dump()
+    )
+
+@router.get("/", response_model=List[schemas.ServiceAccountKey])
+async def read_service_keys(user_id: Optional[int] = None, db: AsyncSession = Depends(get_db)):
+    """Выпущенные ключи (без самих ключей), в том числе отозванные."""
+    query = select(models.ServiceAccountKey).order_by(models.ServiceAccountKey.id)
+    if user_id is not None:
+        query = query.where(models.ServiceAccountKey.user_id == user_id)
+    result = await db.execute(query)
+    return result.scalars().all()
+
+@router.delete("/{key_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_service_key(key_id: int, db: AsyncSession = Depends(get_db)):
+    """Отзывает ключ: во всех воркерах он перестает приниматься со следующего запроса."""
+    db_key = await db.get(models.ServiceAccountKey, key_id)
+    if db_key is None:
+        raise HTTPException(status_code=404, detail="Ключ не найден")
+    if db_key.revoked_at is None:
+        db_key.revoked_at = datetime.utcnow()
+        await db.commit()
+        service_keys.invalidate()
+    return None
@@ -0,0 +1,80 @@
+# File: routers/stocks.py
+
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from typing import List, Literal, Optional
+
+import models
+import schemas
+import crud
+import stock_sync
+import sap_export
+from database import get_db
+from security import get_current_superuser
+
+router = APIRouter(
+    prefix="/stocks",
+    tags=["Stocks"],
+    dependencies=[Depends(get_current_superuser)]
+)
+
+@router.get("/rollup", response_model=List[schemas.StockRollup])
+async def read_stock_rollup(
+    group_by: Literal["our_warehouse", "sap_plant_code"] = "our_warehouse",
+    client_id: Optional[int] = None,
+    sku: Optional[int] = None,
+    our_warehouse_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Остатки всех клиентов (или одного) по нашим складам или заводам SAP.
+    Считается по локальной копии остатков, без запросов в Ozon.
+    """
+    return await crud.get_stock_rollup(
+        db, group_by=group_by, client_id=client_id, sku=sku, our_warehouse_id=our_warehouse_id
+    )
+
+@router.get("/sap-export")
+async def export_stocks_for_sap(
+    export_format: Literal["csv", "fixed"] = Query("csv", alias="format"),
+    plant: Optional[str] = Query(None, pattern="^[A-Za-z0-9_-]{1,20}$", description="Код завода SAP; без него - все заводы"),
+):
+    """
+    Остатки клиентов по заводам SAP для загрузки в SAP: CSV с ";" или
+    строки фиксированной ширины (поля и ширина - sap_export.LAYOUT).
+    Файл отдается потоком по мере чтения, из локальной копии остатков.
+    """
+    extension = "csv" if export_format == sap_export.CSV else "txt"
+    filename = f"sap_stock_{plant or 'all'}_{datetime.utcnow():%Y%m%d}.{extension}"
+    return StreamingResponse(
+        sap_export.stream(export_format, plant=plant),
+        media_type="text/csv; charset=utf-8" if export_format == sap_export.CSV else "text/plain; charset=utf-8",
+        headers={"content-disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.get("/", response_model=List[schemas.StockSnapshot])
+async def read_stocks(
+    client_id: int,
+    sku: Optional[int] = None,
+    skip: int = 0,
+    limit: int = Query(100, le=1000),
+    db: AsyncSession = Depends(get_db),
+):
+    """Остатки клиента по складам Ozon из локальной копии."""
+    return await crud.get_stocks(db, client_id=client_id, sku=sku, skip=skip, limit=limit)
+
+@router.get("/sync/", response_model=List[schemas.StockSyncState])
+async def read_stock_sync_states(db: AsyncSession = Depends(get_db)):
+    """Состояние синхронизации остатков по клиентам."""
+    result = await db.execute(select(models.StockSyncState).order_by(models.StockSyncState.client_id))
+    return result.scalars().all()
+
+@router.post("/sync/{client_id}", status_code=status.HTTP_202_ACCEPTED)
+async def start_stock_sync(client_id: int):
+    """Запускает синхронизацию остатков клиента, не дожидаясь планового прохода."""
+    if not await stock_sync.request_sync(client_id):
+        raise HTTPException(status_code=404, detail=f"Клиент с ID {client_id} или его ключи Ozon не найдены.")
+    return {"client_id": client_id, "queued": True}
@@ -0,0 +1,22 @@
+# File: routers/upstream_queue.py
+
+from fastapi import APIRouter, Depends
+from typing import List, Optional
+
+import schemas
+import upstream_scheduler
+from security import get_current_superuser
+
+router = APIRouter(
+    prefix="/admin/upstream-queue",
+    tags=["Admin: Upstream Queue"],
+    dependencies=[Depends(get_current_superuser)]
+)
+
+@router.get("/", response_model=List[schemas.UpstreamQueueState])
+async def read_upstream_queue(client_id: Optional[int] = None):
+    """
+    Очереди запросов в Ozon по клиентам в этом воркере: сколько запросов
+    выполняется, сколько ждет слота и как давно ждет самый старый.
+    """
+    return upstream_scheduler.scheduler.state(client_id)
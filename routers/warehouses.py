@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Response
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
@@ -6,6 +7,8 @@ from typing import List
 
 import models
 import schemas
+import crud
+import reference_cache
 from database import get_db
 
 router = APIRouter()
@@ -20,14 +23,18 @@ async def create_our_warehouse(warehouse: schemas.OurWarehouseCreate, db: AsyncS
     db_warehouse = models.OurWarehouse(**warehouse.dict())
     db.add(db_warehouse)
     await db.commit()
+    reference_cache.invalidate_our_warehouses()
     await db.refresh(db_warehouse)
     return db_warehouse
 
 @router.get("/our_warehouses/", response_model=List[schemas.OurWarehouse], tags=["Admin: Our Warehouses"])
 async def read_our_warehouses(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    """Возвращает список всех складов из вашего справочника."""
-    result = await db.execute(select(models.OurWarehouse).offset(skip).limit(limit))
-    return result.scalars().all()
+    """
+    Возвращает список всех складов из вашего справочника.
+    Отдается готовым JSON из снимка в памяти, без ORM и валидации каждой строки.
+    """
+    content = await reference_cache.our_warehouses_json(db, skip=skip, limit=limit)
+    return Response(content=content, media_type="application/json")
 
 # --- НОВЫЙ ЭНДПОИНТ ---
 @router.get("/our_warehouses/{warehouse_id}", response_model=schemas.OurWarehouse, tags=["Admin: Our Warehouses"])
@@ -56,6 +63,7 @@ async def update_our_warehouse(
 
     db.add(db_warehouse)
     await db.commit()
+    reference_cache.invalidate_our_warehouses()
     await db.refresh(db_warehouse)
     return db_warehouse
 
@@ -68,6 +76,7 @@ async def delete_our_warehouse(warehouse_id: int, db: AsyncSession = Depends(get
         raise HTTPException(status_code=404, detail="Склад не найден в справочнике")
     await db.delete(db_warehouse)
     await db.commit()
+    reference_cache.invalidate_our_warehouses()
     return None
 
 # ===================================================================
@@ -88,17 +97,20 @@ async def link_client_warehouse(
     if not our_warehouse:
         raise HTTPException(status_code=404, detail="Склад из справочника не найден")
 
-    db_client_warehouse = models.ClientWarehouse(**warehouse.dict(), client_id=client_id)
-    db.add(db_client_warehouse)
-    await db.commit()
-    await db.refresh(db_client_warehouse)
-    
-    result = await db.execute(
-        select(models.ClientWarehouse)
-        .options(selectinload(models.ClientWarehouse.our_warehouse))
-        .filter(models.ClientWarehouse.id == db_client_warehouse.id)
+    # Наш склад уже загружен - передаем его сразу, чтобы собрать ответ
+    # без refresh() и повторного SELECT. Повторную привязку того же склада
+    # Ozon отсекает уникальный индекс (client_id, mp_warehouse_id).
+    db_client_warehouse = models.ClientWarehouse(
+        client_id=client_id,
+        mp_warehouse_id=warehouse.mp_warehouse_id,
+        our_warehouse=our_warehouse,
     )
-    return result.scalars().first()
+    try:
+        db_client_warehouse = await crud.save_new(db, db_client_warehouse)
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Этот склад Ozon уже привязан к клиенту")
+    reference_cache.invalidate_client_warehouses()
+    return db_client_warehouse
 
 @router.get("/clients/{client_id}/warehouses/", response_model=List[schemas.ClientWarehouse], tags=["Client Warehouses"])
 async def read_client_warehouses(client_id: int, db: AsyncSession = Depends(get_db)):
@@ -118,4 +130,5 @@ async def unlink_client_warehouse(client_warehouse_id: int, db: AsyncSession = D
         raise HTTPException(status_code=404, detail="Привязка склада не найдена")
     await db.delete(db_link)
     await db.commit()
+    reference_cache.invalidate_client_warehouses()
     return None
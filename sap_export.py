@@ -0,0 +1,184 @@
+# File: sap_export.py
+
+import asyncio
+import csv
+import io
+from collections import deque
+from typing import AsyncIterator, Optional
+
+from sqlalchemy.future import select
+
+# Импортируем наши собственные модули
+import db_stats
+import models
+import reference_cache
+from database import SessionLocal
+from settings import settings
+
+# =============================================================================
+# ВЫГРУЗКА ОСТАТКОВ ДЛЯ SAP
+# Строка выгрузки: завод SAP (sap_plant_code нашего склада), ИНН клиента,
+# SKU, артикул, остаток и резерв. Остатки клиента на разных складах Ozon,
+# привязанных к одному заводу, складываются. Склады без привязки или
+# без кода завода в выгрузку не попадают.
+#
+# Данные берутся из локальной копии остатков (stock_sync.py), склад Ozon
+# переводится в завод по словарю привязок в памяти
+# (reference_cache.client_warehouse_index), без JOIN на каждую строку.
+# Клиенты читаются параллельно, не больше settings.sap_export_concurrency
+# сразу. Каждый пишет готовые куски в свою короткую очередь, а ответ
+# отдает клиентов по порядку ID. Поэтому память не зависит от объема
+# выгрузки: в ней лежит несколько кусков на каждого читаемого клиента.
+# =============================================================================
+
+CSV = "csv"
+FIXED = "fixed"
+
+# Поля строки и их ширина в формате fixed. Числа дополняются нулями слева,
+# знак минуса занимает первую позицию (-00000000005). Число, которое не
+# влезает в ширину, не обрезается: выгрузка прерывается с ошибкой, иначе
+# SAP молча получил бы другое значение. Текст дополняется пробелами справа
+# и обрезается по ширине. Ширина - в символах.
+LAYOUT = (
+    ("WERKS", 4),
+    ("CLIENT_INN", 12),
+    ("SKU", 20),
+    ("OFFER_ID", 50),
+    ("PRESENT", 13),
+    ("RESERVED", 13),
+)
+_NUMERIC_FIELDS = frozenset({"SKU", "PRESENT", "RESERVED"})
+_LINE_END = "\r\n"
+
+_FETCH_ROWS = 2000       # строк остатков из базы за раз
+_QUEUE_CHUNKS = 4        # готовых кусков в очереди одного клиента
+
+Stock = models.StockSnapshot
+
+
+def _fixed_number(name: str, width: int, value) -> str:
+    text = format(int(value or 0), f"0{width}d")
+    if len(text) > width:
+        raise ValueError(f"Поле {name}: значение {value} не помещается в {width} символов")
+    return text
+
+
+def _fixed_lines(rows: list) -> str:
+    lines = []
+    for values in rows:
+        parts = []
+        for (name, width), value in zip(LAYOUT, values):
+            if name in _NUMERIC_FIELDS:
+                parts.append(_fixed_number(name, width, value))
+                continue
+            text = "" if value is None else str(value)
+            parts.append(text[:width].ljust(width))
+        lines.append("".join(parts))
+    return "".join(line + _LINE_END for line in lines)
+
+
+def _csv_lines(rows: list) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, delimiter=";", lineterminator=_LINE_END).writerows(rows)
+    return buffer.getvalue()
+
+
+def header(export_format: str) -> bytes:
+    """Заголовок файла: строка с именами полей для csv, пусто для fixed."""
+    if export_format == CSV:
+        return _csv_lines([[name for name, _ in LAYOUT]]).encode()
+    return b""
+
+
+async def _produce(
+    client_id: int, inn: str, index: dict, plant: Optional[str], render, queue: asyncio.Queue
+) -> None:
+    """Читает остатки клиента по порядку SKU и кладет в очередь готовые куски."""
+    try:
+        query = (
+            select(Stock.sku, Stock.offer_id, Stock.mp_warehouse_id, Stock.present, Stock.reserved)
+            .where(Stock.client_id == client_id)
+            .order_by(Stock.sku)
+            .execution_options(yield_per=_FETCH_ROWS)
+        )
+        current_sku = None
+        # Завод -> [артикул, остаток, резерв] по текущему SKU
+        totals: dict[str, list] = {}
+        lines = []
+
+        def flush_sku() -> None:
+            for plant_code in sorted(totals):
+                offer_id, present, reserved = totals[plant_code]
+                lines.append((plant_code, inn, current_sku, offer_id, present, reserved))
+            totals.clear()
+
+        # Запрос на каждого клиента - по замыслу, а не N+1: не учитываем его в статистике запроса
+        with db_stats.untracked():
+            async with SessionLocal() as db:
+                result = await db.stream(query)
+                async for rows in result.partitions():
+                    for sku, offer_id, mp_warehouse_id, present, reserved in rows:
+                        link = index.get((client_id, mp_warehouse_id))
+                        plant_code = link[1] if link is not None else None
+                        if not plant_code or (plant is not None and plant_code != plant):
+                            continue
+                        if sku != current_sku:
+                            flush_sku()
+                            current_sku = sku
+                        total = totals.setdefault(plant_code, [offer_id, 0, 0])
+                        total[1] += present
+                        total[2] += reserved
+                    if lines:
+                        await queue.put(render(lines).encode())
+                        lines = []
+        flush_sku()
+        if lines:
+            await queue.put(render(lines).encode())
+    except asyncio.CancelledError:
+        raise
+    except Exception as exc:
+        await queue.put(exc)
+    await queue.put(None)
+
+
+async def stream(export_format: str, plant: Optional[str] = None) -> AsyncIterator[bytes]:
+    """Тело выгрузки по кускам: клиенты по порядку ID, внутри - по SKU и заводу."""
+    render = _csv_lines if export_format == CSV else _fixed_lines
+    async with SessionLocal() as db:
+        index = await reference_cache.client_warehouse_index(db)
+        client_ids = sorted({
+            client_id for (client_id, _), (_, plant_code, _) in index.items()
+            if plant_code and (plant is None or plant_code == plant)
+        })
+        result = await db.execute(
+            select(models.Client.id, models.Client.inn)
+            .where(models.Client.id.in_(client_ids))
+            .order_by(models.Client.id)
+        )
+        clients = iter(result.all())
+
+    pending: deque = deque()
+
+    def start_next() -> None:
+        for client_id, inn in clients:
+            queue = asyncio.Queue(_QUEUE_CHUNKS)
+            task = asyncio.create_task(_produce(client_id, inn, index, plant, render, queue))
+            pending.append((queue, task))
+            return
+
+    for _ in range(max(1, settings.sap_export_concurrency)):
+        start_next()
+    try:
+        yield header(export_format)
+        while pending:
+            queue, _ = pending[0]
+            while (chunk := await queue.get()) is not None:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+            pending.popleft()
+            start_next()
+    finally:
+        # Клиент оборвал загрузку или выгрузка упала: читающие задачи больше не нужны
+        for _, task in pending:
+            task.cancel()
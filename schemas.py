@@ -1,7 +1,8 @@
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from functools import lru_cache
+from pydantic import BaseModel, EmailStr, Field, TypeAdapter
+from typing import Any, List, Optional
 from datetime import datetime
-from models import ContractStatus
+from models import ContractStatus, ReportJobStatus
 
 # ===================================================================
 # --- Схемы для Пользователя (User) и Аутентификации ---
@@ -34,6 +35,13 @@ class User(UserBase):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
+class Logout(BaseModel):
+    refresh_token: Optional[str] = None  # отзывается вместе с текущим access-токеном
 
 class TokenData(BaseModel):
     login: Optional[str] = None
@@ -172,10 +180,238 @@ class ClientOzonAuth(BaseModel):
     class Config:
         from_attributes = True
 
+# --- Схемы массовой загрузки ключей Ozon ---
+class ClientOzonAuthBulkEntry(BaseModel):
+    client_id: int
+    ozon_client_id: str
+    ozon_api_key: str
+
+class ClientOzonAuthBulkCreate(BaseModel):
+    entries: List[ClientOzonAuthBulkEntry] = Field(..., min_length=1, max_length=1000)
+
+class ClientOzonAuthBulkResult(BaseModel):
+    client_id: int
+    # created / updated - ключи сохранены; client_not_found, invalid_keys,
+    # ozon_unavailable, duplicate_client - запись пропущена
+    status: str
+    detail: Optional[str] = None
+
+# --- Схемы ключей сервисных учетных записей (service_keys.py) ---
+class ServiceAccountKeyCreate(BaseModel):
+    user_id: int
+    name: str = Field(..., min_length=1, max_length=100)
+
+class ServiceAccountKey(BaseModel):
+    id: int
+    user_id: int
+    name: str
+    key_prefix: str
+    created_at: datetime
+    revoked_at: Optional[datetime] = None
+    class Config:
+        from_attributes = True
+
+class ServiceAccountKeyCreated(ServiceAccountKey):
+    api_key: str  # показывается только при создании
+
 # --- Схема для смены пароля ---
 class PasswordUpdate(BaseModel):
     old_password: str
     new_password: str
 
+# --- Схемы для ротации ключа шифрования ---
+class KeyRotationStart(BaseModel):
+    batch_size: int = Field(500, ge=1, le=5000)
+    start_after_id: int = Field(0, ge=0)
+
+class KeyRotationStatus(BaseModel):
+    running: bool
+    total: int
+    processed: int
+    rotated: int
+    skipped: int
+    failed: int = 0
+    failed_ids: List[int] = []
+    last_id: int
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+
 # Это нужно для Pydantic, чтобы он мог разрешить "отложенные" аннотации типов
 Client.model_rebuild()
+
+
+# ===================================================================
+# --- Сериализация ответов сразу в байты ---
+# ===================================================================
+
+@lru_cache(maxsize=None)
+def _type_adapter(schema_type) -> TypeAdapter:
+    # Построение TypeAdapter дорогое - строим один раз на тип
+    return TypeAdapter(schema_type)
+
+def dump_json(schema_type, data: Any) -> bytes:
+    """
+    Валидирует ORM-объекты (from_attributes) по схеме и сериализует результат
+    сразу в JSON-байты внутри pydantic-core, минуя промежуточный dict и
+    jsonable_encoder. Например: dump_json(List[Client], clients).
+    """
+    adapter = _type_adapter(schema_type)
+    return adapter.dump_json(adapter.validate_python(data, from_attributes=True))
+
+# --- Схема учета запросов в Ozon (ozon_quota.py) ---
+class OzonQuotaUsage(BaseModel):
+    client_id: int
+    method: Optional[str] = None  # None - все методы клиента
+    used: int
+    limit: Optional[int] = None
+    remaining: Optional[int] = None
+    resets_in_seconds: float
+
+# --- Схема очереди запросов в Ozon (upstream_scheduler.py) ---
+class UpstreamQueueState(BaseModel):
+    client_id: int
+    contract_status: str
+    weight: float
+    limit: int
+    active: int
+    waiting: int
+    oldest_wait_seconds: float
+
+# --- Схема профиля запроса (profiling.py) ---
+class ProfileInfo(BaseModel):
+    id: str
+    created_at: datetime
+    method: str
+    path: str
+    status: int
+    duration_ms: float
+
+# --- Схемы фоновых задач на отчеты Ozon (report_jobs.py) ---
+class ReportJobCreate(BaseModel):
+    client_id: int
+    # Метод Ozon, который создает отчет и возвращает result.code
+    method: str = Field(..., pattern=r"^v[0-9]+/report/[a-z0-9_/-]+$", examples=["v1/report/products/create"])
+    params: dict[str, Any] = Field(default_factory=dict)
+
+class ReportJob(BaseModel):
+    id: int
+    client_id: int
+    method: str
+    status: ReportJobStatus
+    report_code: Optional[str] = None
+    attempts: int
+    error: Optional[str] = None
+    file_name: Optional[str] = None
+    file_size: Optional[int] = None
+    file_sha256: Optional[str] = None
+    next_run_at: datetime
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+    class Config:
+        from_attributes = True
+
+# --- Схемы локальной копии остатков (stock_sync.py) ---
+class StockSnapshot(BaseModel):
+    client_id: int
+    sku: int
+    offer_id: Optional[str] = None
+    mp_warehouse_id: str
+    warehouse_name: Optional[str] = None
+    present: int
+    reserved: int
+    synced_at: datetime
+    class Config:
+        from_attributes = True
+
+class StockRollup(BaseModel):
+    our_warehouse_id: Optional[int] = None     # нет при группировке по заводам SAP
+    our_warehouse_name: Optional[str] = None
+    sap_plant_code: Optional[str] = None
+    clients: int
+    skus: int
+    present: int
+    reserved: int
+
+class StockSyncState(BaseModel):
+    client_id: int
+    rows: int
+    cursor: Optional[str] = None               # не пусто - проход прерван и будет продолжен
+    next_run_at: datetime
+    last_synced_at: Optional[datetime] = None
+    error: Optional[str] = None
+    class Config:
+        from_attributes = True
+
+# --- Схемы локальной копии каталога (catalog_sync.py) ---
+class CatalogProduct(BaseModel):
+    client_id: int
+    product_id: int
+    offer_id: str
+    sku: Optional[int] = None
+    name: str
+    archived: bool
+    ozon_updated_at: Optional[datetime] = None
+    synced_at: datetime
+    class Config:
+        from_attributes = True
+
+class CatalogSearchHit(CatalogProduct):
+    match: str                                 # sku, product_id, offer_id или name
+
+class CatalogSyncState(StockSyncState):
+    pass
+
+# --- Схемы справочников Ozon (reference_sync.py) ---
+class OzonCategory(BaseModel):
+    id: int                                    # description_category_id
+    parent_id: Optional[int] = None
+    name: str
+    disabled: bool
+    class Config:
+        from_attributes = True
+
+class OzonCategoryType(BaseModel):
+    description_category_id: int
+    type_id: int
+    name: str
+    disabled: bool
+    class Config:
+        from_attributes = True
+
+class OzonCategoryNode(OzonCategory):
+    children: List[OzonCategory] = []
+    types: List[OzonCategoryType] = []
+
+class OzonAttribute(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    type: Optional[str] = None
+    is_collection: bool
+    dictionary_id: int                         # 0 - значения без справочника
+    class Config:
+        from_attributes = True
+
+class OzonTypeAttribute(BaseModel):
+    attribute: OzonAttribute
+    is_required: bool
+    is_aspect: bool
+    category_dependent: bool
+    group_id: Optional[int] = None
+    group_name: Optional[str] = None
+    max_value_count: Optional[int] = None
+    class Config:
+        from_attributes = True
+
+class ReferenceSyncState(BaseModel):
+    client_id: Optional[int] = None            # чьими ключами идет обновление
+    types: int
+    attributes: int
+    cursor: Optional[str] = None               # не пусто - проход прерван и будет продолжен
+    next_run_at: datetime
+    last_synced_at: Optional[datetime] = None
+    error: Optional[str] = None
+    class Config:
+        from_attributes = True
@@ -1,3 +1,5 @@
+import secrets
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import JWTError, jwt
@@ -6,17 +8,40 @@ from settings import settings # Импортируем наши настройк
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
 from settings import settings
 
 import crud
 from database import get_db
 import schemas
 import models
+import executors
+import server_timing
+import service_keys
+import token_denylist
 
 # Указываем FastAPI, где искать токен
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Тип токена в поле "typ": refresh-токен не принимается вместо access-токена
+ACCESS_TOKEN = "access"
+REFRESH_TOKEN = "refresh"
+
+def decode_token(token: str, token_type: str = ACCESS_TOKEN) -> Optional[dict]:
+    """
+    Возвращает содержимое JWT нужного типа или None, если токен недействителен.
+    Токены без "typ" (выданы до появления refresh-токенов) считаются access.
+    """
+    try:
+        payload = jwt.decode(
+            token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm]
+        )
+    except JWTError:
+        return None
+    if payload.get("typ", ACCESS_TOKEN) != token_type or not isinstance(payload.get("sub"), str):
+        return None
+    return payload
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
 ):
@@ -26,18 +51,28 @@ async def get_current_user(
         detail="Не удалось проверить учетные данные",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(
-            token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm]
-        )
-        login: str = payload.get("sub")
-        if login is None:
+    # Ключ сервисной учетной записи: проверка в памяти, без JWT и запроса пользователя
+    if service_keys.is_service_key(token):
+        started = time.perf_counter()
+        user = await service_keys.authenticate(db, token)
+        server_timing.record("service_key", started)
+        if user is None:
             raise credentials_exception
-        token_data = schemas.TokenData(login=login)
-    except JWTError:
+        return user
+
+    started = time.perf_counter()
+    payload = decode_token(token)
+    if payload is None:
         raise credentials_exception
-    
+    # Список отозванных jti в памяти: в базу идем, только если другой воркер отметил отзыв
+    if await token_denylist.is_revoked(db, payload.get("jti")):
+        raise credentials_exception
+    token_data = schemas.TokenData(login=payload["sub"])
+    server_timing.record("jwt", started)
+
+    started = time.perf_counter()
     user = await crud.get_user_by_login(db, login=token_data.login)
+    server_timing.record("user", started)
     if user is None:
         raise credentials_exception
     return user
@@ -55,33 +90,57 @@ def get_password_hash(password: str) -> str:
     """Создает хэш из обычного пароля."""
     return pwd_context.hash(password)
 
+# bcrypt занимает сотни миллисекунд и отпускает GIL - в обработчиках запросов
+# вызываем его в пуле потоков, чтобы не останавливать цикл событий
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await executors.run_in_thread(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await executors.run_in_thread(get_password_hash, password)
+
 # --- ЦЕНТРАЛИЗОВАННОЕ ШИФРОВАНИЕ ДЛЯ КЛЮЧЕЙ OZON ---
 try:
-    # Используем ключ из настроек, которые читаются из .env
-    cipher_suite = Fernet(settings.ozon_crypt_key.encode())
+    # Используем ключи из настроек, которые читаются из .env.
+    # Первый ключ - основной, остальные остаются для расшифровки, пока
+    # данные не перешифрованы (см. key_rotation.py).
+    _ozon_crypt_keys = [key.strip() for key in settings.ozon_crypt_key.split(",") if key.strip()]
+    primary_cipher = Fernet(_ozon_crypt_keys[0].encode())
+    cipher_suite = MultiFernet([Fernet(key.encode()) for key in _ozon_crypt_keys])
 except Exception as e:
     # Это вызовет ошибку при запуске, если ключ отсутствует или невалиден, что хорошо.
     raise RuntimeError(f"Ошибка инициализации шифра Fernet: {e}")
 
 def encrypt_data(data: str) -> str:
-    """Шифрует строку."""
+    """Шифрует строку основным ключом."""
     return cipher_suite.encrypt(data.encode()).decode()
 
 def decrypt_data(encrypted_data: str) -> str:
-    """Расшифровывает строку."""
+    """Расшифровывает строку любым из активных ключей."""
     return cipher_suite.decrypt(encrypted_data.encode()).decode()
 
+def needs_rotation(encrypted_data: str) -> bool:
+    """Проверяет, что строка зашифрована НЕ основным ключом."""
+    try:
+        primary_cipher.decrypt(encrypted_data.encode())
+        return False
+    except InvalidToken:
+        return True
+
+def rotate_data(encrypted_data: str) -> str:
+    """Перешифровывает строку основным ключом, сохраняя исходную метку времени."""
+    return cipher_suite.rotate(encrypted_data.encode()).decode()
+
 # --- КОД ДЛЯ JWT ---
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    """Создает JWT-токен."""
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None, token_type: str = ACCESS_TOKEN):
+    """Создает JWT-токен. jti - идентификатор для отзыва (token_denylist.py)."""
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
     
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": secrets.token_hex(16), "typ": token_type})
     encoded_jwt = jwt.encode(
         to_encode, 
         settings.jwt_secret_key, 
@@ -89,6 +148,19 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     )
     return encoded_jwt
 
+def create_token_pair(login: str) -> dict:
+    """Пара access + refresh для ответа /token и /token/refresh."""
+    return {
+        "access_token": create_access_token(
+            data={"sub": login}, expires_delta=timedelta(minutes=settings.access_token_expire_minutes)
+        ),
+        "refresh_token": create_access_token(
+            data={"sub": login}, expires_delta=timedelta(days=settings.refresh_token_expire_days),
+            token_type=REFRESH_TOKEN,
+        ),
+        "token_type": "bearer",
+    }
+
 async def get_current_superuser(current_user: models.User = Depends(get_current_user)) -> models.User:
     """
     Зависимость, которая проверяет, что текущий пользователь
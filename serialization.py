@@ -0,0 +1,35 @@
+# File: serialization.py
+
+from typing import Any
+from fastapi.responses import JSONResponse
+
+# orjson сериализует в байты сразу и заметно быстрее стандартного json.
+# Если пакет не установлен, работаем на стандартном json с теми же настройками,
+# что и у JSONResponse из Starlette.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
+
+
+def dumps(data: Any) -> bytes:
+    """
+    Сериализует данные в компактный JSON (UTF-8).
+    Кириллица не экранируется: '\\uXXXX' раздувает ответ и стоит лишнего времени.
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(
+        data, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Класс ответа по умолчанию для всего приложения (см. main.py).
+    Совместим с JSONResponse, но рендерит через dumps().
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,84 @@
+# File: server_timing.py
+
+import json
+import logging
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from settings import settings
+
+# =============================================================================
+# SERVER-TIMING: РАЗБИВКА ВРЕМЕНИ ЗАПРОСА ПО ЭТАПАМ
+# Этапы (разбор JWT, поиск пользователя, проверка прав, расшифровка ключей,
+# запрос в Ozon и т.д.) отмечаются вызовом record(). Middleware отдает их
+# клиенту в заголовке Server-Timing, например:
+#     Server-Timing: jwt;dur=0.08, user;dur=1.20, upstream;dur=184.31, total;dur=190.02
+# и при SERVER_TIMING_LOG=true пишет одну JSON-строку в лог "server_timing",
+# где дополнительно есть время отправки ответа клиенту.
+# Время - монотонные часы time.perf_counter(), длительности в миллисекундах.
+# =============================================================================
+
+logger = logging.getLogger("server_timing")
+
+_current: ContextVar[Optional[list]] = ContextVar("server_timing", default=None)
+
+
+def record(name: str, started: float) -> None:
+    """
+    Записывает этап name, начавшийся в started (значение time.perf_counter()).
+    Вне запроса (скрипты, фоновые задачи) ничего не делает.
+    """
+    phases = _current.get()
+    if phases is not None:
+        phases.append((name, (time.perf_counter() - started) * 1000))
+
+
+def header_value(phases: list, total_ms: float) -> str:
+    parts = [f"{name};dur={duration:.2f}" for name, duration in phases]
+    parts.append(f"total;dur={total_ms:.2f}")
+    return ", ".join(parts)
+
+
+class ServerTimingMiddleware:
+    """ASGI-middleware: добавляет заголовок Server-Timing, если запрос отметил этапы."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        phases: list = []
+        token = _current.set(phases)
+        started = time.perf_counter()
+        response_started = None
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal response_started, status_code
+            if message["type"] == "http.response.start" and phases:
+                response_started = time.perf_counter()
+                status_code = message["status"]
+                value = header_value(phases, (response_started - started) * 1000)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", value.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            if settings.server_timing_log and response_started is not None:
+                finished = time.perf_counter()
+                logger.info(json.dumps({
+                    "method": scope["method"],
+                    "route": getattr(scope.get("route"), "path", scope["path"]),
+                    "status": status_code,
+                    "phases_ms": {name: round(duration, 3) for name, duration in phases},
+                    "send_ms": round((finished - response_started) * 1000, 3),
+                    "total_ms": round((finished - started) * 1000, 3),
+                }))
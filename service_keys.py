@@ -0,0 +1,143 @@
+# File: service_keys.py
+
+import asyncio
+import hashlib
+import hmac
+import secrets
+import time
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import make_transient_to_detached
+
+# Импортируем наши собственные модули
+import models
+from change_stamp import ChangeStamp
+from settings import settings
+
+# =============================================================================
+# КЛЮЧИ СЕРВИСНЫХ УЧЕТНЫХ ЗАПИСЕЙ (ETL И ДРУГИЕ МАШИННЫЕ КЛИЕНТЫ)
+# Ключ вида "ozk_<prefix>_<secret>" передается как обычный токен:
+# Authorization: Bearer ozk_... Он долгоживущий, поэтому машинному клиенту
+# не нужны /token (bcrypt) и обновление JWT.
+#
+# В базе хранится только prefix и HMAC-SHA256 всего ключа на секрете
+# сервера (service_key_secret, по умолчанию jwt_secret_key). Все
+# действующие ключи вместе с колонками их пользователей держатся в памяти:
+# проверка - поиск по prefix, HMAC и сравнение за постоянное время, без
+# запросов в базу и без bcrypt.
+#
+# Создание и отзыв ключа, смена пароля, удаление клиента и скрипт
+# update_password.py отмечаются в файле-метке service_keys_stamp_file
+# (change_stamp.py): воркеры перечитывают ключи, увидев изменение, поэтому
+# отозванный ключ перестает работать сразу во всех воркерах. Правка
+# пользователя в обход API и этих скриптов (например, снятие is_superuser
+# прямо в базе) видна ключам не позже чем через reference_cache_ttl_seconds.
+# =============================================================================
+
+KEY_PREFIX = "ozk_"
+_PREFIX_BYTES = 6         # открытая часть: 12 hex-символов
+_SECRET_BYTES = 32
+
+USER_COLUMNS = (
+    models.User.id,
+    models.User.login,
+    models.User.email,
+    models.User.password_hash,
+    models.User.is_active,
+    models.User.is_superuser,
+    models.User.is_temporary_password,
+)
+
+
+def is_service_key(token: str) -> bool:
+    return token.startswith(KEY_PREFIX)
+
+
+def _digest(key: str) -> bytes:
+    secret = (settings.service_key_secret or settings.jwt_secret_key).encode()
+    return hmac.new(secret, key.encode(), hashlib.sha256).digest()
+
+
+def generate() -> tuple[str, str, str]:
+    """Новый ключ: (ключ целиком - показывается один раз, prefix, HMAC в hex)."""
+    prefix = secrets.token_hex(_PREFIX_BYTES)
+    key = f"{KEY_PREFIX}{prefix}_{secrets.token_urlsafe(_SECRET_BYTES)}"
+    return key, prefix, _digest(key).hex()
+
+
+def _prefix_of(key: str) -> Optional[str]:
+    prefix, sep, secret = key[len(KEY_PREFIX):].partition("_")
+    return prefix if sep and secret else None
+
+
+# --- Ключи в памяти ---
+
+class _Index:
+    __slots__ = ("keys", "stamp", "loaded_at")
+
+    def __init__(self, keys: dict, stamp: int, loaded_at: float):
+        self.keys = keys          # prefix -> (HMAC ключа, колонки пользователя)
+        self.stamp = stamp
+        self.loaded_at = loaded_at
+
+
+_index: Optional[_Index] = None
+_load_lock = asyncio.Lock()
+_stamp = ChangeStamp(settings.service_keys_stamp_file)
+
+
+async def _load(db: AsyncSession, stamp: int) -> _Index:
+    result = await db.execute(
+        select(models.ServiceAccountKey.key_prefix, models.ServiceAccountKey.key_hash, *USER_COLUMNS)
+        .join(models.User, models.User.id == models.ServiceAccountKey.user_id)
+        .where(models.ServiceAccountKey.revoked_at.is_(None))
+    )
+    names = [column.key for column in USER_COLUMNS]
+    keys = {
+        prefix: (bytes.fromhex(key_hash), dict(zip(names, user)))
+        for prefix, key_hash, *user in result.all()
+    }
+    return _Index(keys, stamp, time.monotonic())
+
+
+async def _current_index(db: AsyncSession) -> _Index:
+    global _index
+    stamp = _stamp.current()
+    index = _index
+    # Без метки (правка базы в обход API) ключи все равно перечитываются раз в reference_cache_ttl_seconds
+    if index is not None and index.stamp == stamp \
+            and time.monotonic() - index.loaded_at < settings.reference_cache_ttl_seconds:
+        return index
+    async with _load_lock:
+        if _index is index:
+            _index = await _load(db, stamp)
+        return _index
+
+
+async def authenticate(db: AsyncSession, key: str) -> Optional[models.User]:
+    """
+    Пользователь ключа или None, если ключ неизвестен или отозван.
+    Пользователь не загружен из базы, а собран из колонок в памяти
+    (в состоянии detached): связи у него не загружаются.
+    """
+    prefix = _prefix_of(key)
+    if prefix is None:
+        return None
+    entry = (await _current_index(db)).keys.get(prefix)
+    if entry is None:
+        return None
+    key_hash, user_columns = entry
+    if not hmac.compare_digest(_digest(key), key_hash):
+        return None
+    user = models.User(**user_columns)
+    make_transient_to_detached(user)
+    return user
+
+
+def invalidate() -> None:
+    """Сбрасывает ключи в памяти этого воркера и отмечает изменение для остальных."""
+    global _index
+    _index = None
+    _stamp.touch()
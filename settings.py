@@ -10,10 +10,139 @@ class Settings(BaseSettings):
     jwt_secret_key: str
     jwt_algorithm: str = "HS256"
     access_token_expire_minutes: int # <-- 1. ДОБАВЛЕНО ЭТО ПОЛЕ
+    # Срок refresh-токена (POST /token/refresh) и файл-метка, по которой
+    # воркеры узнают об отзыве токенов (token_denylist.py)
+    refresh_token_expire_days: int = 30
+    token_denylist_stamp_file: str = "token_denylist.stamp"
+
+    # Ключи сервисных учетных записей (service_keys.py): секрет HMAC (пусто -
+    # jwt_secret_key) и файл-метка, по которой воркеры узнают об отзыве ключа
+    service_key_secret: str = ""
+    service_keys_stamp_file: str = "service_keys.stamp"
     
-    # Ключ для шифрования Ozon ключей
+    # Ключ для шифрования Ozon ключей.
+    # Можно указать несколько ключей через запятую: первым шифруются новые
+    # данные, остальные нужны только для расшифровки на время ротации.
     ozon_crypt_key: str
 
+    # Сколько секунд живет снимок справочников в памяти процесса.
+    # В своем процессе снимок сбрасывается сразу при записи, а этот срок
+    # ограничивает устаревание в других воркерах.
+    reference_cache_ttl_seconds: int = 30
+
+    # Массовая загрузка ключей Ozon (POST /ozon_auth/bulk): сколько пар
+    # проверять в Ozon одновременно и сколько помнить принятую пару
+    ozon_auth_bulk_concurrency: int = 10
+    ozon_auth_validation_ttl_seconds: int = 600
+
+    # Пул соединений общего HTTP-клиента для запросов в Ozon (upstream.py)
+    upstream_max_connections: int = 100
+    upstream_max_keepalive_connections: int = 20
+    upstream_timeout_seconds: float = 30.0
+    # Очередь запросов в Ozon (upstream_scheduler.py): не больше стольких
+    # запросов одного клиента одновременно (0 - без отдельного лимита),
+    # свои лимиты для отдельных клиентов (JSON: {"12": 40}) и вес клиента
+    # при раздаче слотов по статусу договора
+    upstream_client_max_concurrency: int = 20
+    upstream_client_concurrency: dict[int, int] = {}
+    upstream_contract_weights: dict[str, float] = {"active": 4.0, "pending": 2.0, "none": 1.0}
+
+    # Писать разбивку времени запроса по этапам в лог "server_timing"
+    # (заголовок Server-Timing отдается всегда, см. server_timing.py)
+    server_timing_log: bool = False
+
+    # Отдавать статистику SQL-запросов в заголовках X-DB-* (только для отладки)
+    db_debug_headers: bool = False
+
+    # Профили запросов с заголовком X-Profile (profiling.py): каталог
+    # и сколько последних профилей в нем хранить
+    profile_dir: str = "profiles"
+    profile_ring_size: int = 20
+
+    # Сторож цикла событий (loop_watchdog.py): пишет стек, если цикл
+    # заблокирован дольше порога, мс; 0 - выключен
+    loop_block_threshold_ms: int = 100
+
+    # Пулы для тяжелой работы вне цикла событий (executors.py).
+    # Пул процессов по умолчанию выключен - тогда все идет в пул потоков.
+    offload_thread_workers: int = 4
+    offload_process_workers: int = 0
+    # Списки от стольких элементов сериализуются в пуле потоков
+    offload_min_items: int = 200
+    # Ответы Ozon до этого размера собираются в память целиком,
+    # больше (или без Content-Length) - отдаются клиенту потоком
+    proxy_buffer_max_bytes: int = 1048576
+    # Объединение записей в Ozon (write_coalescer.py): методы, для которых оно
+    # включено (например ["v2/products/stocks", "v1/product/import/prices"]),
+    # сколько ждать попутные позиции и сколько позиций максимум в одном вызове
+    proxy_coalesce_methods: list[str] = []
+    proxy_coalesce_window_ms: int = 50
+    proxy_coalesce_max_items: int = 100
+
+    # Адаптивный лимит одновременных запросов к /proxy/* в воркере (admission.py):
+    # начальное значение и границы, длина очереди сверх лимита, допустимый
+    # рост времени ответа и бюджет ожидания без заголовка X-Request-Timeout
+    admission_enabled: bool = True
+    admission_initial_limit: int = 20
+    admission_min_limit: int = 4
+    admission_max_limit: int = 200
+    admission_queue_size: int = 100
+    admission_tolerance: float = 1.5
+    admission_default_budget_seconds: float = 30.0
+
+    # Общий для воркеров учет запросов в Ozon (ozon_quota.py): файл счетчиков
+    # (к имени добавляются версия формата и число слотов),
+    # число слотов, длина окна и лимиты на окно для клиента в целом и для
+    # клиента по одному методу. Лимит 0 - только учет, без ограничения.
+    ozon_quota_file: str = "ozon_quota.bin"
+    ozon_quota_slots: int = 4096
+    ozon_quota_window_seconds: int = 1
+    ozon_quota_per_client: int = 0
+    ozon_quota_per_method: int = 0
+
+    # Хранилище файлов отчетов и выгрузок (artifacts.py)
+    artifact_dir: str = "artifacts"
+
+    # Фоновые задачи на отчеты Ozon (report_jobs.py): каталог файлов,
+    # скачанных до появления artifact_dir, сколько шагов задач выполняется одновременно на воркер (0 - не выполнять),
+    # как часто искать задачи, пауза между опросами статуса (удваивается от
+    # initial до max), срок на весь отчет, аренда шага и предел ошибок подряд
+    report_dir: str = "reports"
+    report_jobs_concurrency: int = 2
+    report_jobs_scan_seconds: float = 1.0
+    report_poll_initial_seconds: float = 2.0
+    report_poll_max_seconds: float = 60.0
+    report_job_timeout_seconds: int = 3600
+    report_job_lease_seconds: int = 300
+    report_job_max_errors: int = 5
+
+    # Синхронизация остатков клиентов (stock_sync.py): сколько клиентов
+    # синхронизируется одновременно на воркер (0 - выключена), период
+    # полного прохода, пауза после ошибки, как часто искать клиентов, аренда
+    stock_sync_concurrency: int = 1
+    stock_sync_interval_seconds: int = 900
+    stock_sync_retry_seconds: int = 60
+    stock_sync_scan_seconds: float = 30.0
+    stock_sync_lease_seconds: int = 300
+
+    # Синхронизация каталога товаров клиентов (catalog_sync.py), те же параметры
+    catalog_sync_concurrency: int = 1
+    catalog_sync_interval_seconds: int = 3600
+    catalog_sync_retry_seconds: int = 60
+    catalog_sync_scan_seconds: float = 30.0
+    catalog_sync_lease_seconds: int = 300
+
+    # Выгрузка остатков для SAP (sap_export.py): сколько клиентов читается параллельно
+    sap_export_concurrency: int = 4
+
+    # Обновление справочников Ozon (reference_sync.py): включено ли, период
+    # полного прохода, пауза после ошибки, как часто проверять срок, аренда
+    reference_sync_enabled: bool = True
+    reference_sync_interval_seconds: int = 86400
+    reference_sync_retry_seconds: int = 300
+    reference_sync_scan_seconds: float = 60.0
+    reference_sync_lease_seconds: int = 300
+
     # Эта строка говорит Pydantic всегда читать
     # переменные из файла с именем ".env"
     model_config = SettingsConfigDict(env_file=".env")
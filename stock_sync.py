@@ -0,0 +1,114 @@
+# File: stock_sync.py
+
+from datetime import datetime
+from typing import Optional
+
+# Импортируем наши собственные модули
+import client_sync
+import models
+from database import insert
+
+# =============================================================================
+# ЛОКАЛЬНАЯ КОПИЯ ОСТАТКОВ КЛИЕНТОВ
+# Таблица stock_snapshots хранит остатки каждого клиента по (sku, склад Ozon)
+# и через client_warehouses сопоставляется нашим складам. Свод "сколько
+# товара у всех клиентов на нашем складе" считается одним SQL-запросом
+# по индексу (crud.get_stock_rollup), без обращений в Ozon.
+#
+# Проход синхронизации клиента:
+#   1. v4/product/info/stocks постранично (курсор Ozon) - товары и их SKU
+#      на складах продавца (fbs/rfbs);
+#   2. v1/product/info/stocks-by-warehouse/fbs пачками SKU - остатки
+#      по складам Ozon;
+#   3. строки страницы пишутся UPSERT-ом с номером прохода вместе с курсором.
+# Изменений "с момента" Ozon для остатков не отдает, поэтому инкремент -
+# это продолжение прерванного прохода по курсору; строки, которых не было
+# в проходе (товар снят или склад опустел), удаляются в его конце.
+# Очередь, аренда и курсор - в client_sync.py; клиент синхронизируется
+# раз в stock_sync_interval_seconds, если включены права на оба метода.
+# =============================================================================
+
+STOCKS_METHOD = "v4/product/info/stocks"
+BY_WAREHOUSE_METHOD = "v1/product/info/stocks-by-warehouse/fbs"
+REQUIRED_METHODS = (STOCKS_METHOD, BY_WAREHOUSE_METHOD)
+
+_PAGE_SIZE = 1000        # максимум v4/product/info/stocks
+_SKU_BATCH = 500         # SKU в одном запросе остатков по складам
+# Остатки на складах продавца; fbo - склады Ozon, к нашим складам не относятся
+_SELLER_STOCK_TYPES = frozenset({"fbs", "rfbs"})
+
+Stock = models.StockSnapshot
+
+
+def _seller_skus(items: list) -> dict[int, Optional[str]]:
+    """SKU товаров страницы на складах продавца -> артикул продавца."""
+    offers = {}
+    for item in items:
+        for stock in item.get("stocks") or []:
+            if stock.get("type") in _SELLER_STOCK_TYPES and stock.get("sku"):
+                offers[int(stock["sku"])] = item.get("offer_id")
+    return offers
+
+
+async def _warehouse_rows(sync, client_id: int, offers: dict, headers: dict, generation: int) -> list[dict]:
+    rows = []
+    skus = list(offers)
+    synced_at = datetime.utcnow()
+    for start in range(0, len(skus), _SKU_BATCH):
+        batch = [str(sku) for sku in skus[start:start + _SKU_BATCH]]
+        data = await sync.call(client_id, BY_WAREHOUSE_METHOD, {"sku": batch}, headers)
+        for row in data.get("result") or []:
+            sku = int(row["sku"])
+            rows.append({
+                "client_id": client_id,
+                "sku": sku,
+                "mp_warehouse_id": str(row["warehouse_id"]),
+                "offer_id": offers.get(sku),
+                "warehouse_name": row.get("warehouse_name"),
+                "present": int(row.get("present") or 0),
+                "reserved": int(row.get("reserved") or 0),
+                "generation": generation,
+                "synced_at": synced_at,
+            })
+    return rows
+
+
+def _upsert_statement():
+    statement = insert(Stock)
+    return statement.on_conflict_do_update(
+        index_elements=[Stock.client_id, Stock.sku, Stock.mp_warehouse_id],
+        set_={
+            column: statement.excluded[column]
+            for column in ("offer_id", "warehouse_name", "present", "reserved", "generation", "synced_at")
+        },
+    )
+
+
+async def _run_pass(sync: client_sync.ClientSync, state: models.StockSyncState, headers: dict) -> None:
+    cursor = state.cursor or ""
+    while True:
+        page = await sync.call(
+            state.client_id, STOCKS_METHOD,
+            {"cursor": cursor, "filter": {"visibility": "ALL"}, "limit": _PAGE_SIZE},
+            headers,
+        )
+        items = page.get("items") or []
+        rows = await _warehouse_rows(sync, state.client_id, _seller_skus(items), headers, state.generation)
+
+        async def write(db):
+            if rows:
+                await db.execute(_upsert_statement(), rows)
+
+        cursor = page.get("cursor") or ""
+        last_page = not cursor or len(items) < _PAGE_SIZE
+        await sync.save_page(state, None if last_page else cursor, write)
+        if last_page:
+            return
+
+
+sync = client_sync.ClientSync(
+    "stock_sync", "остатков", models.StockSyncState, Stock, REQUIRED_METHODS, _run_pass
+)
+start = sync.start
+stop = sync.stop
+request_sync = sync.request_sync
@@ -0,0 +1,153 @@
+# File: token_denylist.py
+
+import asyncio
+import heapq
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+# Импортируем наши собственные модули
+import models
+from change_stamp import ChangeStamp
+from database import insert
+from settings import settings
+
+# =============================================================================
+# ОТОЗВАННЫЕ ТОКЕНЫ (DENYLIST ПО JTI)
+# У каждого выданного JWT есть jti (16 случайных байт в hex). Отозванные jti
+# хранятся в таблице revoked_tokens и в памяти каждого воркера: словарь
+# 16 байт jti -> время истечения токена и куча по времени истечения.
+# Токен, срок которого прошел, и так не пройдет проверку JWT, поэтому
+# запись о нем удаляется из памяти (с вершины кучи при проверке) и из
+# таблицы (при следующем отзыве).
+#
+# Проверка в get_current_user - поиск в словаре, без запросов в базу.
+# Отзыв отмечается в файле-метке token_denylist_stamp_file (change_stamp.py);
+# увидев изменение, воркер дочитывает из таблицы только новые строки
+# (id больше последнего прочитанного; id не переиспользуются - AUTOINCREMENT).
+# Раз в reference_cache_ttl_seconds список перечитывается целиком: так
+# находится и строка, закоммиченная позже строки с большим id.
+# =============================================================================
+
+
+class _Denylist:
+    def __init__(self):
+        self.expires: dict[bytes, int] = {}     # jti -> время истечения токена (unix)
+        self.heap: list[tuple[int, bytes]] = []
+        self.last_id = 0                        # последняя прочитанная строка revoked_tokens
+        self.stamp: Optional[int] = None
+        self.loaded_at = 0.0
+
+    def add(self, jti: bytes, expires_at: int) -> None:
+        if jti not in self.expires:
+            self.expires[jti] = expires_at
+            heapq.heappush(self.heap, (expires_at, jti))
+
+    def prune(self, now: int) -> None:
+        while self.heap and self.heap[0][0] <= now:
+            _, jti = heapq.heappop(self.heap)
+            del self.expires[jti]
+
+
+_denylist = _Denylist()
+_load_lock = asyncio.Lock()
+_stamp = ChangeStamp(settings.token_denylist_stamp_file)
+
+
+def _jti_bytes(jti: str) -> Optional[bytes]:
+    try:
+        return bytes.fromhex(jti)
+    except (TypeError, ValueError):
+        return None
+
+
+def _unix(value: datetime) -> int:
+    return int(value.replace(tzinfo=timezone.utc).timestamp())
+
+
+def _expired(denylist: _Denylist) -> bool:
+    return time.monotonic() - denylist.loaded_at >= settings.reference_cache_ttl_seconds
+
+
+async def _sync(db: AsyncSession) -> None:
+    """Дочитывает новые отзывы, если их отметил другой воркер; по сроку сверки - перечитывает все."""
+    global _denylist
+    stamp = _stamp.current()
+    if stamp == _denylist.stamp and not _expired(_denylist):
+        return
+    async with _load_lock:
+        if stamp == _denylist.stamp and not _expired(_denylist):
+            return
+        # Отзыв, закоммиченный во время чтения, меняет метку: его дочитает следующая проверка
+        denylist = _Denylist() if _expired(_denylist) else _denylist
+        result = await db.execute(
+            select(models.RevokedToken.id, models.RevokedToken.jti, models.RevokedToken.expires_at)
+            .where(models.RevokedToken.id > denylist.last_id, models.RevokedToken.expires_at > datetime.utcnow())
+            .order_by(models.RevokedToken.id)
+        )
+        for row_id, jti, expires_at in result.all():
+            jti_bytes = _jti_bytes(jti)
+            if jti_bytes is not None:
+                denylist.add(jti_bytes, _unix(expires_at))
+            denylist.last_id = row_id
+        denylist.stamp = stamp
+        denylist.loaded_at = time.monotonic()
+        _denylist = denylist
+
+
+async def is_revoked(db: AsyncSession, jti: Optional[str]) -> bool:
+    """Отозван ли токен. Токены без jti (выданы до появления отзыва) не отзываются."""
+    if not jti:
+        return False
+    await _sync(db)
+    _denylist.prune(int(time.time()))
+    jti_bytes = _jti_bytes(jti)
+    return jti_bytes is not None and jti_bytes in _denylist.expires
+
+
+async def _store(db: AsyncSession, tokens: list[tuple[str, int]]) -> int:
+    """Записывает отзывы, делает commit и отмечает изменение. Возвращает число новых строк."""
+    rows = [
+        {"jti": jti, "expires_at": datetime.fromtimestamp(expires_at, timezone.utc).replace(tzinfo=None)}
+        for jti, expires_at in tokens
+        if _jti_bytes(jti) is not None
+    ]
+    if not rows:
+        return 0
+    # Один отзыв - одиночный INSERT: по его rowcount claim() узнает, чей он
+    # (INSERT по таблице, а не по модели: у результата ORM-вставки rowcount нет)
+    result = await db.execute(
+        insert(models.RevokedToken.__table__).on_conflict_do_nothing(index_elements=["jti"]),
+        rows[0] if len(rows) == 1 else rows,
+    )
+    await db.execute(delete(models.RevokedToken).where(models.RevokedToken.expires_at <= datetime.utcnow()))
+    await db.commit()
+    for jti, expires_at in tokens:
+        jti_bytes = _jti_bytes(jti)
+        if jti_bytes is not None:
+            _denylist.add(jti_bytes, expires_at)
+    _stamp.touch()
+    return result.rowcount
+
+
+async def revoke(db: AsyncSession, tokens: list[tuple[str, int]]) -> None:
+    """
+    Отзывает токены: список (jti, время истечения unix). Делает commit и
+    отмечает изменение для остальных воркеров. Заодно удаляет из таблицы
+    записи об уже истекших токенах.
+    """
+    await _store(db, tokens)
+
+
+async def claim(db: AsyncSession, jti: str, expires_at: int) -> bool:
+    """
+    Одноразовое использование токена (ротация refresh-токена): отзывает его
+    и возвращает True, только если отозвал именно этот вызов. Проверку и
+    отзыв делает один INSERT с уникальным jti, поэтому из одновременных
+    запросов с одним токеном True получит ровно один.
+    """
+    return await _store(db, [(jti, expires_at)]) == 1
@@ -8,6 +8,7 @@ from sqlalchemy.future import select
 # Импортируем наши собственные модули
 from settings import settings
 import models
+import service_keys
 from security import get_password_hash # Наша функция для хэширования
 
 async def main(login: str, new_pass: str):
@@ -34,6 +35,8 @@ async def main(login: str, new_pass: str):
         user_to_update.password_hash = get_password_hash(new_pass)
         session.add(user_to_update)
         await session.commit()
+        # Воркеры перечитают ключи сервисных учетных записей с новыми колонками пользователя
+        service_keys.invalidate()
         
         print(f"✅ УСПЕХ: Пароль для пользователя '{login}' был успешно обновлен.")
             
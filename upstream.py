@@ -0,0 +1,132 @@
+# File: upstream.py
+
+import asyncio
+from typing import Optional
+
+from cryptography.fernet import InvalidToken
+
+import crud
+import metrics
+import ozon_quota
+import security
+import upstream_scheduler
+from settings import settings
+
+# =============================================================================
+# ОБЩИЙ HTTP-КЛИЕНТ ДЛЯ ЗАПРОСОВ В OZON
+# Один httpx.AsyncClient на процесс: соединения и TLS-сессии переиспользуются
+# между запросами, а размер пула ограничен настройками.
+# httpx импортируется при первом запросе, а не при старте воркера.
+# Фоновые задачи (report_jobs.py, client_sync.py, reference_sync.py)
+# вызывают Ozon от имени клиента через client_headers() и call_ozon().
+# Запросы от имени клиента проходят через очередь upstream_scheduler.py.
+# =============================================================================
+
+OZON_API_URL = "https://api-seller.ozon.ru"
+
+_client = None
+
+
+def get_client():
+    """Возвращает общий клиент, создавая его при первом обращении."""
+    global _client
+    if _client is None:
+        import httpx
+
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.upstream_max_connections,
+                max_keepalive_connections=settings.upstream_max_keepalive_connections,
+            ),
+            timeout=settings.upstream_timeout_seconds,
+        )
+    return _client
+
+
+async def close_client() -> None:
+    """Закрывает общий клиент (событие shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def pool_usage() -> Optional[tuple[int, int]]:
+    """
+    Возвращает (всего соединений, из них простаивает) в пуле общего клиента
+    или None, если клиент еще не создан.
+    """
+    if _client is None:
+        return None
+    # Пул httpcore не входит в публичный API httpx, поэтому без падений при его смене
+    pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if connections is None:
+        return None
+    return len(connections), sum(1 for connection in connections if connection.is_idle())
+
+
+class OzonError(Exception):
+    """Ошибка запроса в Ozon, которую бессмысленно повторять (4xx, нет ключей)."""
+
+
+class OzonTransientError(Exception):
+    """Временная ошибка (сеть, 5xx, 429): запрос можно повторить после паузы."""
+
+
+async def client_headers(db, client_id: int) -> dict:
+    """Заголовки с расшифрованными ключами Ozon клиента."""
+    ozon_auth = await crud.get_ozon_auth_by_client_id(db, client_id=client_id)
+    if ozon_auth is None:
+        raise OzonError(f"Ключи Ozon клиента (ID: {client_id}) не найдены")
+    try:
+        return {
+            "Client-Id": security.decrypt_data(ozon_auth.encrypted_ozon_client_id),
+            "Api-Key": security.decrypt_data(ozon_auth.encrypted_ozon_api_key),
+        }
+    except InvalidToken:
+        raise OzonError("Не удалось расшифровать ключи Ozon: ключ шифрования не подходит")
+
+
+async def call_ozon(method: str, payload: dict, headers: dict, client_id: Optional[int] = None) -> dict:
+    """
+    POST в метод Ozon с JSON-телом; возвращает разобранный JSON ответа.
+    С client_id запрос ждет своей очереди клиента (upstream_scheduler.py).
+    """
+    import httpx
+
+    if client_id is not None:
+        await upstream_scheduler.scheduler.acquire(client_id)
+    try:
+        with metrics.UpstreamTimer(method) as timer:
+            try:
+                response = await get_client().post(
+                    f"{OZON_API_URL}/{method}",
+                    json=payload,
+                    headers=headers,
+                    extensions={"trace": timer.trace},
+                )
+            except httpx.RequestError as exc:
+                timer.record("error")
+                raise OzonTransientError(f"Ошибка соединения с Ozon API: {exc}")
+            timer.record(response.status_code)
+    finally:
+        if client_id is not None:
+            upstream_scheduler.scheduler.release(client_id)
+    if response.status_code == 429 or response.status_code >= 500:
+        raise OzonTransientError(f"Ozon API ответил {response.status_code} на {method}")
+    if response.status_code >= 400:
+        raise OzonError(f"Ozon API ответил {response.status_code} на {method}: {response.text[:500]}")
+    try:
+        return response.json()
+    except ValueError:
+        raise OzonError(f"Ozon API вернул не JSON на {method}")
+
+
+async def call_ozon_within_quota(client_id: int, method: str, payload: dict, headers: dict) -> dict:
+    """call_ozon с учетом общих лимитов клиента (ozon_quota.py): при исчерпании ждет новое окно."""
+    while True:
+        retry_after = ozon_quota.acquire(client_id, method)
+        if retry_after is None:
+            return await call_ozon(method, payload, headers, client_id)
+        await asyncio.sleep(retry_after)
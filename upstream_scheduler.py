@@ -0,0 +1,172 @@
+# File: upstream_scheduler.py
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+# Импортируем наши собственные модули
+import metrics
+import reference_cache
+from database import SessionLocal
+from settings import settings
+
+# =============================================================================
+# ЧЕСТНАЯ ОЧЕРЕДЬ ЗАПРОСОВ В OZON ПО КЛИЕНТАМ
+# Одновременно в Ozon уходит не больше upstream_max_connections запросов
+# (размер пула общего клиента), а у одного клиента - не больше
+# upstream_client_max_concurrency (upstream_client_concurrency - свои
+# значения для отдельных клиентов). Иначе полная синхронизация каталога
+# одного клиента занимает весь пул, и запросы остальных стоят за ней.
+#
+# Запросы сверх лимитов ждут в очереди своего клиента. Освободившийся
+# слот получает клиент с наименьшим "пройденным путем" (stride scheduling):
+# каждый выданный слот добавляет клиенту 1 / вес, вес зависит от
+# Client.contract_status (upstream_contract_weights). Клиент, который
+# долго молчал, начинает с текущего пути остальных и не получает
+# накопленного преимущества.
+#
+# Очередь своя у каждого воркера, как и пул соединений.
+# =============================================================================
+
+_UNKNOWN_CLASS = "none"
+
+
+class _ClientQueue:
+    __slots__ = ("client_id", "waiters", "active", "passed", "weight_class")
+
+    def __init__(self, client_id: int, passed: float):
+        self.client_id = client_id
+        self.waiters: deque = deque()        # (future, время постановки в очередь)
+        self.active = 0
+        self.passed = passed
+        self.weight_class = _UNKNOWN_CLASS
+
+    @property
+    def limit(self) -> int:
+        limit = settings.upstream_client_concurrency.get(self.client_id, settings.upstream_client_max_concurrency)
+        return limit if limit > 0 else settings.upstream_max_connections
+
+    @property
+    def stride(self) -> float:
+        weight = settings.upstream_contract_weights.get(self.weight_class, 1.0)
+        return 1.0 / max(weight, 0.001)
+
+
+class UpstreamScheduler:
+    def __init__(self):
+        self._queues: dict[int, _ClientQueue] = {}
+        self._active = 0
+        # Путь последнего получившего слот клиента - "текущее время" очереди
+        self._virtual = 0.0
+
+    async def _weight_class(self, client_id: int) -> str:
+        # Сессия открывает соединение только при загрузке снимка, раз в reference_cache_ttl_seconds
+        async with SessionLocal() as db:
+            contracts = await reference_cache.client_contract_statuses(db)
+        return contracts.get(client_id, _UNKNOWN_CLASS)
+
+    def _queue(self, client_id: int) -> _ClientQueue:
+        queue = self._queues.get(client_id)
+        if queue is None:
+            queue = self._queues[client_id] = _ClientQueue(client_id, self._virtual)
+        elif not queue.active and not queue.waiters:
+            queue.passed = max(queue.passed, self._virtual)
+        return queue
+
+    def _grant(self, queue: _ClientQueue) -> None:
+        self._virtual = max(self._virtual, queue.passed)
+        queue.passed += queue.stride
+        queue.active += 1
+        self._active += 1
+        metrics.upstream_scheduler_active.inc((queue.weight_class,))
+
+    def _dispatch(self) -> None:
+        """Раздает свободные слоты ожидающим, начиная с клиента с наименьшим путем."""
+        while self._active < settings.upstream_max_connections:
+            ready = [q for q in self._queues.values() if q.waiters and q.active < q.limit]
+            if not ready:
+                return
+            queue = min(ready, key=lambda q: q.passed)
+            future, enqueued = queue.waiters.popleft()
+            metrics.upstream_scheduler_waiting.dec((queue.weight_class,))
+            if future.done():
+                # Ожидание отменено, а задача еще не успела убрать себя из очереди
+                continue
+            metrics.upstream_scheduler_wait.observe(time.perf_counter() - enqueued, (queue.weight_class,))
+            self._grant(queue)
+            future.set_result(None)
+
+    async def acquire(self, client_id: int) -> None:
+        """Ждет слот для запроса клиента в Ozon. После запроса обязателен release()."""
+        weight_class = await self._weight_class(client_id)
+        queue = self._queue(client_id)
+        if not queue.active and not queue.waiters:
+            # Класс меняется только у простаивающей очереди: по нему
+            # уменьшаются метрики уже выданных слотов и ожидающих
+            queue.weight_class = weight_class
+        weight_class = queue.weight_class
+        if not queue.waiters and queue.active < queue.limit and self._active < settings.upstream_max_connections:
+            metrics.upstream_scheduler_wait.observe(0.0, (weight_class,))
+            self._grant(queue)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (future, time.perf_counter())
+        queue.waiters.append(entry)
+        metrics.upstream_scheduler_waiting.inc((weight_class,))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Слот успели выдать, но запрос уже отменен - возвращаем слот
+                self.release(client_id)
+            else:
+                # Запись уже могла забрать _dispatch - тогда он и уменьшил счетчик
+                if entry in queue.waiters:
+                    queue.waiters.remove(entry)
+                    metrics.upstream_scheduler_waiting.dec((weight_class,))
+                self._forget(queue)
+            raise
+
+    def release(self, client_id: int) -> None:
+        queue = self._queues[client_id]
+        queue.active -= 1
+        self._active -= 1
+        metrics.upstream_scheduler_active.dec((queue.weight_class,))
+        self._forget(queue)
+        self._dispatch()
+
+    def _forget(self, queue: _ClientQueue) -> None:
+        # Путь простаивающего клиента все равно подтягивается к текущему при возврате
+        if not queue.active and not queue.waiters and queue.passed <= self._virtual:
+            del self._queues[queue.client_id]
+
+    @asynccontextmanager
+    async def slot(self, client_id: int):
+        await self.acquire(client_id)
+        try:
+            yield
+        finally:
+            self.release(client_id)
+
+    def state(self, client_id: Optional[int] = None) -> list[dict]:
+        """Очереди клиентов с запросами в работе или в ожидании (для эндпоинта администратора)."""
+        now = time.perf_counter()
+        return [
+            {
+                "client_id": queue.client_id,
+                "contract_status": queue.weight_class,
+                "weight": settings.upstream_contract_weights.get(queue.weight_class, 1.0),
+                "limit": queue.limit,
+                "active": queue.active,
+                "waiting": len(queue.waiters),
+                "oldest_wait_seconds": round(now - queue.waiters[0][1], 3) if queue.waiters else 0.0,
+            }
+            for queue in sorted(self._queues.values(), key=lambda q: q.client_id)
+            if client_id is None or queue.client_id == client_id
+        ]
+
+
+scheduler = UpstreamScheduler()
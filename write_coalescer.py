@@ -0,0 +1,243 @@
+# File: write_coalescer.py
+
+import asyncio
+import json
+import logging
+import math
+from typing import Optional
+
+from fastapi import Response
+
+# Импортируем наши собственные модули
+import metrics
+import ozon_quota
+import upstream
+import upstream_scheduler
+from serialization import dumps
+from settings import settings
+
+# =============================================================================
+# ОБЪЕДИНЕНИЕ ЗАПИСЕЙ В OZON (ОСТАТКИ, ЦЕНЫ)
+# Методы обновления остатков и цен принимают до 100 позиций за вызов, а
+# наши системы шлют через прокси по одной. Для методов из
+# settings.proxy_coalesce_methods прокси не пересылает такой запрос сразу:
+# позиции одного клиента, пришедшие за proxy_coalesce_window_ms (или пока
+# не наберется proxy_coalesce_max_items), уходят в Ozon одним вызовом.
+# Каждый ожидающий запрос получает из ответа Ozon только результаты своих
+# позиций (сопоставление по product_id/offer_id и warehouse_id).
+#
+# Лимиты Ozon (ozon_quota.py) учитываются один раз на пачку. Ошибку
+# Ozon для всей пачки (4xx/5xx, обрыв связи) получают все ее запросы.
+# Пачки одного клиента и метода уходят строго по очереди. Позиция, которая
+# уже есть в открытой пачке (тот же товар и склад), закрывает ее: более
+# поздняя запись не должна обогнать раннюю.
+# Пачки собираются в пределах одного воркера.
+# =============================================================================
+
+logger = logging.getLogger("write_coalescer")
+
+# Метод Ozon -> ключ списка позиций в теле запроса и в ответе
+ITEM_KEYS = {
+    "v2/products/stocks": "stocks",
+    "v1/product/import/stocks": "stocks",
+    "v1/product/import/prices": "prices",
+}
+
+
+def items_key(http_method: str, ozon_path: str) -> Optional[str]:
+    """Ключ списка позиций, если запросы этого метода объединяются, иначе None."""
+    if http_method != "POST" or ozon_path not in settings.proxy_coalesce_methods:
+        return None
+    return ITEM_KEYS.get(ozon_path)
+
+
+def batchable_items(body: bytes, key: str) -> Optional[list]:
+    """
+    Позиции запроса, если его можно присоединить к пачке: тело - объект
+    только со списком позиций, позиций не больше размера пачки. Иначе None -
+    запрос пересылается как есть.
+    """
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict) or set(payload) != {key}:
+        return None
+    items = payload[key]
+    if not isinstance(items, list) or not items or len(items) > settings.proxy_coalesce_max_items:
+        return None
+    if not all(isinstance(item, dict) for item in items):
+        return None
+    return items
+
+
+def _item_keys(entry: dict) -> list[tuple]:
+    """Ключи сопоставления позиции запроса и строки ответа Ozon."""
+    warehouse_id = str(entry.get("warehouse_id") or "")
+    keys = []
+    if entry.get("product_id"):
+        keys.append(("product_id", str(entry["product_id"]), warehouse_id))
+    if entry.get("offer_id"):
+        keys.append(("offer_id", str(entry["offer_id"]), warehouse_id))
+    return keys
+
+
+class _Waiter:
+    __slots__ = ("future", "start", "count")
+
+    def __init__(self, future: asyncio.Future, start: int, count: int):
+        self.future = future
+        self.start = start          # позиция первой позиции запроса в пачке
+        self.count = count
+
+
+class _Batch:
+    def __init__(self, client_id: int, method: str, key: str, headers: dict):
+        self.client_id = client_id
+        self.method = method
+        self.key = key
+        self.headers = headers
+        self.items: list = []
+        self.waiters: list[_Waiter] = []
+        self.owners: dict[tuple, int] = {}     # ключ позиции -> номер ожидающего
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    def conflicts(self, items: list) -> bool:
+        return any(item_key in self.owners for item in items for item_key in _item_keys(item))
+
+    def add(self, items: list) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        waiter_index = len(self.waiters)
+        self.waiters.append(_Waiter(future, len(self.items), len(items)))
+        self.items.extend(items)
+        for item in items:
+            for item_key in _item_keys(item):
+                self.owners[item_key] = waiter_index
+        return future
+
+    def split(self, results: list) -> list[list]:
+        """Раскладывает строки ответа Ozon по ожидающим запросам."""
+        parts: list[list] = [[] for _ in self.waiters]
+        positional = len(results) == len(self.items)
+        for position, result in enumerate(results):
+            owner = None
+            if isinstance(result, dict):
+                owner = next((self.owners[k] for k in _item_keys(result) if k in self.owners), None)
+            if owner is None and positional:
+                # Ключей в строке нет: Ozon отвечает в порядке позиций запроса
+                owner = next(i for i, w in enumerate(self.waiters) if w.start <= position < w.start + w.count)
+            if owner is None:
+                logger.warning("Строка ответа %s не сопоставлена ни одной позиции: %s", self.method, result)
+                continue
+            parts[owner].append(result)
+        return parts
+
+
+class WriteCoalescer:
+    def __init__(self):
+        self._open: dict[tuple[int, str], _Batch] = {}
+        # Пачки одного клиента и метода отправляются по очереди (Lock в asyncio честный)
+        self._send_locks: dict[tuple[int, str], asyncio.Lock] = {}
+        self._sending: set[asyncio.Task] = set()
+
+    async def submit(self, client_id: int, method: str, key: str, items: list, headers: dict) -> Response:
+        """Добавляет позиции в пачку клиента и ждет ответа Ozon на нее."""
+        batch_key = (client_id, method)
+        batch = self._open.get(batch_key)
+        if batch is not None and (
+            batch.conflicts(items) or len(batch.items) + len(items) > settings.proxy_coalesce_max_items
+        ):
+            self._flush(batch_key)
+            batch = None
+        if batch is None:
+            batch = _Batch(client_id, method, key, headers)
+            batch.timer = asyncio.get_running_loop().call_later(
+                settings.proxy_coalesce_window_ms / 1000, self._flush, batch_key
+            )
+            self._open[batch_key] = batch
+        future = batch.add(items)
+        if len(batch.items) >= settings.proxy_coalesce_max_items:
+            self._flush(batch_key)
+        return await future
+
+    def _flush(self, batch_key: tuple[int, str]) -> None:
+        batch = self._open.pop(batch_key, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        task = asyncio.create_task(self._send(batch_key, batch))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch_key: tuple[int, str], batch: _Batch) -> None:
+        # Замков столько, сколько пар (клиент, метод): их немного, не удаляем
+        lock = self._send_locks.setdefault(batch_key, asyncio.Lock())
+        try:
+            async with lock:
+                responses = await self._call(batch)
+        except Exception as exc:
+            logger.exception("Ошибка отправки пачки %s клиента %s", batch.method, batch.client_id)
+            responses = [_error(500, f"Ошибка объединенного запроса в Ozon: {exc}") for _ in batch.waiters]
+        for waiter, response in zip(batch.waiters, responses):
+            if not waiter.future.done():
+                waiter.future.set_result(response)
+
+    async def _call(self, batch: _Batch) -> list[Response]:
+        count = len(batch.waiters)
+        # Отдельный объект ответа на каждый ожидающий запрос
+        retry_after = ozon_quota.acquire(batch.client_id, batch.method)
+        if retry_after is not None:
+            detail = f"Превышен лимит запросов в Ozon для клиента (ID: {batch.client_id}) по методу '{batch.method}'"
+            return [_error(429, detail, {"Retry-After": str(math.ceil(retry_after))}) for _ in range(count)]
+
+        import httpx
+
+        headers = {**batch.headers, "Content-Type": "application/json"}
+        async with upstream_scheduler.scheduler.slot(batch.client_id):
+            with metrics.UpstreamTimer(batch.method) as timer:
+                try:
+                    response = await upstream.get_client().post(
+                        f"{upstream.OZON_API_URL}/{batch.method}",
+                        content=dumps({batch.key: batch.items}),
+                        headers=headers,
+                        extensions={"trace": timer.trace},
+                    )
+                except httpx.RequestError as exc:
+                    timer.record("error")
+                    return [_error(502, f"Ошибка соединения с Ozon API: {exc}") for _ in range(count)]
+                timer.record(response.status_code)
+
+        batch_size = {"X-Batch-Items": str(len(batch.items))}
+        results = None
+        if response.status_code < 300:
+            try:
+                results = response.json().get("result")
+            except (ValueError, AttributeError):
+                results = None
+        if not isinstance(results, list):
+            # Ответ не разобрать по позициям: каждый получает его целиком
+            return [
+                Response(content=response.content, status_code=response.status_code,
+                         media_type=response.headers.get("content-type"), headers=batch_size)
+                for _ in range(count)
+            ]
+        return [
+            Response(content=dumps({"result": part}), status_code=response.status_code,
+                     media_type="application/json", headers=batch_size)
+            for part in batch.split(results)
+        ]
+
+    async def close(self) -> None:
+        """Отправляет открытые пачки и дожидается ответов (событие shutdown)."""
+        for batch_key in list(self._open):
+            self._flush(batch_key)
+        await asyncio.gather(*self._sending, return_exceptions=True)
+
+
+def _error(status_code: int, detail: str, headers: Optional[dict] = None) -> Response:
+    return Response(content=dumps({"detail": detail}), status_code=status_code,
+                    media_type="application/json", headers=headers)
+
+
+coalescer = WriteCoalescer()